@@ -0,0 +1,89 @@
+"""
+Async serving mode: the routes of repo_blueprint on Quart, AsyncSession and
+asyncpg, so a request waiting on the database does not hold an OS thread.
+
+    hypercorn async_app:app --bind 0.0.0.0:5001
+"""
+import asyncio
+import logging
+import time
+
+from quart import Quart, g, jsonify, request
+
+from database.async_database import begin_async_unit_of_work, end_async_unit_of_work
+from database.async_repository import async_repo_blueprint
+from database.flight_index import flight_search_index
+from database.handlers import MODEL_MAP
+from database.instrumentation import begin_request_stats, configure_logging, end_request_stats
+from database.metrics import observe_request
+from database.schema import check_schema
+from database.serialization import install_json_provider
+
+configure_logging()
+logger = logging.getLogger(__name__)
+app = Quart(__name__)
+install_json_provider(app)
+app.register_blueprint(async_repo_blueprint)
+
+# Every model call made while handling a request shares one session and one transaction
+@app.before_request
+async def open_unit_of_work():
+    begin_async_unit_of_work()
+
+@app.teardown_request
+async def close_unit_of_work(error=None):
+    # Only reached with an open unit of work when commit_unit_of_work did not run
+    await end_async_unit_of_work(commit=False)
+
+@app.before_request
+async def start_query_stats():
+    g.request_started = time.perf_counter()
+    begin_request_stats()
+
+@app.after_request
+async def record_request_stats(response):
+    # Statements run while building the response; a streamed body is not counted
+    stats = end_request_stats()
+    if stats is not None:
+        response.headers["X-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time"] = f"{stats.seconds * 1000:.3f}"
+    started = g.get("request_started")
+    if started is not None:
+        # Label by route template and known table only, so clients cannot grow the label set
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        table = (request.view_args or {}).get("table")
+        observe_request(
+            request.method, route, table if table in MODEL_MAP else "", response.status_code,
+            time.perf_counter() - started, stats.seconds if stats else 0.0, stats.count if stats else 0,
+        )
+    return response
+
+# Registered after record_request_stats so it runs before it: Quart calls
+# after_request hooks in reverse order, and the metrics should see a failed commit
+@app.after_request
+async def commit_unit_of_work(response):
+    # Commit before the response is sent, so a commit that fails turns into a
+    # 500 instead of a success for a lost write; error responses roll back
+    try:
+        await end_async_unit_of_work(commit=response.status_code < 400)
+    except Exception as e:
+        logger.exception("Commit of %s %s failed", request.method, request.path)
+        response = jsonify({"error": f"The changes could not be saved: {getattr(e, 'orig', None) or e}"})
+        response.status_code = 500
+    return response
+
+# Both run on the sync engine, so in a thread, off the event loop
+@app.before_serving
+async def check_database_schema():
+    # Serving processes never run DDL, migrate.py does; hypercorn async_app:app starts here too
+    await asyncio.to_thread(check_schema)
+
+@app.before_serving
+async def warm_flight_search_index():
+    if flight_search_index.enabled:
+        # Warm the flight search index before the first request
+        await asyncio.to_thread(flight_search_index.load)
+
+# Run the server
+if __name__ == '__main__':
+    app.run(port=5001)
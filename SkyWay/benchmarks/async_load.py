@@ -0,0 +1,198 @@
+"""
+Compare how many concurrent connections the sync and async apps can serve.
+
+Loads --rows flights, starts the sync app (Flask on Werkzeug, a thread per
+connection) and the async app (Quart on Hypercorn) in subprocesses on the same
+database settings, and drives each with --concurrency clients for --seconds
+seconds per level. Every client loops over a flight search that scans the
+table (filter on remaining_tickets, newest departures first) and a lookup by
+id. Reports throughput, median and p99 latency and failed requests per level.
+Rows it creates are deleted at the end.
+
+    python -m benchmarks.async_load --rows 200000 --concurrency 10 50 200 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import cleanup, create_airline, new_tag
+from database.database import engine
+from main import create_db
+from models.flight import Flight
+
+# Both servers accept this many pending connections, Werkzeug's listen queue
+LISTEN_BACKLOG = 128
+SERVERS = {"sync": 5100, "async": 5101}
+# Seconds before a request counts as failed
+REQUEST_TIMEOUT = 60
+
+
+def serve(mode, port):
+    """Run one of the apps in this process, without request logging"""
+    if mode == "sync":
+        from werkzeug.serving import run_simple
+        from main import app
+        run_simple("127.0.0.1", port, app, threaded=True)
+    else:
+        from hypercorn.asyncio import serve as hypercorn_serve
+        from hypercorn.config import Config
+        from async_app import app
+        config = Config()
+        config.bind = [f"127.0.0.1:{port}"]
+        config.backlog = LISTEN_BACKLOG
+        asyncio.run(hypercorn_serve(app, config))
+
+
+def start_server(mode, port):
+    return start_process([sys.executable, "-m", "benchmarks.async_load", "--serve", mode, "--port", str(port)], port)
+
+
+def start_process(command, port):
+    """Start a server in a subprocess and wait until it answers on port"""
+    process = subprocess.Popen(
+        command, env={**os.environ, "DB_ECHO": "0"}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/pool/stats") as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{' '.join(command)} did not start on port {port}")
+
+
+def seed(tag, count):
+    country_id, airline_id = create_airline(tag)
+    start = datetime(2032, 1, 1)
+    Flight.bulk_add([{
+        "airline_company_id": airline_id,
+        "origin_country_id": country_id,
+        "destination_country_id": country_id,
+        "departure_time": start + timedelta(minutes=i),
+        "landing_time": start + timedelta(minutes=i + 180),
+        "remaining_tickets": i % 300,
+    } for i in range(count)], use_copy=True)
+    with engine.connect() as connection:
+        return connection.exec_driver_sql(
+            "SELECT min(id), max(id) FROM flights WHERE airline_company_id = %s", (airline_id,)).one()
+
+
+class HTTPConnection:
+    """
+    A bare HTTP/1.1 keep-alive connection. The load generator shares the CPU
+    with the servers, so it must cost far less per request than they do;
+    general-purpose clients get slower as the number of open connections grows.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        """Send GET path and return the status code, reconnecting when the server closed the connection"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode())
+        try:
+            status = int((await self.reader.readline()).split()[1])
+            headers = {}
+            while (line := await self.reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if "content-length" in headers:
+                await self.reader.readexactly(int(headers["content-length"]))
+            else:
+                await self.reader.read()
+                headers["connection"] = "close"
+        except BaseException:
+            self.close()
+            raise
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def client(port, first_id, last_id, stop_at, latencies, failures):
+    rng = random.Random()
+    connection = HTTPConnection(port)
+    while time.monotonic() < stop_at:
+        if rng.random() < 0.5:
+            path = (f"/flight?remaining_tickets__gte={rng.randrange(300)}"
+                    f"&sort=-departure_time&limit=20&fields=id,departure_time,remaining_tickets")
+        else:
+            path = f"/flight/{rng.randint(first_id, last_id)}"
+        started = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(connection.get(path), REQUEST_TIMEOUT)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, IndexError, ValueError) as e:
+            connection.close()
+            failures.append(type(e).__name__)
+            continue
+        if status != 200:
+            failures.append(status)
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+async def run_level(port, concurrency, seconds, first_id, last_id):
+    latencies, failures = [], []
+    stop_at = time.monotonic() + seconds
+    await asyncio.gather(*(
+        client(port, first_id, last_id, stop_at, latencies, failures) for _ in range(concurrency)
+    ))
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float("nan")
+    return len(latencies) / seconds, percentile(0.5), percentile(0.99), len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--serve", choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve, args.port)
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    tag = new_tag()
+    try:
+        first_id, last_id = seed(tag, args.rows)
+        print(f"{args.rows} flights, {args.seconds:.0f} s per level")
+        print(f"{'app':<6} {'clients':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+        for mode, port in SERVERS.items():
+            process = start_server(mode, port)
+            try:
+                for concurrency in args.concurrency:
+                    throughput, p50, p99, failed = asyncio.run(
+                        run_level(port, concurrency, args.seconds, first_id, last_id))
+                    print(f"{mode:<6} {concurrency:>7} {throughput:>9.0f} {p50:>9.1f} {p99:>9.1f} {failed:>7}")
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        cleanup(tag)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Hammer a single flight with concurrent bookings and check nothing is oversold.
+
+Creates one flight with --seats seats and --customers customers, then lets
+--threads threads call Ticket.book until every customer has tried once.
+Reports bookings/sec and fails if more tickets exist than seats, or if the
+flight's remaining_tickets does not match the tickets that were sold.
+The rows it creates are deleted at the end.
+
+    python -m benchmarks.booking_concurrency --seats 500 --customers 2000 --threads 32
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.fixtures import cleanup, create_airline, create_customers, new_tag
+from database.database import engine
+from main import create_db
+from models.ticket import Ticket
+
+
+def seed(seats, customers):
+    """Create the flight and customers used by the run, returning their ids"""
+    tag = new_tag()
+    country_id, airline_id = create_airline(tag)
+    departure = datetime.now() + timedelta(days=1)
+    with engine.begin() as connection:
+        flight_id = connection.execute(text("""
+            INSERT INTO flights (airline_company_id, origin_country_id, destination_country_id,
+                                 departure_time, landing_time, remaining_tickets)
+            VALUES (:airline_id, :country_id, :country_id, :departure, :landing, :seats) RETURNING id
+        """), {"airline_id": airline_id, "country_id": country_id, "departure": departure,
+               "landing": departure + timedelta(hours=3), "seats": seats}).scalar_one()
+    return tag, flight_id, create_customers(tag, customers)
+
+
+def try_book(flight_id, customer_id):
+    try:
+        Ticket.book(flight_id, customer_id)
+        return True
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seats", type=int, default=500)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    tag, flight_id, customer_ids = seed(args.seats, args.customers)
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(lambda customer_id: try_book(flight_id, customer_id), customer_ids))
+        elapsed = time.perf_counter() - started
+
+        with engine.connect() as connection:
+            sold = connection.execute(text(
+                "SELECT count(*) FROM tickets WHERE flight_id = :id"), {"id": flight_id}).scalar_one()
+            remaining = connection.execute(text(
+                "SELECT remaining_tickets FROM flights WHERE id = :id"), {"id": flight_id}).scalar_one()
+    finally:
+        cleanup(tag)
+
+    booked = sum(results)
+    print(f"threads={args.threads} attempts={len(results)} booked={booked} rejected={len(results) - booked}")
+    print(f"elapsed={elapsed:.3f}s attempts/sec={len(results) / elapsed:.0f} bookings/sec={booked / elapsed:.0f}")
+    print(f"tickets sold={sold} seats={args.seats} remaining_tickets={remaining}")
+
+    oversold = sold > args.seats or sold != booked or remaining != args.seats - sold
+    if oversold:
+        print("FAIL: seat accounting does not match the tickets sold")
+        sys.exit(1)
+    print("OK: no oversell")
+
+
+if __name__ == "__main__":
+    main()
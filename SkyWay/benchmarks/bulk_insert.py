@@ -0,0 +1,100 @@
+"""
+Compare rows/sec of the ORM add_all path with the bulk ingestion modes.
+
+Loads --rows synthetic flights and tickets with Model.add_all, with
+Model.bulk_add (multi-row INSERT) and with Model.bulk_add(use_copy=True),
+deleting the rows between runs. Everything it creates is removed at the end.
+
+    python -m benchmarks.bulk_insert --rows 50000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.fixtures import cleanup, create_airline, create_customers, new_tag
+from database.database import engine
+from main import create_db
+from models.flight import Flight
+from models.ticket import Ticket
+
+# Tickets are spread over this many flights so (flight_id, customer_id) stays unique
+TICKET_FLIGHTS = 100
+
+
+def flight_rows(count, country_id, airline_id):
+    start = datetime(2025, 1, 1)
+    return [{
+        "airline_company_id": airline_id,
+        "origin_country_id": country_id,
+        "destination_country_id": country_id,
+        "departure_time": start + timedelta(minutes=i),
+        "landing_time": start + timedelta(minutes=i + 180),
+        "remaining_tickets": 100,
+    } for i in range(count)]
+
+
+def ticket_rows(count, flight_ids, customer_ids):
+    return [{
+        "flight_id": flight_ids[i % len(flight_ids)],
+        "customer_id": customer_ids[i // len(flight_ids)],
+    } for i in range(count)]
+
+
+def delete_rows(airline_id, flight_ids, keep_flight_ids=()):
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM tickets WHERE flight_id = ANY(:ids)"), {"ids": list(flight_ids)})
+        connection.execute(text("""
+            DELETE FROM flights WHERE airline_company_id = :airline_id AND NOT (id = ANY(:keep))
+        """), {"airline_id": airline_id, "keep": list(keep_flight_ids)})
+
+
+def timed(label, rows, load):
+    started = time.perf_counter()
+    load(rows)
+    elapsed = time.perf_counter() - started
+    rate = len(rows) / elapsed
+    print(f"{label:<28} rows={len(rows):<8} seconds={elapsed:8.3f} rows/sec={rate:10.0f}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    tag = new_tag()
+    country_id, airline_id = create_airline(tag)
+    try:
+        modes = {
+            "add_all": lambda model: model.add_all,
+            "bulk_add (INSERT)": lambda model: lambda rows: model.bulk_add(rows, args.chunk_size),
+            "bulk_add (COPY)": lambda model: lambda rows: model.bulk_add(rows, args.chunk_size, use_copy=True),
+        }
+
+        flights = flight_rows(args.rows, country_id, airline_id)
+        for label, loader in modes.items():
+            timed(f"flights {label}", flights, loader(Flight))
+            delete_rows(airline_id, [])
+
+        ticket_flights = flight_rows(TICKET_FLIGHTS, country_id, airline_id)
+        Flight.bulk_add(ticket_flights)
+        with engine.connect() as connection:
+            flight_ids = connection.execute(text(
+                "SELECT id FROM flights WHERE airline_company_id = :id ORDER BY id"), {"id": airline_id}).scalars().all()
+        customer_ids = create_customers(tag, -(-args.rows // TICKET_FLIGHTS))
+        tickets = ticket_rows(args.rows, flight_ids, customer_ids)
+        for label, loader in modes.items():
+            timed(f"tickets {label}", tickets, loader(Ticket))
+            delete_rows(airline_id, flight_ids, keep_flight_ids=flight_ids)
+    finally:
+        cleanup(tag)
+
+
+if __name__ == "__main__":
+    main()
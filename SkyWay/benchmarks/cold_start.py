@@ -0,0 +1,83 @@
+"""
+Measure worker cold start with DDL on every boot and with the schema fingerprint check.
+
+Starts --workers processes at once, --repeat times per mode. Each imports the
+app, prepares the schema and serves one request through the test client, the
+way a worker of a rolling restart comes up. "ddl" runs create_all, the index
+checks and every CREATE OR REPLACE FUNCTION, as each boot did before
+migrate.py; "check" only compares the stored schema fingerprint. Reports the
+median time of the schema step and of the whole start, per worker and for the
+slowest worker of each batch.
+
+    python -m benchmarks.cold_start --workers 4 --repeat 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ("ddl", "check")
+
+
+def child(mode):
+    started = time.perf_counter()
+    from database.database import engine
+    from database.schema import check_schema, migrate
+    from main import app
+    engine.echo = False
+    schema_started = time.perf_counter()
+    if mode == "ddl":
+        migrate(force=True)
+    else:
+        check_schema()
+    schema_seconds = time.perf_counter() - schema_started
+    assert app.test_client().get("/cache/stats").status_code == 200
+    print(json.dumps({"schema": schema_seconds, "ready": time.perf_counter() - started}))
+
+
+def start_batch(mode, workers):
+    """Start the workers together, returning each one's (schema, ready) seconds and the batch wall time"""
+    started = time.perf_counter()
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.cold_start", "--child", mode],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(workers)
+    ]
+    results = []
+    for process in processes:
+        out, _ = process.communicate()
+        if process.returncode:
+            raise RuntimeError(f"{mode} worker exited with {process.returncode}")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    from database.schema import migrate
+    # Both modes start from a database that already has the schema, as on a restart
+    migrate()
+    print(f"{args.workers} workers started together, median of {args.repeat} batches")
+    print(f"{'mode':<6} {'schema ms':>10} {'ready ms':>10} {'batch ms':>10}")
+    for mode in MODES:
+        schema, ready, batch = [], [], []
+        for _ in range(args.repeat):
+            results, wall = start_batch(mode, args.workers)
+            schema += [r["schema"] for r in results]
+            ready += [r["ready"] for r in results]
+            batch.append(wall)
+        print(f"{mode:<6} {statistics.median(schema) * 1000:>10.1f} {statistics.median(ready) * 1000:>10.1f}"
+              f" {statistics.median(batch) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
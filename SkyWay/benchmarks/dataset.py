@@ -0,0 +1,154 @@
+"""
+Seed a deterministic synthetic dataset for the benchmark suite.
+
+Empties every application table (ids restart at 1) and loads countries,
+airlines, customers, flights and tickets through the models' bulk_add COPY
+path. The same --scale and --seed always produce the same rows with the same
+ids, so results of benchmarks.suite runs on different machines or commits can
+be compared. At --scale 1: 200 countries, 2k airlines, 500k customers, 5M
+flights and 50M tickets.
+
+    python -m benchmarks.dataset --scale 0.01 --reset
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from database.database import Base, engine
+from main import create_db
+from models.airline_company import AirlineCompany
+from models.country import Country
+from models.customer import Customer
+from models.flight import Flight
+from models.ticket import Ticket
+from models.user import User
+from models.user_role import UserRole
+
+# Table sizes at --scale 1; countries do not scale
+SIZES = {"countries": 200, "airlines": 2000, "customers": 500000, "flights": 5000000, "tickets": 50000000}
+ROLES = ["administrator", "airline", "customer"]
+# Departures are spread over one year from this day
+FIRST_DEPARTURE = datetime(2030, 1, 1)
+# Rows generated and loaded per bulk_add call, so the dataset never sits in memory at once
+SEED_BATCH = 200000
+
+
+def dataset_sizes(scale):
+    return {name: count if name == "countries" else max(1, round(count * scale)) for name, count in SIZES.items()}
+
+
+def table_counts():
+    """Row count of every table, read from max(id) since ids are dense after seeding"""
+    with engine.connect() as connection:
+        return {table.name: connection.execute(text(f"SELECT coalesce(max(id), 0) FROM {table.name}")).scalar()
+                for table in Base.metadata.sorted_tables}
+
+
+def load(model, rows):
+    """bulk_add rows in batches of SEED_BATCH; rows may be a generator"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == SEED_BATCH:
+            check(model.bulk_add(batch, use_copy=True))
+            batch = []
+    if batch:
+        check(model.bulk_add(batch, use_copy=True))
+
+
+def check(report):
+    if report["failed"]:
+        raise RuntimeError(f"{report['failed']} {report['table']} rows were rejected: {report['errors'][:3]}")
+
+
+def flight_rows(rng, sizes):
+    for _ in range(sizes["flights"]):
+        origin = rng.randint(1, sizes["countries"])
+        # Any other country, so no flight lands where it took off
+        destination = (origin + rng.randint(1, sizes["countries"] - 1) - 1) % sizes["countries"] + 1
+        departure = FIRST_DEPARTURE + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        yield {
+            "airline_company_id": rng.randint(1, sizes["airlines"]),
+            "origin_country_id": origin,
+            "destination_country_id": destination,
+            "departure_time": departure,
+            "landing_time": departure + timedelta(minutes=rng.randint(45, 14 * 60)),
+            # Seats still for sale; the sold ones are the tickets below
+            "remaining_tickets": rng.randint(0, 200),
+        }
+
+
+def ticket_rows(rng, sizes):
+    # Tickets are spread evenly over the flights, each flight's buyers are
+    # consecutive customers from a random one, so no customer holds two tickets for a flight
+    per_flight, extra = divmod(sizes["tickets"], sizes["flights"])
+    for flight_id in range(1, sizes["flights"] + 1):
+        first = rng.randrange(sizes["customers"])
+        for offset in range(per_flight + (flight_id <= extra)):
+            yield {"flight_id": flight_id, "customer_id": (first + offset) % sizes["customers"] + 1}
+
+
+def seed_dataset(sizes, seed):
+    """Empty the application tables and load the dataset; returns seconds per table"""
+    if sizes["tickets"] > sizes["flights"] * sizes["customers"]:
+        raise ValueError("More tickets than flight and customer pairs")
+    rng = random.Random(seed)
+    tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+    with engine.begin() as connection:
+        connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+    timings = {}
+    def timed(name, model, rows):
+        started = time.perf_counter()
+        load(model, rows)
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    timed("user_roles", UserRole, ({"role_name": role} for role in ROLES))
+    # Users 1..airlines belong to the airlines, the rest to the customers
+    timed("users", User, (
+        {"username": f"{kind}{i}", "password": f"pw-{kind}{i}", "email": f"{kind}{i}@example.com",
+         "user_role": ROLES.index(kind) + 1}
+        for kind, count in (("airline", sizes["airlines"]), ("customer", sizes["customers"]))
+        for i in range(1, count + 1)
+    ))
+    timed("countries", Country, ({"name": f"Country {i}"} for i in range(1, sizes["countries"] + 1)))
+    timed("airline_companies", AirlineCompany, (
+        {"name": f"Airline {i}", "country_id": rng.randint(1, sizes["countries"]), "user_id": i}
+        for i in range(1, sizes["airlines"] + 1)
+    ))
+    timed("customers", Customer, (
+        {"first_name": f"First{i}", "last_name": f"Last{i}", "address": f"{i} Main Street",
+         "phone_no": f"+1555{i:07d}", "credit_card_no": f"4000{i:012d}", "user_id": sizes["airlines"] + i}
+        for i in range(1, sizes["customers"] + 1)
+    ))
+    timed("flights", Flight, flight_rows(rng, sizes))
+    timed("tickets", Ticket, ticket_rows(rng, sizes))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # Fresh statistics, so plans match those of a database that grew to this size
+        connection.execute(text("VACUUM ANALYZE"))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="empty the tables even if they hold data")
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    if any(table_counts().values()) and not args.reset:
+        parser.error("the database already has data, pass --reset to replace it with the dataset")
+    sizes = dataset_sizes(args.scale)
+    print(f"Seeding {sizes} with seed {args.seed}")
+    for table, seconds in seed_dataset(sizes, args.seed).items():
+        print(f"{table:<18} {seconds:>9.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Show the query plans of the flight date searches before and after they were
+rewritten as half-open timestamp ranges.
+
+Seeds a synthetic flights table inside a transaction, runs EXPLAIN ANALYZE on
+the old DATE(column) = :date predicate and on the range predicate, then rolls
+everything back so the database is left untouched.
+
+    python -m benchmarks.explain_flight_search --flights 200000
+"""
+import argparse
+from datetime import date
+
+from sqlalchemy import text
+
+from database.database import engine
+from main import create_db
+
+QUERIES = {
+    "departure date, DATE(departure_time) = :day": """
+        SELECT * FROM flights WHERE DATE(departure_time) = :day
+    """,
+    "departure date, half-open range": """
+        SELECT * FROM flights
+        WHERE departure_time >= CAST(:day AS timestamp)
+        AND departure_time < CAST(:day AS timestamp) + INTERVAL '1 day'
+    """,
+    "search, DATE(departure_time) = :day": """
+        SELECT * FROM flights
+        WHERE origin_country_id = 1 AND destination_country_id = 2
+        AND DATE(departure_time) = :day
+    """,
+    "search, half-open range": """
+        SELECT * FROM flights
+        WHERE origin_country_id = 1 AND destination_country_id = 2
+        AND departure_time >= CAST(:day AS timestamp)
+        AND departure_time < CAST(:day AS timestamp) + INTERVAL '1 day'
+    """,
+}
+
+
+def seed(connection, flights, countries):
+    """Insert synthetic flights one minute apart from 2025-01-01, across 50 airlines"""
+    connection.execute(text("""
+        INSERT INTO countries (name)
+        SELECT 'bench-country-' || g FROM generate_series(1, :countries) g
+    """), {"countries": countries})
+    connection.execute(text("""
+        INSERT INTO user_roles (role_name) VALUES ('bench-airline')
+    """))
+    connection.execute(text("""
+        INSERT INTO users (username, password, email, user_role)
+        SELECT 'bench-airline-' || g, 'x', 'bench-airline-' || g || '@example.com',
+               (SELECT id FROM user_roles WHERE role_name = 'bench-airline')
+        FROM generate_series(1, 50) g
+    """))
+    connection.execute(text("""
+        INSERT INTO airline_companies (name, country_id, user_id)
+        SELECT u.username, (SELECT min(id) FROM countries), u.id
+        FROM users u WHERE u.username LIKE 'bench-airline-%'
+    """))
+    connection.execute(text("""
+        INSERT INTO flights (airline_company_id, origin_country_id, destination_country_id,
+                             departure_time, landing_time, remaining_tickets)
+        SELECT a.ids[1 + g % 50],
+               c.ids[1 + g % :countries],
+               c.ids[1 + (g / :countries) % :countries],
+               TIMESTAMP '2025-01-01' + (g % 525600) * INTERVAL '1 minute',
+               TIMESTAMP '2025-01-01' + (g % 525600 + 180) * INTERVAL '1 minute',
+               100
+        FROM generate_series(1, :flights) g,
+             (SELECT array_agg(id ORDER BY id) ids FROM airline_companies) a,
+             (SELECT array_agg(id ORDER BY id) ids FROM countries WHERE name LIKE 'bench-country-%') c
+    """), {"flights": flights, "countries": countries})
+    connection.execute(text("ANALYZE flights"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--flights", type=int, default=200000)
+    parser.add_argument("--countries", type=int, default=20)
+    parser.add_argument("--day", default=date(2025, 2, 1).isoformat())
+    args = parser.parse_args()
+
+    create_db()
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            seed(connection, args.flights, args.countries)
+            for name, query in QUERIES.items():
+                plan = connection.execute(
+                    text("EXPLAIN (ANALYZE, COSTS OFF, TIMING ON) " + query), {"day": args.day}
+                ).scalars().all()
+                print(f"--- {name}")
+                print("\n".join(plan))
+                print()
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
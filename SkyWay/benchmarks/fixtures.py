@@ -0,0 +1,60 @@
+"""
+Throwaway rows shared by the benchmarks. Everything is named after a random
+tag so a run can remove exactly what it created with cleanup(tag).
+"""
+import uuid
+
+from sqlalchemy import text
+
+from database.database import engine
+
+
+def new_tag():
+    return f"bench-{uuid.uuid4().hex[:8]}"
+
+
+def create_airline(tag):
+    """Create a role, user, country and airline company, returning (country_id, airline_id)"""
+    with engine.begin() as connection:
+        role_id = connection.execute(text(
+            "INSERT INTO user_roles (role_name) VALUES (:tag) RETURNING id"
+        ), {"tag": tag}).scalar_one()
+        user_id = connection.execute(text("""
+            INSERT INTO users (username, password, email, user_role)
+            VALUES (:tag, 'x', :tag || '@example.com', :role_id) RETURNING id
+        """), {"tag": tag, "role_id": role_id}).scalar_one()
+        country_id = connection.execute(text(
+            "INSERT INTO countries (name) VALUES (:tag) RETURNING id"
+        ), {"tag": tag}).scalar_one()
+        airline_id = connection.execute(text("""
+            INSERT INTO airline_companies (name, country_id, user_id)
+            VALUES (:tag, :country_id, :user_id) RETURNING id
+        """), {"tag": tag, "country_id": country_id, "user_id": user_id}).scalar_one()
+    return country_id, airline_id
+
+
+def create_customers(tag, count):
+    """Create count customers and return their ids"""
+    with engine.begin() as connection:
+        return connection.execute(text("""
+            INSERT INTO customers (first_name) SELECT :tag FROM generate_series(1, :count)
+            RETURNING id
+        """), {"tag": tag, "count": count}).scalars().all()
+
+
+def cleanup(tag):
+    """Delete every row created under tag, children first"""
+    with engine.begin() as connection:
+        connection.execute(text("""
+            DELETE FROM tickets WHERE customer_id IN (SELECT id FROM customers WHERE first_name = :tag)
+            OR flight_id IN (SELECT f.id FROM flights f JOIN airline_companies a ON a.id = f.airline_company_id
+                             WHERE a.name = :tag)
+        """), {"tag": tag})
+        connection.execute(text("""
+            DELETE FROM flights WHERE airline_company_id IN (SELECT id FROM airline_companies WHERE name = :tag)
+        """), {"tag": tag})
+        connection.execute(text("DELETE FROM customers WHERE first_name = :tag"), {"tag": tag})
+        connection.execute(text("DELETE FROM airline_companies WHERE name = :tag"), {"tag": tag})
+        connection.execute(text("DELETE FROM countries WHERE name = :tag"), {"tag": tag})
+        connection.execute(text("DELETE FROM users WHERE username = :tag"), {"tag": tag})
+        connection.execute(text("DELETE FROM user_roles WHERE role_name = :tag"), {"tag": tag})
@@ -0,0 +1,96 @@
+"""
+Compare the throughput of GET /flight rendered by Python and by Postgres.
+
+Loads --rows flights with COPY and pages through all of them, --limit rows per
+request, through the Flask test client in three ways: the ORM path (ORM
+instances and to_dict(), served by a route registered only for this run), the
+default read-only path, and ?json_agg=1, where Postgres builds the JSON array.
+Rows it creates are deleted at the end.
+
+    python -m benchmarks.json_agg --rows 1000000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from flask import jsonify, request
+from sqlalchemy import text
+
+from benchmarks.fixtures import cleanup, create_airline, new_tag
+from database.database import engine
+from main import app, create_db
+from models.flight import Flight
+
+# Flights are written in batches so the seed data never sits in memory all at once
+SEED_BATCH = 100000
+
+
+def orm_page():
+    # GET /flight as it was before the read-only and json_agg paths
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+    items = [flight.to_dict() for flight in Flight.get_all(after=after, limit=limit)]
+    return jsonify({"items": items, "next": items[-1]["id"] if len(items) == limit else None})
+
+
+def seed(tag, count):
+    country_id, airline_id = create_airline(tag)
+    start = datetime(2031, 1, 1)
+    for offset in range(0, count, SEED_BATCH):
+        Flight.bulk_add([{
+            "airline_company_id": airline_id,
+            "origin_country_id": country_id,
+            "destination_country_id": country_id,
+            "departure_time": start + timedelta(minutes=i),
+            "landing_time": start + timedelta(minutes=i + 180),
+            "remaining_tickets": 100,
+        } for i in range(offset, min(offset + SEED_BATCH, count))], use_copy=True)
+    with engine.connect() as connection:
+        return connection.execute(text(
+            "SELECT min(id) - 1 FROM flights WHERE airline_company_id = :id"), {"id": airline_id}).scalar_one()
+
+
+def page_through(client, path, extra, after, rows, limit):
+    fetched = 0
+    started = time.perf_counter()
+    while fetched < rows:
+        page_size = min(limit, rows - fetched)
+        response = client.get(f"{path}?after={after}&limit={page_size}{extra}")
+        assert response.status_code == 200, response.data[:200]
+        # Only the trailing cursor is read, so decoding the body on the client side is not timed
+        after = int(response.get_data().rsplit(b'"next":', 1)[1].rstrip(b"}\n "))
+        fetched += page_size
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    app.add_url_rule("/bench/orm/flight", "bench_orm_flight", orm_page)
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    tag = new_tag()
+    client = app.test_client()
+    try:
+        after = seed(tag, args.rows)
+        paths = {
+            "ORM + to_dict": ("/bench/orm/flight", ""),
+            "read-only rows": ("/flight", ""),
+            "json_agg": ("/flight", "&json_agg=1"),
+        }
+        print(f"{args.rows} flights, {args.limit} per page")
+        baseline = None
+        for label, (path, extra) in paths.items():
+            seconds = page_through(client, path, extra, after, args.rows, args.limit)
+            baseline = baseline or seconds
+            print(f"{label:<16} {seconds:>8.2f} s {args.rows / seconds:>10.0f} rows/s {baseline / seconds:>6.1f}x")
+    finally:
+        cleanup(tag)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Check the query plans of the stored procedures and model queries against a baseline.
+
+Runs EXPLAIN (ANALYZE, BUFFERS) on every checked query against the dataset of
+benchmarks.dataset. Model queries are the statements the model methods really
+send, captured while calling them. A plpgsql function is opaque to EXPLAIN, so
+each stored procedure is checked through the query of its RETURN QUERY, read
+from STORED_PROCEDURES and run with parameters of the function's types.
+
+A query fails when it scans a whole large table (a Seq Scan on a table with
+at least --large-table-rows rows) or reads more shared buffers than its
+budget in the baseline. Queries in INDEXED_QUERIES read tables that are small
+in the dataset, where a Seq Scan is the cheapest plan; they are explained
+with enable_seqscan off and fail on any Seq Scan, which means no index can
+serve them. A plan shape that differs from the baseline, or a row estimate
+off by more than --misestimate times, is reported as a warning.
+--record writes the current plans as the new baseline. Budgets are twice the
+recorded buffers (at least MIN_BUFFER_BUDGET) and can be edited by hand.
+Exits with status 1 when a query fails.
+
+    python -m benchmarks.plan_check
+    python -m benchmarks.plan_check --record
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+from benchmarks.dataset import table_counts
+from database.database import STORED_PROCEDURES, engine
+from database.queries import TableQuery
+from main import create_db
+from models.airline_company import AirlineCompany
+from models.customer import Customer
+from models.flight import (Flight, get_by_departure_date, get_by_destination_country, get_by_landing_date,
+                           get_by_origin_country)
+from models.ticket import Ticket
+
+BASELINE = os.path.join(os.path.dirname(__file__), "plan_baseline.json")
+MIN_BUFFER_BUDGET = 100
+BUFFER_SLACK = 2
+# Queries that must be served by an index even though their table is small here
+INDEXED_QUERIES = {"AirlineCompany.get_by_country_id"}
+
+
+def model_queries(counts):
+    """Model calls whose statements are checked, with arguments drawn from the dataset"""
+    flight = Flight.get_by_id(1)
+    day = flight.departure_time.date().isoformat()
+    return {
+        "Flight.get_by_id": lambda: Flight.get_by_id(counts["flights"] // 2),
+        "Flight.get_by_ids": lambda: Flight.get_by_ids(range(1, counts["flights"], counts["flights"] // 200)),
+        "Flight.get_all page": lambda: Flight.get_all(after=counts["flights"] // 2, limit=100, read_only=True),
+        "Ticket.get_all page": lambda: Ticket.get_all(after=counts["tickets"] // 2, limit=100, read_only=True),
+        "flight.get_by_origin_country": lambda: get_by_origin_country(flight.origin_country_id, read_only=True),
+        "flight.get_by_destination_country":
+            lambda: get_by_destination_country(flight.destination_country_id, read_only=True),
+        "flight.get_by_departure_date": lambda: get_by_departure_date(day, read_only=True),
+        "flight.get_by_landing_date": lambda: get_by_landing_date(day, read_only=True),
+        "TableQuery flight route search": lambda: TableQuery(Flight, {
+            "origin_country_id": str(flight.origin_country_id),
+            "destination_country_id": str(flight.destination_country_id),
+            "sort": "departure_time",
+        }).rows(limit=50),
+        "Ticket.get_all_flights_by_customer":
+            lambda: Ticket.get_all_flights_by_customer({"user_id": counts["airline_companies"] + 1}),
+        "AirlineCompany.get_by_country_id": lambda: AirlineCompany.get_by_country_id(1),
+        "Customer.get_id_by_user_id": lambda: Customer.get_id_by_user_id(counts["airline_companies"] + 1),
+    }
+
+
+def procedure_arguments():
+    """Arguments each stored procedure is checked with"""
+    with engine.connect() as connection:
+        flight = connection.execute(text(
+            "SELECT origin_country_id, destination_country_id, departure_time::date AS day FROM flights WHERE id = 1"
+        )).one()
+    return {
+        "get_airline_by_username": {"username_param": "airline1"},
+        "get_customer_by_username": {"username_param": "customer1"},
+        "get_user_by_username": {"username_param": "customer1"},
+        "get_flights_by_parameters": {
+            "origin_country_id_param": flight.origin_country_id,
+            "destination_country_id_param": flight.destination_country_id,
+            "date_param": flight.day,
+        },
+        "get_flights_by_airline_id": {"airline_id_param": 1},
+        "get_arrival_flights": {"country_id_param": flight.destination_country_id},
+        "get_departure_flights": {"country_id_param": flight.origin_country_id},
+    }
+
+
+def procedure_queries():
+    """The RETURN QUERY statement of each stored procedure, with its parameters as typed binds"""
+    queries = {}
+    for source in STORED_PROCEDURES:
+        name, params = re.search(r"FUNCTION\s+(\w+)\s*\((.*?)\)\s*RETURNS", source, re.S).groups()
+        body = re.search(r"RETURN QUERY(.*?);\s*END;", source, re.S).group(1)
+        body = re.sub(r"--[^\n]*", "", body)
+        for param, param_type in re.findall(r"(\w+)\s+(\w+)", params):
+            body = re.sub(rf"\b{param}\b", f"CAST(:{param} AS {param_type})", body)
+        queries[name] = body
+    return queries
+
+
+@contextmanager
+def captured_statements():
+    """Collect the (statement, parameters) of every SELECT sent to the database inside the block"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def explain(connection, statement, parameters, driver_sql):
+    prefix = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+    if driver_sql:
+        result = connection.exec_driver_sql(prefix + statement, parameters)
+    else:
+        result = connection.execute(text(prefix + statement), parameters)
+    return result.scalar()[0]
+
+
+def plan_shape(node):
+    """Node types, tables and indexes of the plan, without costs or row counts"""
+    label = node["Node Type"]
+    target = "/".join(node[key] for key in ("Relation Name", "Index Name") if key in node)
+    if target:
+        label += f" {target}"
+    children = node.get("Plans", [])
+    if children:
+        label += "(" + ", ".join(plan_shape(child) for child in children) + ")"
+    return label
+
+
+def seq_scans(node):
+    if node["Node Type"] == "Seq Scan":
+        yield node["Relation Name"]
+    for child in node.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def summarize(explained):
+    root = explained["Plan"]
+    return {
+        "shape": plan_shape(root),
+        # Shared buffers of the root node include those of every node below it
+        "buffers": root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0),
+        "estimated_rows": root["Plan Rows"],
+        "actual_rows": root["Actual Rows"],
+        "seq_scans": sorted(set(seq_scans(root))),
+        "ms": round(explained["Execution Time"], 3),
+    }
+
+
+def collect_plans(counts):
+    """Explain every checked statement; returns {name: summary}"""
+    plans = {}
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for name, call in model_queries(counts).items():
+                with captured_statements() as statements:
+                    call()
+                # SET LOCAL lasts until the rollback below, so it is switched back explicitly
+                connection.exec_driver_sql(f"SET LOCAL enable_seqscan = {'off' if name in INDEXED_QUERIES else 'on'}")
+                for number, (statement, parameters) in enumerate(statements, 1):
+                    key = name if len(statements) == 1 else f"{name} #{number}"
+                    plans[key] = summarize(explain(connection, statement, parameters, driver_sql=True))
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = on")
+            arguments = procedure_arguments()
+            for name, query in procedure_queries().items():
+                plans[f"procedure {name}"] = summarize(explain(connection, query, arguments[name], driver_sql=False))
+        finally:
+            # EXPLAIN ANALYZE runs the statements; nothing it did is kept
+            transaction.rollback()
+    return plans
+
+
+def large_tables(threshold):
+    with engine.connect() as connection:
+        return set(connection.execute(text(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples >= :rows"), {"rows": threshold}
+        ).scalars())
+
+
+def check(plans, baseline, large, misestimate):
+    """Print a line per query; returns the number of failed queries"""
+    failed = 0
+    for name, plan in plans.items():
+        expected = baseline.get(name)
+        problems, warnings = [], []
+        indexed = name.split(" #")[0] in INDEXED_QUERIES
+        full_scans = [table for table in plan["seq_scans"] if indexed or table in large]
+        if full_scans:
+            problems.append(f"scans all of {', '.join(full_scans)}")
+        if expected is None:
+            warnings.append("not in the baseline")
+        else:
+            if plan["buffers"] > expected["buffer_budget"]:
+                problems.append(f"read {plan['buffers']} buffers, budget {expected['buffer_budget']}")
+            if plan["shape"] != expected["shape"]:
+                warnings.append(f"plan changed, was: {expected['shape']}")
+        estimated, actual = max(plan["estimated_rows"], 1), max(plan["actual_rows"], 1)
+        if max(estimated / actual, actual / estimated) > misestimate:
+            warnings.append(f"estimated {plan['estimated_rows']} rows, got {plan['actual_rows']}")
+        status = "FAIL" if problems else "WARN" if warnings else "ok"
+        failed += bool(problems)
+        print(f"{status:<5}{name:<48}{plan['buffers']:>8} buffers {plan['ms']:>9.2f} ms")
+        for message in problems + warnings:
+            print(f"       {message}")
+        if problems or warnings:
+            print(f"       plan: {plan['shape']}")
+    return failed
+
+
+def record(plans, counts, path):
+    baseline = {
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "table_counts": counts,
+        "queries": {
+            name: {**plan, "buffer_budget": max(MIN_BUFFER_BUDGET, plan["buffers"] * BUFFER_SLACK)}
+            for name, plan in plans.items()
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+    print(f"Recorded {len(plans)} plans in {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--record", action="store_true", help="write the current plans as the baseline")
+    parser.add_argument("--large-table-rows", type=int, default=10000)
+    parser.add_argument("--misestimate", type=float, default=10.0)
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the output
+    engine.echo = False
+    counts = table_counts()
+    if not counts["flights"] or not counts["tickets"]:
+        parser.error("no dataset found, seed one with python -m benchmarks.dataset first")
+    plans = collect_plans(counts)
+    if args.record:
+        return record(plans, counts, args.baseline)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            recorded = json.load(f)
+        baseline = recorded["queries"]
+        if recorded["table_counts"] != counts:
+            print(f"The baseline was recorded on a dataset of another size: {recorded['table_counts']}")
+    failed = check(plans, baseline, large_tables(args.large_table_rows), args.misestimate)
+    print(f"{len(plans)} queries, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Compare CPU time and peak Python memory of the ORM and read-only query paths.
+
+Loads --rows flights on a single day and route, plus one ticket per flight for
+one customer, then runs each lookup returning ORM instances (turned into dicts
+with to_dict(), as the routes did) and with read_only=True (turned into dicts
+with the model serializer). CPU time is the best of --repeat runs; peak memory
+is measured with tracemalloc in a separate run. Everything it creates is removed.
+
+    python -m benchmarks.read_path --rows 10000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+from benchmarks.fixtures import cleanup, create_airline, new_tag
+from database.database import engine, get_session
+from database.serialization import serializer_for
+from main import create_db
+from models.customer import Customer
+from models.flight import Flight, get_by_departure_date, get_by_origin_country
+from models.ticket import Ticket
+
+DAY = datetime(2030, 6, 1)
+
+
+def seed(tag, count):
+    country_id, airline_id = create_airline(tag)
+    Flight.bulk_add([{
+        "airline_company_id": airline_id,
+        "origin_country_id": country_id,
+        "destination_country_id": country_id,
+        "departure_time": DAY + timedelta(seconds=i),
+        "landing_time": DAY + timedelta(seconds=i, hours=3),
+        "remaining_tickets": 100,
+    } for i in range(count)])
+    with engine.begin() as connection:
+        flight_ids = connection.execute(text(
+            "SELECT id FROM flights WHERE airline_company_id = :id ORDER BY id"), {"id": airline_id}).scalars().all()
+        user_id = connection.execute(text("SELECT id FROM users WHERE username = :tag"), {"tag": tag}).scalar_one()
+        customer_id = connection.execute(text(
+            "INSERT INTO customers (first_name, user_id) VALUES (:tag, :user_id) RETURNING id"
+        ), {"tag": tag, "user_id": user_id}).scalar_one()
+    Ticket.bulk_add([{"flight_id": flight_id, "customer_id": customer_id} for flight_id in flight_ids])
+    return country_id, flight_ids[0] - 1, user_id
+
+
+def flights_by_customer_orm(user_id):
+    # Ticket.get_all_flights_by_customer as it was before the read-only path
+    session = get_session()
+    try:
+        customer = session.execute(select(Customer).where(Customer.user_id == user_id)).scalars().first()
+        flights = session.execute(
+            select(Flight).join(Ticket, Flight.id == Ticket.flight_id).where(Ticket.customer_id == customer.id)
+        ).scalars().all()
+        return [flight.to_dict() for flight in flights]
+    finally:
+        session.close()
+
+
+def measure(call, repeat):
+    cpu = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.process_time()
+        items = call()
+        cpu.append(time.process_time() - started)
+    gc.collect()
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(cpu), peak, len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    tag = new_tag()
+    serializer = serializer_for(Flight)
+    try:
+        country_id, after, user_id = seed(tag, args.rows)
+        day = DAY.date().isoformat()
+        lookups = {
+            "Flight.get_all": (
+                lambda: [f.to_dict() for f in Flight.get_all(after=after, limit=args.rows)],
+                lambda: serializer.from_rows(Flight.get_all(after=after, limit=args.rows, read_only=True)),
+            ),
+            "get_by_origin_country": (
+                lambda: [f.to_dict() for f in get_by_origin_country(country_id)],
+                lambda: serializer.from_rows(get_by_origin_country(country_id, read_only=True)),
+            ),
+            "get_by_departure_date": (
+                lambda: [f.to_dict() for f in get_by_departure_date(day)],
+                lambda: serializer.from_rows(get_by_departure_date(day, read_only=True)),
+            ),
+            "Ticket.get_all_flights_by_customer": (
+                lambda: flights_by_customer_orm(user_id),
+                lambda: Ticket.get_all_flights_by_customer({"user_id": user_id}),
+            ),
+        }
+        per = 10000 / args.rows
+        print(f"per 10k rows ({args.rows} rows loaded)")
+        print(f"{'lookup':<36} {'ORM ms':>8} {'rows ms':>8} {'ORM MB':>8} {'rows MB':>8}")
+        for label, (orm, read_only) in lookups.items():
+            orm_cpu, orm_peak, orm_count = measure(orm, args.repeat)
+            rows_cpu, rows_peak, rows_count = measure(read_only, args.repeat)
+            assert orm_count == rows_count == args.rows, (label, orm_count, rows_count)
+            print(f"{label:<36} {orm_cpu * 1000 * per:>8.1f} {rows_cpu * 1000 * per:>8.1f}"
+                  f" {orm_peak / 1e6 * per:>8.1f} {rows_peak / 1e6 * per:>8.1f}")
+    finally:
+        cleanup(tag)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Count connection pool checkouts per HTTP request, with and without the
+request-scoped unit of work.
+
+Drives a few repo_blueprint routes through the Flask test client and counts
+the engine's pool checkout events for each, first with the unit of work hooks
+installed by main.py and then with them removed. Rows it creates are deleted.
+
+    python -m benchmarks.request_checkouts --requests 200
+"""
+import argparse
+from contextlib import contextmanager
+
+from sqlalchemy import event, text
+
+from benchmarks.fixtures import cleanup, create_airline, new_tag
+from database.database import engine
+from main import app, close_unit_of_work, commit_unit_of_work, create_db, open_unit_of_work
+
+
+class CheckoutCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, dbapi_connection, connection_record, connection_proxy):
+        self.count += 1
+
+
+@contextmanager
+def without_unit_of_work():
+    hooks = [(app.before_request_funcs[None], open_unit_of_work),
+             (app.after_request_funcs[None], commit_unit_of_work),
+             (app.teardown_request_funcs[None], close_unit_of_work)]
+    # Put each hook back where it was, since after_request hooks run in order
+    positions = [functions.index(hook) for functions, hook in hooks]
+    for functions, hook in hooks:
+        functions.remove(hook)
+    try:
+        yield
+    finally:
+        for (functions, hook), position in zip(hooks, positions):
+            functions.insert(position, hook)
+
+
+def measure(client, counter, user_id, tag, count):
+    routes = {
+        "GET /user/<id>": lambda: client.get(f"/user/{user_id}"),
+        "PUT /user/update/<id>": lambda: client.put(f"/user/update/{user_id}", json={"email": f"{tag}@example.org"}),
+        "PATCH /user/<id>": lambda: client.patch(f"/user/{user_id}", json={"email": f"{tag}@example.com"}),
+    }
+    results = {}
+    for name, call in routes.items():
+        counter.count = 0
+        for _ in range(count):
+            response = call()
+            assert response.status_code < 400, (name, response.status_code, response.data)
+        results[name] = counter.count / count
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    tag = new_tag()
+    create_airline(tag)
+    with engine.connect() as connection:
+        user_id = connection.execute(text("SELECT id FROM users WHERE username = :tag"), {"tag": tag}).scalar_one()
+    counter = CheckoutCounter()
+    event.listen(engine, "checkout", counter)
+    client = app.test_client()
+    try:
+        with_uow = measure(client, counter, user_id, tag, args.requests)
+        with without_unit_of_work():
+            without_uow = measure(client, counter, user_id, tag, args.requests)
+    finally:
+        event.remove(engine, "checkout", counter)
+        cleanup(tag)
+
+    print(f"{'route':<36} {'per-call sessions':>18} {'unit of work':>14}")
+    for name in with_uow:
+        print(f"{name:<36} {without_uow[name]:>18.2f} {with_uow[name]:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
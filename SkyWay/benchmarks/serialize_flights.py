@@ -0,0 +1,80 @@
+"""
+Compare the time to serialize flights into a JSON response body.
+
+Builds --rows in-memory Flight instances (no database needed) and encodes them
+the way GET /flight did before (to_dict() and Flask's default provider), with
+to_dict() and the orjson provider, and with ModelSerializer from
+ORM instances and from plain column tuples. Each path runs --repeat times and
+the best time is reported.
+
+    python -m benchmarks.serialize_flights --rows 100000
+"""
+import argparse
+import gc
+import time
+from datetime import datetime, timedelta
+
+from flask.json.provider import DefaultJSONProvider
+
+from database.serialization import FastJSONProvider, orjson, serializer_for
+from main import app
+from models.flight import Flight
+
+
+def make_flights(count):
+    start = datetime(2025, 1, 1)
+    return [Flight(
+        id=i + 1,
+        airline_company_id=1 + i % 20,
+        origin_country_id=1 + i % 50,
+        destination_country_id=1 + (i + 7) % 50,
+        departure_time=start + timedelta(minutes=i),
+        landing_time=start + timedelta(minutes=i + 180),
+        remaining_tickets=100,
+    ) for i in range(count)]
+
+
+def best_of(repeat, encode):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        body = encode()
+        times.append(time.perf_counter() - started)
+    return min(times), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    flights = make_flights(args.rows)
+    serializer = serializer_for(Flight)
+    rows = [serializer.values(flight) for flight in flights]
+    flask_json = DefaultJSONProvider(app)
+    fast_json = FastJSONProvider(app)
+
+    paths = {
+        "to_dict + Flask provider": lambda: flask_json.response(
+            {"items": [flight.to_dict() for flight in flights]}).get_data(),
+        "to_dict + fast provider": lambda: fast_json.response(
+            {"items": [flight.to_dict() for flight in flights]}).get_data(),
+        "serializer (instances) + fast": lambda: fast_json.response(
+            {"items": serializer.from_instances(flights)}).get_data(),
+        "serializer (rows) + fast": lambda: fast_json.response(
+            {"items": serializer.from_rows(rows)}).get_data(),
+    }
+
+    print(f"{args.rows} flights, encoder: {'orjson' if orjson else 'stdlib json'}")
+    with app.app_context():
+        baseline = None
+        for label, encode in paths.items():
+            seconds, size = best_of(args.repeat, encode)
+            baseline = baseline or seconds
+            print(f"{label:<32} {seconds * 1000:>9.1f} ms {size / 1e6:>8.1f} MB {baseline / seconds:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare requests/sec of the development server and the gunicorn profile.
+
+Loads --rows flights, then serves the sync app with `flask run` (what
+docker-compose ran: one process, a thread per connection) and with
+`gunicorn -c gunicorn.conf.py` (pre-forked workers with threads, sized from
+the CPU count unless --workers/--threads are given), and drives each with
+--concurrency clients running the flight search and lookup-by-id mix of
+benchmarks.async_load. Rows it creates are deleted at the end.
+
+    python -m benchmarks.serving_modes --concurrency 10 50 200
+"""
+import argparse
+import asyncio
+import sys
+
+from benchmarks.async_load import run_level, seed, start_process
+from benchmarks.fixtures import cleanup, new_tag
+from database.database import engine
+from main import create_db
+
+PORT = 5102
+
+
+def commands(args):
+    gunicorn = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{PORT}"]
+    if args.workers:
+        gunicorn += ["--workers", str(args.workers)]
+    if args.threads:
+        gunicorn += ["--threads", str(args.threads)]
+    return {
+        "flask run": [sys.executable, "-m", "flask", "--app", "main", "run", "--port", str(PORT)],
+        "gunicorn": gunicorn,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, help="gunicorn workers (default: gunicorn.conf.py)")
+    parser.add_argument("--threads", type=int, help="threads per gunicorn worker (default: gunicorn.conf.py)")
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    tag = new_tag()
+    try:
+        first_id, last_id = seed(tag, args.rows)
+        print(f"{args.rows} flights, {args.seconds:.0f} s per level")
+        print(f"{'server':<10} {'clients':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+        for label, command in commands(args).items():
+            process = start_process(command, PORT)
+            try:
+                for concurrency in args.concurrency:
+                    throughput, p50, p99, failed = asyncio.run(
+                        run_level(PORT, concurrency, args.seconds, first_id, last_id))
+                    print(f"{label:<10} {concurrency:>7} {throughput:>9.0f} {p50:>9.1f} {p99:>9.1f} {failed:>7}")
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        cleanup(tag)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Measure latency percentiles and throughput of every route and facade method.
+
+Runs against the dataset of benchmarks.dataset, which must be seeded first.
+Each case is called --warmup times, then --iterations times one after the
+other for the latency percentiles, then --iterations times spread over
+--threads threads for the concurrent throughput. Routes go through the Flask
+test client, so the numbers are the app's own time without HTTP. Write cases
+use rows the suite creates; everything it adds is removed at the end and the
+id sequences are put back, so runs stay repeatable.
+
+Results are written as JSON to --output. --compare prints how a run differs
+from an earlier result file.
+
+    python -m benchmarks.dataset --scale 0.01 --reset
+    python -m benchmarks.suite --output results.json --compare baseline.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import sqlalchemy
+from sqlalchemy import text
+
+from benchmarks.dataset import table_counts
+from business_logic.login_token import LoginToken
+from database.database import Base, engine
+from facades.facades import AnonymousFacade, CustomerFacade
+from main import app, create_db
+from models.customer import Customer
+from models.flight import Flight
+
+NDJSON = {"Accept": "application/x-ndjson"}
+# Facade methods that return whole tables are skipped above this many rows
+MAX_FULL_TABLE_ROWS = 100000
+
+
+class Case:
+    """One measured operation: call(client, i) runs it for the i-th time and says whether it succeeded"""
+
+    def __init__(self, name, kind, call, prepare=None):
+        self.name = name
+        self.kind = kind
+        self.call = call
+        # Run right before the case, for cases that need the rows an earlier case wrote
+        self.prepare = prepare
+
+
+def route(method, path, body=None, headers=None, expect=(200,)):
+    """A call of one route; path and body are functions of i"""
+    def call(client, i):
+        response = client.open(path(i), method=method, json=body(i) if body else None, headers=headers)
+        response.get_data()
+        return response.status_code in expect
+    return call
+
+
+def facade(method):
+    def call(client, i):
+        method(i)
+        return True
+    return call
+
+
+class Workload:
+    """Deterministic parameters for the cases, drawn from the seeded dataset"""
+
+    def __init__(self, counts, calls, seed):
+        self.counts = counts
+        self.calls = calls
+        rng = random.Random(seed)
+        self.flight_ids = [rng.randint(1, counts["flights"]) for _ in range(1000)]
+        self.country_ids = [rng.randint(1, counts["countries"]) for _ in range(1000)]
+        self.airline_ids = [rng.randint(1, counts["airline_companies"]) for _ in range(1000)]
+        self.customer_ids = [rng.randint(1, counts["customers"]) for _ in range(1000)]
+        self.pages = [rng.randint(0, max(0, counts["flights"] - 100)) for _ in range(1000)]
+        with engine.connect() as connection:
+            # Routes and dates that have flights, taken from the sampled flights
+            self.searches = [tuple(row) for row in connection.execute(text("""
+                SELECT origin_country_id, destination_country_id, departure_time::date FROM flights
+                WHERE id = ANY(:ids) ORDER BY id
+            """), {"ids": self.flight_ids[:200]})]
+        self.suite_flights = []
+        self.suite_customers = []
+
+    def pick(self, values, i):
+        return values[i % len(values)]
+
+    def create_rows(self):
+        """Flights and customers the write cases change and book on, one per call"""
+        first_flight = self.counts["flights"] + 1
+        first_customer = self.counts["customers"] + 1
+        departure = datetime(2031, 6, 1)
+        Flight.bulk_add([{
+            "airline_company_id": 1, "origin_country_id": 1, "destination_country_id": 2,
+            "departure_time": departure + timedelta(minutes=i), "landing_time": departure + timedelta(minutes=i + 120),
+            "remaining_tickets": self.calls,
+        } for i in range(self.calls)], use_copy=True)
+        Customer.bulk_add([{"first_name": "Suite", "last_name": f"Customer {i}"} for i in range(self.calls)])
+        self.suite_flights = list(range(first_flight, first_flight + self.calls))
+        self.suite_customers = list(range(first_customer, first_customer + self.calls))
+
+
+def new_ids(table, baseline):
+    """Ids of the rows added to table since the run started, in order"""
+    with engine.connect() as connection:
+        return connection.execute(
+            text(f"SELECT id FROM {table} WHERE id > :max ORDER BY id"), {"max": baseline[table]}).scalars().all()
+
+
+def build_cases(workload, baseline):
+    w = workload
+    counts = w.counts
+    created = {}
+
+    def collect(table):
+        def prepare():
+            created[table] = new_ids(table, baseline)
+        return prepare
+
+    def created_id(table, i):
+        ids = created.get(table) or [0]
+        return ids[i % len(ids)]
+
+    customer = CustomerFacade(LoginToken(id=counts["airline_companies"] + w.customer_ids[0], name="suite", role="customer"))
+    anonymous = AnonymousFacade()
+
+    cases = [
+        Case("GET /cache/stats", "route", route("GET", lambda i: "/cache/stats")),
+        Case("GET /pool/stats", "route", route("GET", lambda i: "/pool/stats")),
+        Case("GET /metrics", "route", route("GET", lambda i: "/metrics")),
+        Case("GET /flight/<id>", "route", route("GET", lambda i: f"/flight/{w.pick(w.flight_ids, i)}")),
+        Case("GET /country/<id>", "route", route("GET", lambda i: f"/country/{w.pick(w.country_ids, i)}")),
+        Case("GET /customer/<id>", "route", route("GET", lambda i: f"/customer/{w.pick(w.customer_ids, i)}")),
+        Case("GET /country", "route", route("GET", lambda i: "/country?limit=1000")),
+        Case("GET /flight page", "route", route("GET", lambda i: f"/flight?after={w.pick(w.pages, i)}&limit=100")),
+        Case("GET /flight page json_agg", "route",
+             route("GET", lambda i: f"/flight?after={w.pick(w.pages, i)}&limit=100&json_agg=1")),
+        Case("GET /flight filtered", "route", route("GET", lambda i: (
+            f"/flight?origin_country_id={w.pick(w.country_ids, i)}&sort=-departure_time&limit=50"
+            f"&fields=id,departure_time,remaining_tickets"))),
+        Case("GET /flight ndjson", "route", route("GET", lambda i: (
+            f"/flight?origin_country_id={w.pick(w.searches, i)[0]}"
+            f"&destination_country_id={w.pick(w.searches, i)[1]}"), headers=NDJSON)),
+        Case("GET /airline_company filtered", "route",
+             route("GET", lambda i: f"/airline_company?country_id={w.pick(w.country_ids, i)}", expect=(200, 404))),
+        # Writes, on rows the suite created; later cases work on the rows earlier ones added
+        Case("POST /country/add", "route",
+             route("POST", lambda i: "/country/add", lambda i: {"name": f"Suite country {i}"}, expect=(201,))),
+        Case("POST /flight/addAll bulk", "route", route("POST", lambda i: "/flight/addAll?mode=bulk", lambda i: [{
+            "airline_company_id": 1, "origin_country_id": 1, "destination_country_id": 2,
+            "departure_time": "2031-07-01T00:00:00", "landing_time": "2031-07-01T02:00:00", "remaining_tickets": 0,
+        }] * 10, expect=(201,))),
+        Case("PATCH /flight/<id>", "route", route(
+            "PATCH", lambda i: f"/flight/{w.pick(w.suite_flights, i)}", lambda i: {"remaining_tickets": w.calls})),
+        Case("PUT /customer/update/<id>", "route", route(
+            "PUT", lambda i: f"/customer/update/{w.pick(w.suite_customers, i)}",
+            lambda i: {"first_name": "Suite", "last_name": f"Customer {i}"})),
+        Case("POST /ticket/add", "route", route("POST", lambda i: "/ticket/add", lambda i: {
+            "flight_id": w.pick(w.suite_flights, i), "customer_id": w.pick(w.suite_customers, i)}, expect=(201,))),
+        Case("DELETE /ticket/<id>", "route",
+             route("DELETE", lambda i: f"/ticket/{created_id('tickets', i)}"), prepare=collect("tickets")),
+
+        Case("AnonymousFacade.get_flight_by_id", "facade",
+             facade(lambda i: anonymous.get_flight_by_id(w.pick(w.flight_ids, i)))),
+        Case("AnonymousFacade.get_flights_by_parameters", "facade",
+             facade(lambda i: anonymous.get_flights_by_parameters(*w.pick(w.searches, i)))),
+        Case("AnonymousFacade.get_all_airlines", "facade", facade(lambda i: anonymous.get_all_airlines())),
+        Case("AnonymousFacade.get_airline_by_id", "facade",
+             facade(lambda i: anonymous.get_airline_by_id(w.pick(w.airline_ids, i)))),
+        Case("AnonymousFacade.get_airline_by_parameters", "facade",
+             facade(lambda i: anonymous.get_airline_by_parameters(country_id=w.pick(w.country_ids, i)))),
+        Case("AnonymousFacade.get_all_countries", "facade", facade(lambda i: anonymous.get_all_countries())),
+        Case("AnonymousFacade.get_country_by_id", "facade",
+             facade(lambda i: anonymous.get_country_by_id(w.pick(w.country_ids, i)))),
+        Case("AnonymousFacade.create_new_user", "facade", facade(lambda i: anonymous.create_new_user({
+            "username": f"suite{i}", "password": "x", "email": f"suite{i}@example.com", "user_role": 3}))),
+        Case("AnonymousFacade.add_customer", "facade",
+             facade(lambda i: anonymous.add_customer({"first_name": "Suite", "last_name": f"Added {i}"}))),
+        Case("CustomerFacade.update_customer", "facade",
+             facade(lambda i: customer.update_customer({"address": f"{w.customer_ids[0]} Main Street"}))),
+        Case("CustomerFacade.get_my_tickets", "facade", facade(lambda i: customer.get_my_tickets())),
+        Case("CustomerFacade.add_ticket", "facade", facade(lambda i: customer.add_ticket(w.pick(w.suite_flights, i)))),
+        Case("CustomerFacade.remove_ticket", "facade",
+             facade(lambda i: customer.remove_ticket(created_id("tickets", i))), prepare=collect("tickets")),
+    ]
+    if counts["flights"] <= MAX_FULL_TABLE_ROWS:
+        cases.insert(cases.index(next(c for c in cases if c.kind == "facade")), Case(
+            "AnonymousFacade.get_all_flights", "facade", facade(lambda i: anonymous.get_all_flights())))
+    return cases
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def measure(case, warmup, iterations, threads, counter):
+    local = threading.local()
+
+    def run():
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        i = next(counter)
+        started = time.perf_counter()
+        try:
+            ok = case.call(client, i)
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    if case.prepare:
+        case.prepare()
+    for _ in range(warmup):
+        run()
+    results = [run() for _ in range(iterations)]
+    latencies = sorted(seconds for seconds, _ in results)
+    errors = sum(not ok for _, ok in results)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        concurrent = list(pool.map(lambda _: run(), range(iterations)))
+    concurrent_seconds = time.perf_counter() - started
+    errors += sum(not ok for _, ok in concurrent)
+
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "name": case.name,
+        "kind": case.kind,
+        "iterations": iterations,
+        "errors": errors,
+        "mean_ms": ms(statistics.fmean(latencies)),
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p90_ms": ms(percentile(latencies, 0.90)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1]),
+        "rps": round(iterations / sum(latencies), 1),
+        f"rps_{threads}_threads": round(iterations / concurrent_seconds, 1),
+    }
+
+
+def restore(baseline):
+    """Delete every row added during the run and put the id sequences back where they were"""
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(text(f"DELETE FROM {table.name} WHERE id > :max"), {"max": baseline[table.name]})
+            connection.execute(text("SELECT setval(pg_get_serial_sequence(:table, 'id'), :max, :called)"),
+                               {"table": table.name, "max": max(baseline[table.name], 1),
+                                "called": baseline[table.name] > 0})
+    # Seats booked by the write cases were only on the suite's own flights, which are gone now
+
+
+def metadata(args, counts):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    with engine.connect() as connection:
+        server = connection.execute(text("SHOW server_version")).scalar()
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "postgres": server,
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "warmup": args.warmup,
+        "iterations": args.iterations,
+        "threads": args.threads,
+        "table_counts": counts,
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+    print(f"\nagainst {baseline_path}")
+    print(f"{'case':<46} {'p50 ms':>9} {'before':>9} {'change':>8} {'rps':>8} {'before':>8}")
+    for result in results:
+        before = baseline.get(result["name"])
+        if before is None:
+            print(f"{result['name']:<46} {result['p50_ms']:>9.2f} {'new':>9}")
+            continue
+        change = (result["p50_ms"] / before["p50_ms"] - 1) * 100 if before["p50_ms"] else 0.0
+        print(f"{result['name']:<46} {result['p50_ms']:>9.2f} {before['p50_ms']:>9.2f} {change:>+7.1f}%"
+              f" {result['rps']:>8.1f} {before['rps']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7, help="seed of the request parameters")
+    parser.add_argument("--only", help="run only the cases whose name contains this")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="an earlier --output file to compare with")
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    baseline = table_counts()
+    counts = {"countries": baseline["countries"], "airline_companies": baseline["airline_companies"],
+              "customers": baseline["customers"], "flights": baseline["flights"]}
+    if not all(counts.values()):
+        parser.error("no dataset found, seed one with python -m benchmarks.dataset first")
+
+    calls = args.warmup + 2 * args.iterations
+    workload = Workload(counts, calls, args.seed)
+    results = []
+    try:
+        workload.create_rows()
+        cases = [case for case in build_cases(workload, baseline) if not args.only or args.only in case.name]
+        counter = itertools.count()
+        print(f"{'case':<46} {'p50 ms':>9} {'p99 ms':>9} {'rps':>8} {f'rps x{args.threads}':>9} {'errors':>6}")
+        for case in cases:
+            result = measure(case, args.warmup, args.iterations, args.threads, counter)
+            results.append(result)
+            print(f"{case.name:<46} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['rps']:>8.1f}"
+                  f" {result[f'rps_{args.threads}_threads']:>9.1f} {result['errors']:>6}")
+    finally:
+        restore(baseline)
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": metadata(args, baseline), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
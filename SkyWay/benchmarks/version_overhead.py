@@ -0,0 +1,91 @@
+"""
+Measure what the version counters add to the write path.
+
+Creates --rows customers and lets --threads threads patch them (each thread
+its own rows, so only the version bookkeeping is shared), first with the
+version listeners of database/versions.py installed and then with them
+removed. Reports writes/sec and latency percentiles for both runs. The rows it
+creates are deleted at the end.
+
+    python -m benchmarks.version_overhead --rows 200 --writes 5000 --threads 16
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from benchmarks.fixtures import cleanup, create_customers, new_tag
+from database import versions
+from database.database import engine
+from main import create_db
+from models.customer import Customer
+
+LISTENERS = [
+    ("after_flush", versions.record_flushed_rows),
+    ("before_commit", versions.bump_changed_versions),
+    ("after_soft_rollback", versions.forget_changed_rows),
+]
+
+
+@contextmanager
+def versions_disabled():
+    for name, listener in LISTENERS:
+        event.remove(Session, name, listener)
+    try:
+        yield
+    finally:
+        for name, listener in LISTENERS:
+            event.listen(Session, name, listener)
+
+
+def run(customer_ids, writes, threads, label):
+    def write(i):
+        started = time.perf_counter()
+        Customer.patch(customer_ids[i % len(customer_ids)], {"last_name": f"{label}-{i}"})
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(write, range(writes)))
+    elapsed = time.perf_counter() - started
+    return {
+        "writes_per_sec": writes / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    create_db()
+    # Statement logging would dominate the measurement
+    engine.echo = False
+    tag = new_tag()
+    customer_ids = create_customers(tag, args.rows)
+    try:
+        # Warm the pool and the statement caches before timing anything
+        run(customer_ids, args.threads * 4, args.threads, "warmup")
+        with versions_disabled():
+            without = run(customer_ids, args.writes, args.threads, "plain")
+        with_versions = run(customer_ids, args.writes, args.threads, "versions")
+    finally:
+        cleanup(tag)
+
+    print(f"threads={args.threads} rows={args.rows} writes={args.writes}")
+    print(f"{'':<18} {'writes/sec':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, result in (("without versions", without), ("with versions", with_versions)):
+        print(f"{label:<18} {result['writes_per_sec']:>10.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+    print(f"overhead: {(1 - with_versions['writes_per_sec'] / without['writes_per_sec']) * 100:.1f}% fewer writes/sec")
+
+
+if __name__ == "__main__":
+    main()
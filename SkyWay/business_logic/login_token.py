@@ -1,4 +1,15 @@
+from typing import Optional
+
+from sqlalchemy import text
+
+from database.database import SessionLocal
+
 class LoginToken:
+    def __init__(self, id: int, name: str, role: str):
+        self.id = id
+        self.name = name
+        self.role = role
+
     @staticmethod
     def create_login_token(username: str, password: str) -> Optional['LoginToken']:
         """
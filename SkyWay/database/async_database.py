@@ -0,0 +1,118 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database.database import (DATABASE_URL, DB_ECHO, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE,
+                               DB_POOL_SIZE, DB_POOL_TIMEOUT, STREAM_BATCH_SIZE)
+from database.instrumentation import instrument
+from database.pool import TimedAsyncQueuePool
+
+
+def async_url(url):
+    """The same database URL with the asyncpg driver"""
+    scheme, _, rest = url.partition("://")
+    return f"{scheme.split('+')[0]}+asyncpg://{rest}"
+
+
+# Engine of the async app (async_app.py), sized by the same DB_POOL_* settings
+async_engine = create_async_engine(
+    async_url(DATABASE_URL),
+    echo=DB_ECHO,
+    poolclass=TimedAsyncQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+# Cursor events fire on the sync facade of the async engine
+instrument(async_engine.sync_engine)
+
+# Objects stay readable after commit, since nothing can lazy-load them later
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def async_pool_stats():
+    return async_engine.pool.stats()
+
+
+class AsyncUnitOfWork:
+    """
+    One AsyncSession and transaction for an HTTP request of the async app,
+    committed (or rolled back) once the response is built, before it is sent.
+    Callbacks registered with after_commit run only once the commit succeeded.
+    """
+
+    def __init__(self):
+        self.session = AsyncSessionLocal()
+        self._callbacks = []
+
+    def after_commit(self, callback):
+        self._callbacks.append(callback)
+
+    async def finish(self, commit=True):
+        """Commit the request's transaction, or roll it back; a failed commit raises"""
+        try:
+            if commit:
+                await self.session.commit()
+            else:
+                await self.session.rollback()
+        finally:
+            await self.session.close()
+        if commit:
+            for callback in self._callbacks:
+                callback()
+
+
+# Unit of work of the request being handled, set by async_app.py
+_async_unit_of_work = ContextVar("async_unit_of_work", default=None)
+
+
+def begin_async_unit_of_work():
+    unit_of_work = AsyncUnitOfWork()
+    _async_unit_of_work.set(unit_of_work)
+    return unit_of_work
+
+
+async def end_async_unit_of_work(commit=True):
+    unit_of_work = _async_unit_of_work.get()
+    if unit_of_work is not None:
+        _async_unit_of_work.set(None)
+        await unit_of_work.finish(commit)
+
+
+@asynccontextmanager
+async def async_session_scope():
+    """
+    The request's session if a unit of work is active; otherwise a session of
+    its own, committed when the block exits cleanly and rolled back otherwise.
+    """
+    unit_of_work = _async_unit_of_work.get()
+    if unit_of_work is not None:
+        yield unit_of_work.session
+        return
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+
+
+def async_after_commit(callback):
+    """Run callback once the current async unit of work commits, or now if there is none"""
+    unit_of_work = _async_unit_of_work.get()
+    if unit_of_work is None:
+        callback()
+    else:
+        unit_of_work.after_commit(callback)
+
+
+async def async_stream_query(stmt, batch_size=STREAM_BATCH_SIZE):
+    """Yield the rows selected by stmt through a server-side cursor, in a session of its own"""
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt, execution_options={"yield_per": batch_size})
+        async for row in result:
+            yield row
@@ -0,0 +1,189 @@
+from quart import Blueprint, Response, jsonify, request
+from sqlalchemy.exc import IntegrityError
+
+from database.async_database import async_pool_stats, async_session_scope, async_stream_query
+from database.cache import cache_stats
+from database.handlers import (NDJSON_MIMETYPE, ApiError, batch_body, batch_ids, bulk_request, bulk_status,
+                               delete_filters, deleted_report, flight_search_request, is_fresh, item_body,
+                               item_dict, json_agg_body, model_for, ndjson_line, not_modified, page_body,
+                               page_request, require_body, saved_message, still_referenced, sync_cached_table,
+                               tagged)
+from database.metrics import PROMETHEUS_MIMETYPE, render_metrics
+from database.queries import json_page_select
+from database.serialization import serializer_for
+from database.versions import ROW_VERSION, TABLE_VERSION, to_row_version, to_table_version
+from facades.async_facades import AsyncAnonymousFacade
+from models.async_models import ASYNC_MODELS
+
+# The routes of repo_blueprint, served by the async app on AsyncSession
+async_repo_blueprint = Blueprint('async_repo_blueprint', __name__)
+
+
+def async_model(table):
+    return ASYNC_MODELS[model_for(table)]
+
+@async_repo_blueprint.errorhandler(ApiError)
+async def api_error(error):
+    return jsonify({"error": error.message}), error.status
+
+@async_repo_blueprint.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Hit/miss counters of the in-process reference-data caches"""
+    return jsonify(cache_stats())
+
+@async_repo_blueprint.route('/pool/stats', methods=['GET'])
+async def get_pool_stats():
+    """Connection pool usage of the async engine"""
+    return jsonify(async_pool_stats())
+
+@async_repo_blueprint.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Request, database, cache and pool metrics for Prometheus to scrape"""
+    return Response(render_metrics(async_pool_stats()), mimetype=PROMETHEUS_MIMETYPE)
+
+@async_repo_blueprint.route('/flight/search', methods=['GET'])
+async def search_flights():
+    """Flights of one route on one day, as the JSON array text built by Postgres"""
+    body = await AsyncAnonymousFacade().get_flights_by_parameters(*flight_search_request(request.args), as_json=True)
+    return Response(body, mimetype='application/json')
+
+@async_repo_blueprint.route('/<string:table>/<int:item_id>', methods=['GET'])
+async def get_by_id(table, item_id):
+    model = async_model(table)
+    version = await current_version(table, model, item_id)
+    if is_fresh(request, version):
+        return not_modified(Response, version)
+    item = await model.get_by_id(item_id)
+    return tagged(jsonify(item_body(model.model, table, item_id, item)), version)
+
+@async_repo_blueprint.route('/<string:table>/batch', methods=['GET', 'POST'])
+async def get_batch(table):
+    """Many rows by id in one query: GET ?ids=3,1,2 or POST {"ids": [3, 1, 2]}"""
+    model = async_model(table)
+    ids = batch_ids(await request.get_json(silent=True) if request.method == 'POST' else request.args.get('ids'))
+    items, missing = await model.get_by_ids(ids, read_only=True)
+    return jsonify(batch_body(model.model, items, missing))
+
+@async_repo_blueprint.route('/<string:table>', methods=['GET'])
+async def get_all(table):
+    model = async_model(table)
+    page = page_request(model.model, request)
+    version = await current_version(table, model)
+    if is_fresh(request, version):
+        return not_modified(Response, version)
+    return tagged(await read_table(model, table, page), version)
+
+async def read_table(model, table, page):
+    """The body of GET /<table>, once the client's copy is known to be stale"""
+    if page.ndjson:
+        return stream_ndjson(model, page)
+    if page.json_agg:
+        async with async_session_scope() as session:
+            result = (await session.execute(json_page_select(page.query, page.after, page.limit))).one()
+        return Response(json_agg_body(table, page, *result), mimetype='application/json')
+    if page.query.is_plain():
+        # Plain column rows: the page is only serialized, so ORM instances would be wasted work
+        rows = await model.get_all(after=page.after, limit=page.limit, read_only=True)
+    else:
+        async with async_session_scope() as session:
+            rows = (await session.execute(page.query.select(page.after, page.limit))).all()
+    return jsonify(page_body(model.model, table, page, rows))
+
+async def current_version(table, model, item_id=None):
+    """Version of one row, or of the whole table, for the ETag; read before the rows"""
+    table_name = model.table.name
+    async with async_session_scope() as session:
+        if item_id is None:
+            row = (await session.execute(TABLE_VERSION, {"table_name": table_name})).first()
+            version = to_table_version(table_name, row)
+        else:
+            row = (await session.execute(ROW_VERSION, {"table_name": table_name, "row_id": item_id})).one()
+            version = to_row_version(table_name, item_id, row)
+    sync_cached_table(table, version)
+    return version
+
+def stream_ndjson(model, page):
+    """Stream every row matching the query as newline-delimited JSON, as it is fetched"""
+    serializer = serializer_for(model.model, page.query.fields)
+    async def generate():
+        async for row in async_stream_query(page.query.select(page.after)):
+            yield ndjson_line(serializer, row)
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+@async_repo_blueprint.route('/<string:table>/add', methods=['POST'])
+async def add(table):
+    model = async_model(table)
+    body = require_body(await request.get_json(), table, "add to")
+    try:
+        await model.add(body)
+    except Exception as e:
+        return f"{e}", 400
+    return saved_message(body, "added"), 201
+
+@async_repo_blueprint.route('/<string:table>/addAll', methods=['POST'])
+async def add_all(table):
+    model = async_model(table)
+    body = require_body(await request.get_json(), table, "add to")
+    bulk = bulk_request(request.args, body)
+    if bulk:
+        report = await model.bulk_add(body, chunk_size=bulk.chunk_size, use_copy=bulk.use_copy)
+        return jsonify(report), bulk_status(report)
+    try:
+        await model.add_all(body)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return saved_message(body, "added"), 201
+
+@async_repo_blueprint.route('/<string:table>/update/<int:item_id>', methods=['PUT'])
+async def update(table, item_id):
+    model = async_model(table)
+    body = require_body(await request.get_json(), table, "update to")
+    try:
+        updated = await model.update(item_id, body)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    if not updated:
+        raise ApiError(404, "Item not found")
+    return saved_message(body, "updated"), 200
+
+@async_repo_blueprint.route('/<string:table>/<int:item_id>', methods=['PATCH'])
+async def patch(table, item_id):
+    model = async_model(table)
+    body = require_body(await request.get_json(), table, "update to")
+    try:
+        # Only the columns present in the body are written
+        item = await model.patch(item_id, body)
+    except Exception as e:
+        raise ApiError(400, f"{e}")
+    return jsonify(item_dict(item))
+
+@async_repo_blueprint.route('/<string:table>/<int:item_id>', methods=['DELETE'])
+async def remove(table, item_id):
+    model = async_model(table)
+    return jsonify(item_dict(await model.remove(item_id)))
+
+@async_repo_blueprint.route('/<string:table>/batch', methods=['DELETE'])
+async def remove_batch(table):
+    """Many rows by id in one DELETE ... RETURNING id: ?ids=3,1,2 or a {"ids": [3, 1, 2]} body"""
+    model = async_model(table)
+    ids = batch_ids(await request.get_json(silent=True) or request.args.get('ids'))
+    try:
+        deleted = await model.remove_by_ids(ids)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    except IntegrityError as e:
+        raise still_referenced(e)
+    return jsonify(deleted_report(deleted, ids))
+
+@async_repo_blueprint.route('/<string:table>', methods=['DELETE'])
+async def remove_where(table):
+    """Every row matching the filters of GET /<table> in one DELETE ... RETURNING id"""
+    model = async_model(table)
+    where = delete_filters(model.model, table, request.args)
+    try:
+        deleted = await model.remove_where(*where)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    except IntegrityError as e:
+        raise still_referenced(e)
+    return jsonify(deleted_report(deleted))
@@ -0,0 +1,138 @@
+import io
+import time
+
+from sqlalchemy.exc import DBAPIError
+
+from database.database import engine
+from database.versions import bump_bulk_version
+
+# Rows written and committed per chunk; a failing row only affects its own chunk
+BULK_CHUNK_SIZE = 5000
+
+
+def validate_rows(table, rows, errors):
+    """
+    Check every row against the table's columns before touching the database.
+    Returns the (index, row) pairs that passed; the others are added to errors.
+    """
+    columns = {column.name for column in table.columns}
+    required = {
+        column.name for column in table.columns
+        if not column.nullable and column.server_default is None and not column.primary_key
+    }
+    valid = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({"index": index, "error": "Row must be a JSON object"})
+            continue
+        unknown = set(row) - columns
+        if unknown:
+            errors.append({"index": index, "error": f"Unknown columns: {', '.join(sorted(unknown))}"})
+            continue
+        missing = [name for name in sorted(required) if row.get(name) is None]
+        if missing:
+            errors.append({"index": index, "error": f"Missing required columns: {', '.join(missing)}"})
+            continue
+        valid.append((index, row))
+    return valid
+
+
+def insert_rows(connection, table, columns, indexed_rows, errors):
+    """
+    Insert the rows with one multi-row INSERT inside a savepoint. When the
+    database rejects the batch it is split in half until the bad rows are
+    isolated, so only those rows are reported and skipped.
+    """
+    savepoint = connection.begin_nested()
+    try:
+        connection.execute(table.insert(), [
+            {name: row.get(name) for name in columns} for _, row in indexed_rows
+        ])
+        savepoint.commit()
+        return len(indexed_rows)
+    except DBAPIError as e:
+        savepoint.rollback()
+        if len(indexed_rows) == 1:
+            errors.append({"index": indexed_rows[0][0], "error": str(e.orig).strip()})
+            return 0
+        middle = len(indexed_rows) // 2
+        return (insert_rows(connection, table, columns, indexed_rows[:middle], errors)
+                + insert_rows(connection, table, columns, indexed_rows[middle:], errors))
+
+
+def copy_value(value):
+    """Encode one value for COPY ... FROM STDIN in Postgres text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, str):
+        # Only free text can carry the characters COPY treats as delimiters
+        return (value.replace("\\", "\\\\").replace("\t", "\\t")
+                .replace("\n", "\\n").replace("\r", "\\r"))
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def copy_rows(connection, table, columns, indexed_rows):
+    """Stream the rows with COPY FROM STDIN inside a savepoint; False if Postgres rejected them"""
+    buffer = io.StringIO()
+    for _, row in indexed_rows:
+        buffer.write("\t".join(copy_value(row.get(name)) for name in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    savepoint = connection.begin_nested()
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        column_list = ", ".join(f'"{name}"' for name in columns)
+        cursor.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN', buffer)
+        savepoint.commit()
+        return True
+    except Exception:
+        savepoint.rollback()
+        return False
+    finally:
+        cursor.close()
+
+
+def bulk_insert(model, rows, chunk_size=BULK_CHUNK_SIZE, use_copy=False):
+    """
+    Insert a large list of dicts into the model's table without building ORM
+    objects. Rows are written chunk_size at a time, each chunk in its own
+    transaction, with multi-row INSERTs or, when use_copy is set, COPY FROM STDIN.
+    A chunk COPY cannot load is retried with INSERTs to find the bad rows.
+
+    Returns a report with the number of rows inserted and, for every row that
+    was skipped, its position in the input and the reason.
+    """
+    table = model.__table__
+    started = time.perf_counter()
+    errors = []
+    valid = validate_rows(table, rows, errors)
+    # Rows may leave out optional columns, so every chunk uses the union of keys
+    columns = [column.name for column in table.columns if any(column.name in row for _, row in valid)]
+    use_copy = use_copy and engine.dialect.driver == "psycopg2"
+
+    inserted = 0
+    with engine.connect() as connection:
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            with connection.begin():
+                before = inserted
+                if use_copy and copy_rows(connection, table, columns, chunk):
+                    inserted += len(chunk)
+                else:
+                    inserted += insert_rows(connection, table, columns, chunk, errors)
+                if inserted > before:
+                    bump_bulk_version(connection, table.name)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "table": table.name,
+        "received": len(rows),
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": sorted(errors, key=lambda error: error["index"]),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(inserted / elapsed) if elapsed else None,
+    }
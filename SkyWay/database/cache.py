@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Every cache registers itself here so its counters can be reported in one place
+CACHES = {}
+
+# Defaults can be tuned per deployment without touching the code
+DEFAULT_CACHE_TTL = float(os.environ.get("REFERENCE_CACHE_TTL", "300"))
+DEFAULT_CACHE_SIZE = int(os.environ.get("REFERENCE_CACHE_SIZE", "1024"))
+
+
+class ReferenceCache:
+    """
+    In-process read-through cache for reference tables that rarely change.
+    Entries expire after ttl seconds, the least recently used entry is evicted
+    once max_size is reached, and the owning model clears it on every write.
+    """
+
+    def __init__(self, name, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by invalidate() so a load that raced with a write is not stored
+        self._generation = 0
+        # Version counter of the table the entries were loaded at, see sync_version()
+        self._table_version = None
+        CACHES[name] = self
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, calling loader() to fetch it from the
+        database on a miss or after the entry has expired.
+        """
+        found, value, generation = self._lookup(key)
+        if found:
+            return value
+        value = loader()
+        self._store(key, value, generation)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """get_or_load for the async app, where loader() returns an awaitable"""
+        found, value, generation = self._lookup(key)
+        if found:
+            return value
+        value = await loader()
+        self._store(key, value, generation)
+        return value
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1], None
+            self.misses += 1
+            return False, None, self._generation
+
+    def _store(self, key, value, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every entry, called after the underlying table was written to"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def sync_version(self, table_version):
+        """
+        Drop every entry if the table's version counter (database/versions.py)
+        moved since the last call: another worker process wrote to it, and
+        only the writing process invalidates its cache on commit.
+        """
+        with self._lock:
+            changed = table_version != self._table_version
+            self._table_version = table_version
+        if changed:
+            self.invalidate()
+
+    def stats(self):
+        """Hit/miss counters for this cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+def cache_stats():
+    """Counters for every registered cache, keyed by cache name"""
+    return {name: cache.stats() for name, cache in CACHES.items()}
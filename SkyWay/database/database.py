@@ -1,168 +1,309 @@
-from sqlalchemy import create_engine
+import os
+from contextvars import ContextVar
+
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+from database.instrumentation import instrument
+from database.pool import TimedQueuePool
+
+def env_flag(name, default):
+    return os.environ.get(name, "1" if default else "0").lower() in ("1", "true", "yes")
+
 # Define the database URL
-DATABASE_URL = "postgresql://postgres:postgres@db:5432/skyway"  # Update with your credentials
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://postgres:postgres@db:5432/skyway")
+# Pool sizing, size it for the number of threads per worker process
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", False)
+# Logging every statement to stdout is slow, keep it for local debugging
+DB_ECHO = env_flag("DB_ECHO", False)
+
 # Create the SQLAlchemy engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(
+    DATABASE_URL,
+    echo=DB_ECHO,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+# Per-statement timing, slow-query log and per-request query counts
+instrument(engine)
+
+def pool_stats():
+    """Checked-out and idle connections, overflow and checkout wait times of the engine's pool"""
+    return engine.pool.stats()
 
 # Session local is used for getting a session to interact with the database
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Base class to define the structure of the models (tables)
 Base = declarative_base()
 
-def create_stored_procedures():
-    """Create all stored procedures for the flight system"""
-    procedures = [
-        """
-        CREATE OR REPLACE FUNCTION get_airline_by_username(username_param TEXT)
-        RETURNS TABLE (
-            airline_id BIGINT,
-            airline_name VARCHAR,
-            user_id BIGINT,
-            username VARCHAR,
-            email VARCHAR
-        ) AS $$
-        BEGIN
-            RETURN QUERY
-            SELECT a.*, u.username, u.email FROM airlines a
-            INNER JOIN users u ON a.user_id = u.id
-            WHERE u.username = username_param;
-        END;
-        $$ LANGUAGE plpgsql;
-        """,
-        
-        """
-        CREATE OR REPLACE FUNCTION get_customer_by_username(username_param TEXT)
-        RETURNS TABLE (
-            customer_id BIGINT,
-            first_name VARCHAR,
-            last_name VARCHAR,
-            user_id BIGINT,
-            username VARCHAR,
-            email VARCHAR
-        ) AS $$
-        BEGIN
-            RETURN QUERY
-            SELECT c.*, u.username, u.email FROM customers c
-            INNER JOIN users u ON c.user_id = u.id
-            WHERE u.username = username_param;
-        END;
-        $$ LANGUAGE plpgsql;
-        """,
-        
-        """
-        CREATE OR REPLACE FUNCTION get_user_by_username(username_param TEXT)
-        RETURNS TABLE (
-            id BIGINT,
-            username VARCHAR,
-            email VARCHAR
-        ) AS $$
-        BEGIN
-            RETURN QUERY
-            SELECT * FROM users WHERE username = username_param;
-        END;
-        $$ LANGUAGE plpgsql;
-        """,
-        
-        """
-        CREATE OR REPLACE FUNCTION get_flights_by_parameters(
-            origin_country_id_param INT,
-            destination_country_id_param INT,
-            date_param DATE
-        )
-        RETURNS TABLE (
-            flight_id BIGINT,
-            airline_id BIGINT,
-            origin_country_id INT,
-            destination_country_id INT,
-            departure_time TIMESTAMP,
-            arrival_time TIMESTAMP,
-            remaining_tickets INT
-        ) AS $$
-        BEGIN
-            RETURN QUERY
-            SELECT * FROM flights
-            WHERE origin_country_id = origin_country_id_param
-            AND destination_country_id = destination_country_id_param
-            AND DATE(departure_time) = date_param;
-        END;
-        $$ LANGUAGE plpgsql;
-        """,
-        
-        """
-        CREATE OR REPLACE FUNCTION get_flights_by_airline_id(airline_id_param BIGINT)
-        RETURNS TABLE (
-            flight_id BIGINT,
-            airline_id BIGINT,
-            origin_country_id INT,
-            destination_country_id INT,
-            departure_time TIMESTAMP,
-            arrival_time TIMESTAMP,
-            remaining_tickets INT
-        ) AS $$
-        BEGIN
-            RETURN QUERY
-            SELECT * FROM flights WHERE airline_id = airline_id_param;
-        END;
-        $$ LANGUAGE plpgsql;
-        """,
-        
-        """
-        CREATE OR REPLACE FUNCTION get_arrival_flights(country_id_param INT)
-        RETURNS TABLE (
-            flight_id BIGINT,
-            airline_id BIGINT,
-            origin_country_id INT,
-            destination_country_id INT,
-            departure_time TIMESTAMP,
-            arrival_time TIMESTAMP,
-            remaining_tickets INT
-        ) AS $$
-        BEGIN
-            RETURN QUERY
-            SELECT * FROM flights
-            WHERE destination_country_id = country_id_param
-            AND arrival_time BETWEEN NOW() AND NOW() + INTERVAL '12 hours';
-        END;
-        $$ LANGUAGE plpgsql;
-        """,
-        
-        """
-        CREATE OR REPLACE FUNCTION get_departure_flights(country_id_param INT)
-        RETURNS TABLE (
-            flight_id BIGINT,
-            airline_id BIGINT,
-            origin_country_id INT,
-            destination_country_id INT,
-            departure_time TIMESTAMP,
-            arrival_time TIMESTAMP,
-            remaining_tickets INT
-        ) AS $$
-        BEGIN
-            RETURN QUERY
-            SELECT * FROM flights
-            WHERE origin_country_id = country_id_param
-            AND departure_time BETWEEN NOW() AND NOW() + INTERVAL '12 hours';
-        END;
-        $$ LANGUAGE plpgsql;
-        """
-    ]
+# The unit of work of the HTTP request being handled, set by main.py around each request
+_unit_of_work = ContextVar("unit_of_work", default=None)
+
+class UnitOfWork:
+    """
+    One session, one connection and one transaction shared by everything that
+    runs during an HTTP request. Model methods keep calling commit(), rollback()
+    and close() as if they owned the session: commit() only flushes, close()
+    does nothing, and the real commit or rollback happens in finish() once the
+    response is built, before it is sent. The session is opened on first use,
+    so requests that never touch the database never check out a connection.
+    """
+
+    def __init__(self):
+        self._session = None
+        self._after_commit = []
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = SessionLocal()
+        return self._session
+
+    def commit(self):
+        self.session.flush()
+
+    def rollback(self):
+        # A failed flush leaves the session unusable, so the transaction is
+        # rolled back right away together with the work queued behind it
+        self.session.rollback()
+        self._after_commit.clear()
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def after_commit(self, callback):
+        self._after_commit.append(callback)
+
+    def finish(self, commit=True):
+        """Commit the request's transaction, or roll it back; a failed commit raises"""
+        if self._session is None:
+            return
+        callbacks, self._after_commit = self._after_commit, []
+        try:
+            if commit:
+                self._session.commit()
+            else:
+                self._session.rollback()
+        finally:
+            self._session.close()
+            self._session = None
+        if commit:
+            for callback in callbacks:
+                callback()
+
+def begin_unit_of_work():
+    _unit_of_work.set(UnitOfWork())
 
+def end_unit_of_work(commit=True):
+    unit_of_work = _unit_of_work.get()
+    _unit_of_work.set(None)
+    if unit_of_work is not None:
+        unit_of_work.finish(commit)
+
+def get_session():
+    """The current request's shared session when there is one, otherwise a new session"""
+    unit_of_work = _unit_of_work.get()
+    return unit_of_work if unit_of_work is not None else SessionLocal()
+
+def after_commit(callback):
+    """
+    Run callback once the data it depends on is committed: at the end of the
+    request inside a unit of work, immediately otherwise.
+    """
+    unit_of_work = _unit_of_work.get()
+    if unit_of_work is None:
+        callback()
+    else:
+        unit_of_work.after_commit(callback)
+
+# Rows fetched per round trip when streaming a table through a server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+def stream_query(stmt, batch_size=STREAM_BATCH_SIZE, scalars=True):
+    """
+    Yield the ORM objects selected by stmt (or its rows, with scalars=False)
+    through a server-side cursor, so only batch_size rows are held in memory
+    at a time. Always uses its own session, since the cursor outlives the
+    request's unit of work.
+    """
     session = SessionLocal()
     try:
-        for procedure in procedures:
-            session.execute(text(procedure))
-            session.commit()
-            print(f"Stored procedure created successfully")
-    except Exception as e:
-        print(f"Error creating stored procedure: {e}")
-        session.rollback()
-        raise
+        result = session.execute(stmt, execution_options={"yield_per": batch_size})
+        for item in (result.scalars() if scalars else result):
+            yield item
     finally:
         session.close()
 
+def create_indexes(bind=engine, tables=None):
+    """
+    Create the indexes declared on the models (or on tables) that are missing
+    from the database. create_all only creates indexes together with a new
+    table, so this also adds indexes declared after a table already exists.
+    """
+    for table in tables if tables is not None else Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+# Stored functions of the flight system, part of the schema fingerprint (database/schema.py)
+STORED_PROCEDURES = [
+    """
+    CREATE OR REPLACE FUNCTION get_airline_by_username(username_param TEXT)
+    RETURNS TABLE (
+        airline_id BIGINT,
+        airline_name VARCHAR,
+        user_id BIGINT,
+        username VARCHAR,
+        email VARCHAR
+    ) AS $$
+    BEGIN
+        RETURN QUERY
+        SELECT a.id, a.name, a.user_id, u.username, u.email FROM airline_companies a
+        INNER JOIN users u ON a.user_id = u.id
+        WHERE u.username = username_param;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+
+    """
+    CREATE OR REPLACE FUNCTION get_customer_by_username(username_param TEXT)
+    RETURNS TABLE (
+        customer_id BIGINT,
+        first_name VARCHAR,
+        last_name VARCHAR,
+        user_id BIGINT,
+        username VARCHAR,
+        email VARCHAR
+    ) AS $$
+    BEGIN
+        RETURN QUERY
+        SELECT c.id, c.first_name, c.last_name, c.user_id, u.username, u.email FROM customers c
+        INNER JOIN users u ON c.user_id = u.id
+        WHERE u.username = username_param;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+
+    """
+    CREATE OR REPLACE FUNCTION get_user_by_username(username_param TEXT)
+    RETURNS TABLE (
+        id BIGINT,
+        username VARCHAR,
+        email VARCHAR
+    ) AS $$
+    BEGIN
+        RETURN QUERY
+        SELECT u.id, u.username, u.email FROM users u WHERE u.username = username_param;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+
+    """
+    CREATE OR REPLACE FUNCTION get_flights_by_parameters(
+        origin_country_id_param INT,
+        destination_country_id_param INT,
+        date_param DATE
+    )
+    RETURNS TABLE (
+        flight_id BIGINT,
+        airline_id BIGINT,
+        origin_country_id INT,
+        destination_country_id INT,
+        departure_time TIMESTAMP,
+        arrival_time TIMESTAMP,
+        remaining_tickets INT
+    ) AS $$
+    BEGIN
+        RETURN QUERY
+        -- Half-open range on the raw column so ix_flights_route_departure is usable
+        SELECT f.* FROM flights f
+        WHERE f.origin_country_id = origin_country_id_param
+        AND f.destination_country_id = destination_country_id_param
+        AND f.departure_time >= date_param::timestamp
+        AND f.departure_time < (date_param + 1)::timestamp;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+
+    """
+    CREATE OR REPLACE FUNCTION get_flights_by_airline_id(airline_id_param BIGINT)
+    RETURNS TABLE (
+        flight_id BIGINT,
+        airline_id BIGINT,
+        origin_country_id INT,
+        destination_country_id INT,
+        departure_time TIMESTAMP,
+        arrival_time TIMESTAMP,
+        remaining_tickets INT
+    ) AS $$
+    BEGIN
+        RETURN QUERY
+        SELECT f.* FROM flights f WHERE f.airline_company_id = airline_id_param;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+
+    """
+    CREATE OR REPLACE FUNCTION get_arrival_flights(country_id_param INT)
+    RETURNS TABLE (
+        flight_id BIGINT,
+        airline_id BIGINT,
+        origin_country_id INT,
+        destination_country_id INT,
+        departure_time TIMESTAMP,
+        arrival_time TIMESTAMP,
+        remaining_tickets INT
+    ) AS $$
+    BEGIN
+        RETURN QUERY
+        SELECT f.* FROM flights f
+        WHERE f.destination_country_id = country_id_param
+        AND f.landing_time BETWEEN NOW() AND NOW() + INTERVAL '12 hours';
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+
+    """
+    CREATE OR REPLACE FUNCTION get_departure_flights(country_id_param INT)
+    RETURNS TABLE (
+        flight_id BIGINT,
+        airline_id BIGINT,
+        origin_country_id INT,
+        destination_country_id INT,
+        departure_time TIMESTAMP,
+        arrival_time TIMESTAMP,
+        remaining_tickets INT
+    ) AS $$
+    BEGIN
+        RETURN QUERY
+        SELECT f.* FROM flights f
+        WHERE f.origin_country_id = country_id_param
+        AND f.departure_time BETWEEN NOW() AND NOW() + INTERVAL '12 hours';
+    END;
+    $$ LANGUAGE plpgsql;
+    """
+]
+
+def create_stored_procedures(connection=None):
+    """Create all stored procedures for the flight system, in one transaction"""
+    if connection is None:
+        with engine.begin() as connection:
+            return create_stored_procedures(connection)
+    for procedure in STORED_PROCEDURES:
+        connection.execute(text(procedure))
+    print(f"{len(STORED_PROCEDURES)} stored procedures created successfully")
+
 def drop_stored_procedure(procedure_name: str):
     """Drop a specific stored procedure"""
     session = SessionLocal()
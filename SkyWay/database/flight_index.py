@@ -0,0 +1,307 @@
+import os
+import threading
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import BigInteger, SmallInteger, column, select, values
+
+from database.database import engine, stream_query
+from database.versions import row_versions, table_state
+
+# Same columns, in the same order, as the get_flights_by_parameters stored procedure
+FlightSearchRow = namedtuple("FlightSearchRow", [
+    "flight_id",
+    "airline_id",
+    "origin_country_id",
+    "destination_country_id",
+    "departure_time",
+    "arrival_time",
+    "remaining_tickets",
+])
+
+
+def to_datetime(value):
+    """Values assigned from JSON are still ISO strings until the object is reloaded"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def to_search_date(value):
+    """Accept a date, a datetime or an ISO string and return the date part"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(value).date()
+
+
+class FlightSearchIndex:
+    """
+    Optional in-process index of flights keyed by
+    (origin_country_id, destination_country_id, departure date), used to answer
+    flight searches without a database round trip.
+
+    The index only holds flights departing on or after the day it was loaded;
+    searches for earlier dates return None so the caller falls back to the
+    stored procedure. Writes made through the models in this process update it
+    directly. Writes made by other workers are picked up from the version
+    counters of the flights table (database/versions.py): before a search, at
+    most every check_interval seconds (0: before every search), the index reads
+    the table's version. If it moved, the rows written or deleted since are
+    read again. A bulk load, or flights deleted by an ON DELETE rule, makes it
+    reload the whole table. A
+    search can therefore miss another worker's writes of the last
+    check_interval seconds, such as a seat count it booked.
+
+    A reload builds new maps without holding the lock and swaps them in, so
+    searches keep answering from the old ones meanwhile, and only one reload
+    runs at a time. Writes applied while it runs are replayed onto the new maps.
+    """
+
+    def __init__(self, enabled=False, check_interval=1):
+        self.enabled = enabled
+        self.check_interval = check_interval
+        self.loaded_at = None
+        self.checked_at = None
+        self.since = None
+        # TableState of the flights table the maps are current with
+        self.state = None
+        self._by_key = {}
+        self._key_by_id = {}
+        # Guards the maps; held only for lookups and small updates, never for a reload
+        self._lock = threading.RLock()
+        # Held for the length of a reload, so only one runs at a time
+        self._load_lock = threading.Lock()
+        # Writes applied during a reload, as functions of (by_key, key_by_id)
+        self._replay = None
+        # Bumped by invalidate(), so a reload that started before it stays stale
+        self._generation = 0
+
+    def load(self):
+        """(Re)build the index from the flights table, waiting for a reload already running"""
+        with self._load_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        from models.flight import Flight
+
+        with self._lock:
+            self._replay = []
+            generation = self._generation
+        try:
+            # Read before the rows, so the maps can only be newer than the state
+            with engine.connect() as connection:
+                state = table_state(connection, Flight.__tablename__)
+            since = date.today()
+            by_key = {}
+            key_by_id = {}
+            stmt = select(Flight).where(Flight.departure_time >= datetime.combine(since, datetime.min.time()))
+            for flight in stream_query(stmt):
+                self._put(by_key, key_by_id, self.row(flight))
+
+            with self._lock:
+                for apply in self._replay:
+                    apply(by_key, key_by_id)
+                self._by_key = by_key
+                self._key_by_id = key_by_id
+                self.since = since
+                self.state = state
+                self.checked_at = datetime.now()
+                # An invalidate() during the reload may be about rows it had already read
+                self.loaded_at = self.checked_at if generation == self._generation else None
+        finally:
+            with self._lock:
+                self._replay = None
+
+    @staticmethod
+    def row(flight):
+        return FlightSearchRow(
+            flight.id,
+            flight.airline_company_id,
+            flight.origin_country_id,
+            flight.destination_country_id,
+            to_datetime(flight.departure_time),
+            to_datetime(flight.landing_time),
+            flight.remaining_tickets,
+        )
+
+    @staticmethod
+    def key(row):
+        return (row.origin_country_id, row.destination_country_id, to_search_date(row.departure_time))
+
+    def snapshot(self, flights):
+        """
+        Read the indexed columns off freshly flushed Flight objects, before the
+        commit expires them. Returns an empty list when the index is disabled.
+        """
+        if not self.enabled:
+            return []
+        return [self.row(flight) for flight in flights]
+
+    def _apply(self, change):
+        """Apply change(by_key, key_by_id) to the maps, and to the next ones if a reload is running"""
+        with self._lock:
+            change(self._by_key, self._key_by_id)
+            if self._replay is not None:
+                self._replay.append(change)
+
+    def put_all(self, rows):
+        """Insert or replace rows taken with snapshot()"""
+        if not rows:
+            return
+        def put_rows(by_key, key_by_id):
+            for row in rows:
+                self._put(by_key, key_by_id, row)
+        self._apply(put_rows)
+
+    def set_remaining_tickets(self, flight_id, remaining_tickets):
+        """Apply a seat count change made by a booking or a cancellation"""
+        if not self.enabled:
+            return
+        def set_seats(by_key, key_by_id):
+            key = key_by_id.get(flight_id)
+            if key is None:
+                return
+            bucket = by_key[key]
+            bucket[flight_id] = bucket[flight_id]._replace(remaining_tickets=remaining_tickets)
+        self._apply(set_seats)
+
+    def discard(self, flight_id):
+        """Remove a deleted flight from the index"""
+        self.discard_all([flight_id])
+
+    def discard_all(self, flight_ids):
+        """Remove deleted flights from the index"""
+        if not self.enabled:
+            return
+        def discard_rows(by_key, key_by_id):
+            for flight_id in flight_ids:
+                self._discard(by_key, key_by_id, flight_id)
+        self._apply(discard_rows)
+
+    @classmethod
+    def _put(cls, by_key, key_by_id, row):
+        cls._discard(by_key, key_by_id, row.flight_id)
+        key = cls.key(row)
+        by_key.setdefault(key, {})[row.flight_id] = row
+        key_by_id[row.flight_id] = key
+
+    @staticmethod
+    def _discard(by_key, key_by_id, flight_id):
+        key = key_by_id.pop(flight_id, None)
+        if key is None:
+            return
+        bucket = by_key.get(key)
+        if bucket is not None:
+            bucket.pop(flight_id, None)
+            if not bucket:
+                del by_key[key]
+
+    def invalidate(self):
+        """Force a reload on the next search, after writes the index could not follow"""
+        with self._lock:
+            self._generation += 1
+            self.loaded_at = None
+
+    def _needs_check(self):
+        if self.loaded_at is None:
+            return True
+        if not self.check_interval:
+            return True
+        return (datetime.now() - self.checked_at).total_seconds() > self.check_interval
+
+    def _refresh(self):
+        # One thread checks or reloads; the others go on searching the maps they have
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            if self.loaded_at is None:
+                self._rebuild()
+            # Another thread may have checked since this one looked
+            elif self._needs_check():
+                self._sync()
+        finally:
+            self._load_lock.release()
+
+    def _sync(self):
+        """Apply the flights written or deleted by any process since the state the maps are current with"""
+        from models.flight import Flight
+
+        flights = Flight.__table__
+        with engine.connect() as connection:
+            state = table_state(connection, flights.name)
+            self.checked_at = datetime.now()
+            if state == self.state:
+                return
+            # After a bulk load or an ON DELETE rule, the changed ids are not known
+            if state.bulk_version == self.state.bulk_version:
+                seen = self.state.versions
+                moved = [(shard, seen.get(shard, 0)) for shard, version in state.versions.items()
+                         if version != seen.get(shard)]
+                earlier = values(column("shard", SmallInteger), column("version", BigInteger), name="earlier").data(moved)
+                # A deleted flight keeps its entry but has no row, so its columns come back NULL
+                stmt = (
+                    select(row_versions.c.row_id, flights.c.airline_company_id, flights.c.origin_country_id,
+                           flights.c.destination_country_id, flights.c.departure_time, flights.c.landing_time,
+                           flights.c.remaining_tickets)
+                    .select_from(row_versions)
+                    .join(earlier, (row_versions.c.shard == earlier.c.shard) & (row_versions.c.version > earlier.c.version))
+                    .outerjoin(flights, flights.c.id == row_versions.c.row_id)
+                    .where(row_versions.c.table_name == flights.name,
+                           row_versions.c.version > min(version for _, version in moved))
+                )
+                rows = [FlightSearchRow(*row) for row in connection.execute(stmt)]
+            else:
+                rows = None
+        if rows is None:
+            self._rebuild()
+            return
+        since = self.since
+        def put_written(by_key, key_by_id):
+            for row in rows:
+                if row.departure_time is not None and to_search_date(row.departure_time) >= since:
+                    self._put(by_key, key_by_id, row)
+                else:
+                    self._discard(by_key, key_by_id, row.flight_id)
+        self._apply(put_written)
+        # The rows were read after the state, so they are at least this new
+        self.state = state
+
+    def search(self, origin_country_id, destination_country_id, departure_date):
+        """
+        Return the flights for the key sorted by id, or None when the index
+        cannot answer (disabled, not loaded yet, or the date is before what
+        was loaded).
+        """
+        if not self.enabled:
+            return None
+        if self._needs_check():
+            self._refresh()
+        with self._lock:
+            target_date = to_search_date(departure_date)
+            if self.since is None or target_date < self.since:
+                return None
+            bucket = self._by_key.get((origin_country_id, destination_country_id, target_date), {})
+            return [bucket[flight_id] for flight_id in sorted(bucket)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "keys": len(self._by_key),
+                "flights": len(self._key_by_id),
+                "since": self.since.isoformat() if self.since else None,
+                "version": sum(self.state.versions.values()) if self.state else None,
+                "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+                "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            }
+
+
+# Enabled with FLIGHT_SEARCH_INDEX=1; FLIGHT_SEARCH_INDEX_CHECK sets the seconds between
+# checks of the flights version, which is also how long other workers' writes can go
+# unseen. 0 checks before every search, at the cost of a query per search
+flight_search_index = FlightSearchIndex(
+    enabled=os.environ.get("FLIGHT_SEARCH_INDEX", "0") == "1",
+    check_interval=float(os.environ.get("FLIGHT_SEARCH_INDEX_CHECK", "1")),
+)
@@ -0,0 +1,274 @@
+"""
+Request parsing, validation and response bodies of the table routes, shared
+by repo_blueprint (Flask, database/repository.py) and async_repo_blueprint
+(Quart, database/async_repository.py). The blueprints only call or await the
+model and wrap what these helpers return in their own response class.
+
+Both frameworks' request objects have the same args, accept_mimetypes and
+conditional-request properties, so the helpers take the request itself; the
+JSON body is read by the blueprint, since Quart reads it with await. A helper
+that rejects the request raises ApiError, which each blueprint turns into
+{"error": message} with the error's status.
+"""
+import json
+from collections import namedtuple
+from datetime import date
+
+from database.bulk import BULK_CHUNK_SIZE
+from database.cache import CACHES
+from database.queries import TableQuery
+from database.serialization import dumps_bytes, serializer_for
+
+from models.administrator import Administrator
+from models.airline_company import AirlineCompany
+from models.country import Country
+from models.customer import Customer
+from models.ticket import Ticket
+from models.user import User
+from models.flight import Flight
+from models.user_role import UserRole
+
+
+# Map table names to models
+MODEL_MAP = {
+    "user": User,
+    "flight": Flight,
+    "country": Country,
+    "ticket": Ticket,
+    "administrator": Administrator,
+    "airline_company": AirlineCompany,
+    "customer": Customer,
+    "user_role": UserRole
+}
+
+# Page size used by GET /<table> when the client does not send ?limit=
+DEFAULT_PAGE_SIZE = 100
+# Upper bound for ?limit= so a single request cannot pull a whole table
+MAX_PAGE_SIZE = 1000
+# Accept header value that switches GET /<table> to a streamed full-table export
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Values of ?mode= on POST /<table>/addAll that select the bulk ingestion path
+BULK_MODES = ('bulk', 'copy')
+# Upper bound for the ids of one /<table>/batch request
+MAX_BATCH_SIZE = 1000
+
+# What GET /<table> was asked for, see page_request()
+PageRequest = namedtuple("PageRequest", ["query", "after", "limit", "json_agg", "ndjson"])
+# ?mode=bulk or ?mode=copy of POST /<table>/addAll, see bulk_request()
+BulkRequest = namedtuple("BulkRequest", ["chunk_size", "use_copy"])
+
+
+class ApiError(Exception):
+    """A rejected request: the status and message of its {"error": ...} response"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def model_for(table):
+    model = MODEL_MAP.get(table)
+    if not model:
+        raise ApiError(404, f"No table found for {table}")
+    return model
+
+
+def item_body(model, table, item_id, item):
+    """The body of GET /<table>/<id>"""
+    if not item:
+        raise ApiError(404, f"No {table} found with ID {item_id}")
+    return serializer_for(model).from_instance(item)
+
+
+def batch_ids(raw):
+    try:
+        return parse_ids(raw)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+
+
+def parse_ids(raw):
+    """
+    The ids of a batch request, from ?ids=3,1,2, a {"ids": [...]} body or a
+    bare JSON array, in request order with repeats dropped. Raises ValueError on a bad list.
+    """
+    if isinstance(raw, str):
+        raw = [item for item in raw.split(',') if item.strip()]
+    elif isinstance(raw, dict):
+        raw = raw.get('ids')
+    if not isinstance(raw, list) or not raw:
+        raise ValueError('Send the ids as ?ids=1,2,3 or a JSON body {"ids": [1, 2, 3]}')
+    ids = []
+    for item in raw:
+        if isinstance(item, str) and item.strip().isdigit():
+            item = int(item)
+        if not isinstance(item, int) or isinstance(item, bool):
+            raise ValueError(f"Not an id: {item!r}")
+        ids.append(item)
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} ids per request")
+    return ids
+
+
+def batch_body(model, items, missing):
+    return {"items": serializer_for(model).from_rows(items), "missing": missing}
+
+
+def page_request(model, request):
+    """Parse and validate the query string of GET /<table>"""
+    args = request.args
+    # Filters, sort and projection: ?country_id=3&sort=-departure_time&fields=id,remaining_tickets
+    # Keyset pagination: ?after=<"next" of the previous page>&limit=N
+    try:
+        query = TableQuery(model, args)
+        after = query.parse_after(args.get('after'))
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    ndjson = wants_ndjson(request)
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    # An NDJSON export is never paged, so its limit is not checked
+    if not ndjson and (limit < 1 or limit > MAX_PAGE_SIZE):
+        raise ApiError(400, f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return PageRequest(query, after, limit, args.get('json_agg') in ('1', 'true'), ndjson)
+
+
+def wants_ndjson(request):
+    """Whether the client asked for a streamed export with Accept: application/x-ndjson"""
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def page_body(model, table, page, rows):
+    """The body of GET /<table> for the rows of one page"""
+    if not rows and page.after is None:
+        raise ApiError(404, f"No records found for {table}")
+    items = serializer_for(model, page.query.fields).from_rows(rows)
+    last_key = page.query.last_key(rows[-1]) if rows else None
+    return {"items": items, "next": next_cursor(page.query, len(rows), page.limit, last_key)}
+
+
+def json_agg_body(table, page, items, count, last_key):
+    """
+    The body of GET /<table>?json_agg=1: the items array Postgres built, as
+    text, is written into the response as is, without decoding or re-encoding rows.
+    """
+    if not count and page.after is None:
+        raise ApiError(404, f"No records found for {table}")
+    cursor = next_cursor(page.query, count, page.limit, json.loads(last_key) if last_key else None)
+    return '{"items":%s,"next":%s}' % (items, dumps_bytes(cursor).decode())
+
+
+def next_cursor(query, count, limit, last_key):
+    """
+    The ?after= value for the next page, from the key of the last row we
+    returned: a full page means there may be more rows after it.
+    """
+    return query.cursor(last_key) if count == limit else None
+
+
+def ndjson_line(serializer, row):
+    """One row of a streamed NDJSON export"""
+    return dumps_bytes(serializer.from_row(row)) + b"\n"
+
+
+def flight_search_request(args):
+    """Origin, destination and day of GET /flight/search"""
+    try:
+        return int(args['origin_country_id']), int(args['destination_country_id']), date.fromisoformat(args['date'])
+    except (KeyError, ValueError):
+        raise ApiError(400, "Send origin_country_id, destination_country_id and date=YYYY-MM-DD")
+
+
+def require_body(body, table, action):
+    if not body:
+        raise ApiError(202, f"No content to {action} {table}")
+    return body
+
+
+def bulk_request(args, body):
+    """?mode=bulk (multi-row INSERT) or ?mode=copy (COPY FROM STDIN) of POST /<table>/addAll, or None"""
+    mode = args.get('mode')
+    if mode not in BULK_MODES:
+        return None
+    if not isinstance(body, list):
+        raise ApiError(400, "Bulk mode expects a JSON array of rows")
+    chunk_size = args.get('chunk_size', BULK_CHUNK_SIZE, type=int)
+    if chunk_size < 1:
+        raise ApiError(400, "chunk_size must be positive")
+    return BulkRequest(chunk_size, mode == 'copy')
+
+
+def bulk_status(report):
+    # 207: some rows were rejected, the report lists which ones and why
+    return 207 if report["failed"] else 201
+
+
+def saved_message(body, action):
+    return f"{body} has been {action} successfully"
+
+
+def item_dict(item):
+    """The body of a PATCH or DELETE of one row"""
+    if not item:
+        raise ApiError(404, "Item not found")
+    return item.to_dict()
+
+
+def delete_filters(model, table, args):
+    """The WHERE clauses of DELETE /<table>, the same filters as GET /<table>"""
+    try:
+        query = TableQuery(model, args)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    if not query.where:
+        raise ApiError(400, f"A delete needs at least one filter, DELETE /{table} alone would empty the table")
+    return query.where
+
+
+def deleted_report(deleted, ids=None):
+    """The deleted ids and, for a delete by ids, the ones that had no row"""
+    report = {"deleted": deleted, "count": len(deleted)}
+    if ids is not None:
+        found = set(deleted)
+        report["missing"] = [id for id in ids if id not in found]
+    return report
+
+
+def still_referenced(error):
+    # A foreign key without an ON DELETE rule still points at one of the rows
+    return ApiError(409, f"Rows are still referenced: {error.orig}")
+
+
+def sync_cached_table(table, version):
+    """Drop the table's cached entries if another worker wrote to it since they were loaded"""
+    cache = CACHES.get(table)
+    if cache is not None:
+        cache.sync_version(version.table_version)
+
+
+def is_fresh(request, version):
+    """Whether the client's copy, named by If-None-Match or If-Modified-Since, is still current"""
+    if request.if_none_match:
+        # If-None-Match wins when both are sent
+        return request.if_none_match.contains_weak(version.etag)
+    since = request.if_modified_since
+    # Last-Modified has whole seconds, so writes within the same second are only told apart by the ETag
+    return since is not None and version.last_modified is not None and version.last_modified.replace(microsecond=0) <= since
+
+
+def not_modified(response_class, version):
+    """304 with the validators and no body, sent without reading the rows"""
+    return tagged(response_class(status=304), version)
+
+
+def tagged(response, version):
+    """Add the ETag and Last-Modified of version to a successful or 304 response"""
+    if response.status_code in (200, 304):
+        response.set_etag(version.etag)
+        if version.last_modified is not None:
+            response.last_modified = version.last_modified
+        # JSON pages and NDJSON exports of a table share its URL and version
+        response.vary.add('Accept')
+    return response
@@ -0,0 +1,122 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Statements slower than this many milliseconds are logged with the types of their parameters
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+# The parameter description is cut to this many characters so bulk inserts do not flood the log
+SLOW_QUERY_PARAMS_MAX = 500
+
+slow_query_logger = logging.getLogger("skyway.slow_query")
+
+# Query count and DB time of the HTTP request being handled, set by main.py
+_request_stats = ContextVar("request_query_stats", default=None)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = 0
+
+
+# Totals for the whole process, across requests and background work
+process_stats = QueryStats()
+_process_lock = threading.Lock()
+
+
+def begin_request_stats():
+    stats = QueryStats()
+    _request_stats.set(stats)
+    return stats
+
+
+def end_request_stats():
+    stats = _request_stats.get()
+    _request_stats.set(None)
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.slow += slow
+    with _process_lock:
+        process_stats.count += 1
+        process_stats.seconds += elapsed
+        process_stats.slow += slow
+
+    if slow:
+        slow_query_logger.warning(
+            "Slow query (%.1f ms): %s | parameters: %.*s",
+            elapsed * 1000, " ".join(statement.split()), SLOW_QUERY_PARAMS_MAX, describe_parameters(parameters, executemany),
+        )
+
+
+def describe_parameters(parameters, executemany=False):
+    """
+    The names and types of a statement's parameters, never their values:
+    these include passwords and card numbers.
+    """
+    if executemany and parameters:
+        # One set of parameters per row
+        return f"{len(parameters)} rows of {describe_parameters(parameters[0])}"
+    if isinstance(parameters, dict):
+        return "{%s}" % ", ".join(f"{name}: {type(value).__name__}" for name, value in parameters.items())
+    if isinstance(parameters, (list, tuple)):
+        return "(%s)" % ", ".join(type(value).__name__ for value in parameters)
+    return type(parameters).__name__
+
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument(engine):
+    """Time every statement the engine runs"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Send log records through a queue to a background thread, so writing the
+    slow-query log (and any other log line) never blocks a request thread.
+    Leaves logging alone if the application was already configured.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    _start_log_listener(records, handler)
+    # Threads do not survive fork: a pre-forked worker (gunicorn --preload) starts its own
+    os.register_at_fork(after_in_child=lambda: _start_log_listener(records, handler))
+
+
+def _start_log_listener(records, handler):
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
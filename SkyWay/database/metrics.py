@@ -0,0 +1,155 @@
+import threading
+from bisect import bisect_left
+
+from database.cache import CACHES
+from database.database import pool_stats
+from database.flight_index import flight_search_index
+from database.instrumentation import process_stats
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4"
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Minimal Prometheus histogram: per label set, one counter per bucket plus
+    the sum and count of observations. observe() is a bisect and a few adds.
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            label_text = format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{{{format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+
+
+def family(name, help_text, samples, metric_type="gauge"):
+    """Render (labels dict, value) samples read at scrape time from existing stats"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_text = format_labels(labels.keys(), labels.values())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+REQUEST_LABELS = ("method", "route", "table", "status")
+http_requests = Counter("skyway_http_requests_total", "HTTP requests handled", REQUEST_LABELS)
+http_latency = Histogram("skyway_http_request_duration_seconds", "HTTP request latency",
+                         ("method", "route", "table"))
+http_db_time = Histogram("skyway_http_request_db_seconds", "Database time spent per HTTP request",
+                         ("method", "route", "table"))
+http_queries = Counter("skyway_http_request_queries_total", "SQL statements run by HTTP requests",
+                       ("method", "route", "table"))
+
+
+def observe_request(method, route, table, status, seconds, db_seconds, queries):
+    """Record one finished request; called from main.py after every response"""
+    http_requests.inc((method, route, table, status))
+    http_latency.observe((method, route, table), seconds)
+    http_db_time.observe((method, route, table), db_seconds)
+    http_queries.inc((method, route, table), queries)
+
+
+def render_metrics(pool=None):
+    """
+    Every metric in the Prometheus text exposition format. pool is the pool_stats()
+    of the engine the app serves requests with, the sync engine's by default.
+    """
+    lines = []
+    lines += http_requests.render()
+    lines += http_latency.render()
+    lines += http_db_time.render()
+    lines += http_queries.render()
+
+    lines += family("skyway_db_queries_total", "SQL statements run by this process",
+                   [({}, process_stats.count)], "counter")
+    lines += family("skyway_db_query_seconds_total", "Time spent in SQL statements by this process",
+                   [({}, process_stats.seconds)], "counter")
+    lines += family("skyway_db_slow_queries_total", "Statements slower than SLOW_QUERY_MS",
+                   [({}, process_stats.slow)], "counter")
+
+    caches = {name: cache.stats() for name, cache in CACHES.items()}
+    lines += family("skyway_cache_hits_total", "Reference cache hits",
+                   [({"cache": name}, stats["hits"]) for name, stats in caches.items()], "counter")
+    lines += family("skyway_cache_misses_total", "Reference cache misses",
+                   [({"cache": name}, stats["misses"]) for name, stats in caches.items()], "counter")
+    lines += family("skyway_cache_hit_ratio", "Reference cache hit ratio",
+                   [({"cache": name}, stats["hit_ratio"]) for name, stats in caches.items()])
+    lines += family("skyway_cache_entries", "Entries held by each reference cache",
+                   [({"cache": name}, stats["size"]) for name, stats in caches.items()])
+
+    pool = pool if pool is not None else pool_stats()
+    lines += family("skyway_db_pool_connections", "Connection pool usage", [
+        ({"state": "checked_out"}, pool["checked_out"]),
+        ({"state": "idle"}, pool["idle"]),
+        ({"state": "overflow"}, pool["overflow"]),
+    ])
+    lines += family("skyway_db_pool_size", "Configured pool size", [({}, pool["size"])])
+    lines += family("skyway_db_pool_checkouts_total", "Connection checkouts", [({}, pool["checkouts"])], "counter")
+    lines += family("skyway_db_pool_timeouts_total", "Checkouts that timed out", [({}, pool["timeouts"])], "counter")
+    lines += family("skyway_db_pool_connect_errors_total", "Checkouts that failed to open a connection",
+                   [({}, pool["connect_errors"])], "counter")
+    lines += family("skyway_db_pool_wait_seconds_total", "Time spent waiting for a connection",
+                   [({}, pool["wait_seconds_total"])], "counter")
+
+    index = flight_search_index.stats()
+    lines += family("skyway_flight_index_flights", "Flights held by the in-memory search index",
+                   [({}, index["flights"])])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,77 @@
+from collections import namedtuple
+
+from database.database import get_session
+from database.flight_index import FlightSearchRow
+from database.serialization import dumps_bytes
+
+# Row types, with the same columns in the same order as the RETURNS TABLE of
+# each function in create_stored_procedures
+AirlineByUsername = namedtuple("AirlineByUsername", ["airline_id", "airline_name", "user_id", "username", "email"])
+CustomerByUsername = namedtuple("CustomerByUsername", [
+    "customer_id", "first_name", "last_name", "user_id", "username", "email",
+])
+UserByUsername = namedtuple("UserByUsername", ["id", "username", "email"])
+
+# A function's rows as one JSON array text built by Postgres, keyed by its RETURNS TABLE columns
+JSON_QUERY = "SELECT coalesce(json_agg(row_to_json(r)), '[]')::text FROM {call} r"
+
+
+class StoredFunction:
+    """
+    Calls one set-returning database function as SELECT * FROM fn(...).
+    The statement is PREPAREd once per pooled connection and then EXECUTEd,
+    so repeated calls skip parsing and planning on the server. json() runs
+    the same call but has Postgres return the rows as one JSON array.
+    """
+
+    def __init__(self, name, arg_types, row_type):
+        self.name = name
+        self.arg_types = arg_types
+        self.row_type = row_type
+        placeholders = ", ".join(f"${i}" for i in range(1, len(arg_types) + 1))
+        self.call = f"{name}({placeholders})"
+
+    def prepare(self, connection, statement_name, query):
+        # Prepared statements live as long as the server session, which is the
+        # pooled DBAPI connection, so remember them in its info dict
+        prepared = connection.info.setdefault("prepared_statements", set())
+        if statement_name in prepared:
+            return
+        connection.exec_driver_sql(f"PREPARE {statement_name} ({', '.join(self.arg_types)}) AS {query}")
+        prepared.add(statement_name)
+
+    def execute(self, statement_name, query, args):
+        if len(args) != len(self.arg_types):
+            raise TypeError(f"{self.name}() takes {len(self.arg_types)} arguments, got {len(args)}")
+        session = get_session()
+        try:
+            connection = session.connection()
+            self.prepare(connection, statement_name, query)
+            placeholders = ", ".join(["%s"] * len(args))
+            return connection.exec_driver_sql(f"EXECUTE {statement_name}({placeholders})", tuple(args)).all()
+        finally:
+            session.close()
+
+    def __call__(self, *args):
+        rows = self.execute(f"{self.name}_stmt", f"SELECT * FROM {self.call}", args)
+        return [self.row_type(*row) for row in rows]
+
+    def json(self, *args):
+        """The result rows as a JSON array string built by Postgres, for passing straight to a response"""
+        return self.execute(f"{self.name}_json_stmt", JSON_QUERY.format(call=self.call), args)[0][0]
+
+
+def rows_json(rows):
+    """Row tuples as the same JSON array text json() returns, for rows that did not come from the database"""
+    return dumps_bytes([row._asdict() for row in rows]).decode()
+
+
+get_airline_by_username = StoredFunction("get_airline_by_username", ["text"], AirlineByUsername)
+get_customer_by_username = StoredFunction("get_customer_by_username", ["text"], CustomerByUsername)
+get_user_by_username = StoredFunction("get_user_by_username", ["text"], UserByUsername)
+get_flights_by_parameters = StoredFunction(
+    "get_flights_by_parameters", ["integer", "integer", "date"], FlightSearchRow,
+)
+get_flights_by_airline_id = StoredFunction("get_flights_by_airline_id", ["bigint"], FlightSearchRow)
+get_arrival_flights = StoredFunction("get_arrival_flights", ["integer"], FlightSearchRow)
+get_departure_flights = StoredFunction("get_departure_flights", ["integer"], FlightSearchRow)
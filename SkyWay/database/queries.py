@@ -0,0 +1,358 @@
+import base64
+import json
+import operator
+from datetime import date, datetime
+
+from sqlalchemy import (Text, and_, any_, bindparam, cast, delete, false, func, literal, literal_column, or_,
+                        select, update)
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+
+from database.bulk import BULK_CHUNK_SIZE, bulk_insert
+from database.database import after_commit, get_session
+from database.serialization import dumps_bytes
+from database.versions import mark_changed, mark_deleted
+
+# Query string keys of GET /<table> that are not column filters
+RESERVED_PARAMS = {"after", "limit", "sort", "fields", "json_agg"}
+
+# Filter suffixes: ?remaining_tickets__gt=0, ?id__in=1,2,3; a bare column name means equality
+FILTER_OPERATORS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "in": lambda column, values: column.in_(values),
+}
+
+
+def check_columns(table, values):
+    """Reject keys that are not columns of the table, and any attempt to change the id"""
+    unknown = set(values) - set(table.columns.keys())
+    if unknown:
+        raise ValueError(f"Unknown columns for {table.name}: {', '.join(sorted(unknown))}")
+    if "id" in values:
+        raise ValueError("id cannot be changed")
+
+
+def update_returning(model, id, values):
+    """
+    Update only the supplied columns of one row with a single
+    UPDATE ... SET <columns> WHERE id = :id RETURNING * statement.
+    Returns the updated row as a dict, or None when no row has that id.
+    """
+    table = model.__table__
+    check_columns(table, values)
+    if not values:
+        raise ValueError("No columns to update")
+
+    session = get_session()
+    try:
+        stmt = update(table).where(table.c.id == id).values(**values).returning(*table.c)
+        row = session.execute(stmt).mappings().first()
+        if row:
+            mark_changed(session, table.name, [id])
+        session.commit()
+        return dict(row) if row else None
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def fetch_by_ids(model, ids, read_only=False):
+    """
+    The rows with the given ids in one SELECT, in the order of ids, and the
+    ids that have no row. read_only returns plain column rows instead of ORM
+    instances.
+    """
+    session = get_session()
+    try:
+        result = session.execute(select_by_ids(model, ids, read_only))
+        return in_id_order(result.all() if read_only else result.scalars().all(), ids)
+    finally:
+        session.close()
+
+
+def select_by_ids(model, ids, read_only=False):
+    """
+    SELECT ... WHERE id = ANY(:ids): the ids travel as one array parameter, so
+    the statement is the same whatever their number
+    """
+    table = model.__table__
+    stmt = select(*table.c) if read_only else select(model)
+    return stmt.where(ids_condition(table, ids))
+
+
+def ids_condition(table, ids):
+    """id = ANY(:ids), the ids bound as one array parameter"""
+    return table.c.id == any_(bindparam("ids", list(ids), type_=ARRAY(table.c.id.type)))
+
+
+def in_id_order(rows, ids):
+    """(rows in the order of ids, ids without a row)"""
+    by_id = {row.id: row for row in rows}
+    return [by_id[id] for id in ids if id in by_id], [id for id in ids if id not in by_id]
+
+
+def delete_returning(model, *conditions):
+    """
+    Delete every row matching the conditions with one DELETE ... RETURNING id,
+    without loading the rows into Python. The ON DELETE rules of the foreign
+    keys pointing at the table run in the database, in the same statement.
+    Returns the deleted ids.
+    """
+    if not conditions:
+        raise ValueError("A delete needs at least one condition")
+    table = model.__table__
+    session = get_session()
+    try:
+        ids = session.execute(delete(table).where(*conditions).returning(table.c.id)).scalars().all()
+        mark_deleted(session, table, ids)
+        session.commit()
+        return ids
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+class SetBasedWrites:
+    """
+    The set-based writes every model shares: bulk_add, patch, remove_by_ids
+    and remove_where, each one statement (or one per chunk) on the model's
+    table. A model with a ReferenceCache names it in reference_cache, so the
+    cache is cleared once the write commits; models that keep something else
+    in step (the flight search index, seat counts) override the method.
+    """
+
+    reference_cache = None
+
+    @classmethod
+    def written(cls):
+        if cls.reference_cache is not None:
+            after_commit(cls.reference_cache.invalidate)
+
+    @classmethod
+    def bulk_add(cls, listOfItems, chunk_size=BULK_CHUNK_SIZE, use_copy=False):
+        # Chunked multi-row INSERT / COPY that skips and reports bad rows instead of failing the batch
+        report = bulk_insert(cls, listOfItems, chunk_size, use_copy)
+        cls.written()
+        return report
+
+    @classmethod
+    def patch(cls, id, changes):
+        """
+        Partial update: only the supplied columns are written, in one
+        UPDATE ... RETURNING round trip. Returns the updated item, or None if not found.
+        """
+        row = update_returning(cls, id, changes)
+        if not row:
+            return None  # item not found
+        cls.written()
+        return cls(**row)
+
+    @classmethod
+    def remove_by_ids(cls, ids):
+        # One DELETE ... WHERE id = ANY(:ids) RETURNING id; returns the ids that were deleted
+        return cls.remove_where(ids_condition(cls.__table__, ids))
+
+    @classmethod
+    def remove_where(cls, *conditions):
+        """
+        Set-based delete of every row matching the conditions, in one
+        DELETE ... RETURNING id without loading the rows. Returns the deleted ids.
+        """
+        ids = delete_returning(cls, *conditions)
+        cls.written()
+        return ids
+
+
+def coerce_value(column, raw):
+    """Convert a query string or JSON string value to the Python type of the column"""
+    if not isinstance(raw, str):
+        return raw
+    python_type = column.type.python_type
+    try:
+        if python_type is bool:
+            if raw.lower() not in ("true", "false", "1", "0"):
+                raise ValueError(raw)
+            return raw.lower() in ("true", "1")
+        if python_type in (datetime, date):
+            return python_type.fromisoformat(raw)
+        return python_type(raw)
+    except ValueError:
+        raise ValueError(f"Invalid value for {column.name}: {raw!r}") from None
+
+
+def coerce_values(table, values):
+    """
+    The values of a request body converted to the types of the table's columns,
+    for drivers such as asyncpg that do not cast strings themselves. Keys that
+    are not columns are kept, for the caller to reject.
+    """
+    return {key: coerce_value(table.c[key], value) if key in table.c else value for key, value in values.items()}
+
+
+class TableQuery:
+    """
+    Filters, sort order and projection for one model's table, parsed from
+    query string arguments such as
+    ?country_id=3&remaining_tickets__gt=0&sort=-departure_time&fields=id,remaining_tickets
+    and compiled to a parameterized SELECT. Every name is checked against the
+    table's columns and raises ValueError otherwise. id is always selected,
+    since it is the pagination cursor.
+
+    Pages are keyset paginated on (sort columns..., id). Without sort= the
+    ?after= cursor is the last id of the previous page; with it, the cursor is
+    opaque and carries the sort values of the last row as well (see cursor()).
+    """
+
+    def __init__(self, model, args):
+        self.model = model
+        self.table = table = model.__table__
+        self.where = []
+        for key in args:
+            if key in RESERVED_PARAMS:
+                continue
+            name, _, op = key.partition("__")
+            column = self.column(name)
+            if op and op not in FILTER_OPERATORS:
+                raise ValueError(f"Unknown filter operator: {op}")
+            raw = args.get(key)
+            if op == "in":
+                value = [coerce_value(column, item) for item in (raw.split(",") if isinstance(raw, str) else raw)]
+            else:
+                value = coerce_value(column, raw)
+            self.where.append(FILTER_OPERATORS[op or "eq"](column, value))
+
+        self.sort = []
+        # (column, descending) of each sort= column, for the keyset seek
+        self.sort_keys = []
+        for name in filter(None, (args.get("sort") or "").split(",")):
+            descending = name.startswith("-")
+            column = self.column(name.lstrip("-"))
+            self.sort.append(column.desc() if descending else column.asc())
+            self.sort_keys.append((column, descending))
+        # A cursor only continues the sort order it was made for
+        self.sort_spec = ",".join(f"{'-' if descending else ''}{column.name}" for column, descending in self.sort_keys)
+
+        fields = [name for name in (args.get("fields") or "").split(",") if name]
+        for name in fields:
+            self.column(name)
+        self.fields = ["id"] + [name for name in fields if name != "id"] if fields else list(table.columns.keys())
+
+    def column(self, name):
+        if name not in self.table.c:
+            raise ValueError(f"Unknown column for {self.table.name}: {name}")
+        return self.table.c[name]
+
+    def is_plain(self):
+        """No filter, sort or projection: the model's own get_all gives the same rows"""
+        return not self.where and not self.sort and self.fields == list(self.table.columns.keys())
+
+    def order_by(self):
+        # id breaks ties, so pages are deterministic
+        return self.sort + [self.table.c.id]
+
+    def select(self, after=None, limit=None, *extra_columns):
+        """
+        SELECT of the requested fields, filtered, sorted and keyset paginated.
+        after is a parse_after() value. The sort values follow the fields in
+        each row, so last_key() can build the next cursor from the last row.
+        """
+        sort_values = [column.label(f"sort_{i}") for i, (column, _) in enumerate(self.sort_keys)]
+        stmt = select(*(self.table.c[name] for name in self.fields), *sort_values, *extra_columns).where(*self.where)
+        if after is not None:
+            stmt = stmt.where(self.seek(after))
+        stmt = stmt.order_by(*self.order_by())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return stmt
+
+    def seek(self, after):
+        """
+        The rows that come after the key in ORDER BY order:
+        (a > x) OR (a = x AND b > y) OR ... OR (a = x AND b = y AND id > last_id).
+        Postgres sorts NULL after every value ascending and before every value descending.
+        """
+        if not self.sort_keys:
+            return self.table.c.id > after
+        clauses, same = [], []
+        for (column, descending), value in zip(self.sort_keys, after):
+            if value is None:
+                later = column.is_not(None) if descending else false()
+                equal = column.is_(None)
+            else:
+                later = column < value if descending else or_(column > value, column.is_(None))
+                equal = column == value
+            clauses.append(and_(*same, later))
+            same.append(equal)
+        clauses.append(and_(*same, self.table.c.id > after[-1]))
+        return or_(*clauses)
+
+    def last_key(self, row):
+        """Sort values and id of a row of select()"""
+        start = len(self.fields)
+        return tuple(row[start:start + len(self.sort_keys)]) + (row.id,)
+
+    def cursor(self, key):
+        """The ?after= value of the page after the row with this key: its id, or an opaque token when sorted"""
+        if not self.sort_keys:
+            return key[-1]
+        token = base64.urlsafe_b64encode(dumps_bytes([self.sort_spec, *key]))
+        return token.decode().rstrip("=")
+
+    def parse_after(self, raw):
+        """The key of a ?after= cursor, for select(); raises ValueError on a cursor of another query"""
+        if raw is None:
+            return None
+        if not self.sort_keys:
+            if not str(raw).isdigit():
+                raise ValueError("after= must be the last id of the previous page")
+            return int(raw)
+        try:
+            spec, *key = json.loads(base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)))
+        except (ValueError, TypeError):
+            spec, key = None, ()
+        if spec != self.sort_spec or len(key) != len(self.sort_keys) + 1:
+            raise ValueError("after= is not a cursor of this sort order")
+        columns = [column for column, _ in self.sort_keys] + [self.table.c.id]
+        return tuple(coerce_value(column, value) for column, value in zip(columns, key))
+
+    def rows(self, after=None, limit=None):
+        session = get_session()
+        try:
+            return session.execute(self.select(after, limit)).all()
+        finally:
+            session.close()
+
+
+def json_page(query, after=None, limit=None):
+    """
+    One page of a TableQuery rendered as a JSON array by Postgres with
+    json_agg(json_build_object(...)), so the rows never become Python objects.
+    Returns (array text, row count, last key as JSON text).
+    """
+    session = get_session()
+    try:
+        return session.execute(json_page_select(query, after, limit)).one()
+    finally:
+        session.close()
+
+
+def json_page_select(query, after=None, limit=None):
+    """The SELECT behind json_page, shared with the async app"""
+    position = func.row_number().over(order_by=query.order_by()).label("position")
+    page = query.select(after, limit, position).subquery("page")
+    record = func.json_build_object(*(part for name in query.fields for part in (literal(name), page.c[name])))
+    rows = func.json_agg(aggregate_order_by(record, page.c.position))
+    # Cast to text so the driver hands the array over without parsing it
+    body = cast(func.coalesce(rows, literal_column("'[]'::json")), Text)
+    # Sort values and id of the last row, the same key as TableQuery.last_key()
+    key = cast(func.json_build_array(*(page.c[f"sort_{i}"] for i in range(len(query.sort_keys))), page.c.id), Text)
+    last_key = func.array_agg(aggregate_order_by(key, page.c.position.desc()), type_=ARRAY(Text))[1]
+    return select(body, func.count(), last_key)
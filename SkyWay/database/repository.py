@@ -1,102 +1,202 @@
 from csv import excel
 
-from flask import Blueprint, request,jsonify
-from database.database import engine
-from sqlalchemy import text
+from flask import Blueprint, Response, make_response, request, jsonify, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from database.cache import cache_stats
+from database.database import pool_stats, stream_query
+from database.handlers import (NDJSON_MIMETYPE, ApiError, batch_body, batch_ids, bulk_request, bulk_status,
+                               delete_filters, deleted_report, flight_search_request, is_fresh, item_body,
+                               item_dict, json_agg_body, model_for, ndjson_line, not_modified, page_body,
+                               page_request, require_body, saved_message, still_referenced, sync_cached_table,
+                               tagged)
+from database.queries import json_page
+from database.metrics import PROMETHEUS_MIMETYPE, render_metrics
+from database.serialization import serializer_for
+from database.versions import row_version, table_version
 
-from models.administrator import Administrator
 from models.airline_company import AirlineCompany
-from models.country import Country
-from models.customer import Customer
 from models.ticket import Ticket
-from models.user import User
 from models.flight import  Flight
-from models.user_role import UserRole
 
 repo_blueprint = Blueprint('repo_blueprint', __name__)
 
 
-# Map table names to models
-MODEL_MAP = {
-    "user": User,
-    "flight": Flight,
-    "country": Country,
-    "ticket": Ticket,
-    "administrator":Administrator,
-    "airline_company": AirlineCompany,
-    'customer': Customer,
-    "user_role": UserRole
-}
+@repo_blueprint.errorhandler(ApiError)
+def api_error(error):
+    return jsonify({"error": error.message}), error.status
+
+@repo_blueprint.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters of the in-process reference-data caches"""
+    return jsonify(cache_stats())
+
+@repo_blueprint.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Connection pool usage, for sizing DB_POOL_SIZE / DB_MAX_OVERFLOW under load"""
+    return jsonify(pool_stats())
+
+@repo_blueprint.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, database, cache and pool metrics for Prometheus to scrape"""
+    return Response(render_metrics(), mimetype=PROMETHEUS_MIMETYPE)
+
+@repo_blueprint.route('/flight/search', methods=['GET'])
+def search_flights():
+    """
+    Flights of one route on one day, e.g.
+    /flight/search?origin_country_id=1&destination_country_id=2&date=2030-01-15.
+    The JSON array is built by Postgres (or from the flight search index) and sent as is.
+    """
+    # The facades import this module, so the facade is imported on first use
+    from facades.facades import AnonymousFacade
+    body = AnonymousFacade().get_flights_by_parameters(*flight_search_request(request.args), as_json=True)
+    return Response(body, mimetype='application/json')
 
 @repo_blueprint.route('/<string:table>/<int:item_id>', methods=['GET'])
 def get_by_id(table,item_id):
-    model = MODEL_MAP.get(table)
-    if not model:
-        return jsonify({"error": f"No table found for {table}"}), 404
-
+    model = model_for(table)
+    version = current_version(table, model, item_id)
+    if is_fresh(request, version):
+        return not_modified(Response, version)
     item = model.get_by_id(item_id)
-    if not item:
-        return jsonify({"error": f"No {table} found with ID {item_id}"}), 404
+    return tagged(jsonify(item_body(model, table, item_id, item)), version)
 
-    return jsonify(item.to_dict())  # Assuming `to_dict` exists on the model
+@repo_blueprint.route('/<string:table>/batch', methods=['GET', 'POST'])
+def get_batch(table):
+    """Many rows by id in one query: GET ?ids=3,1,2 or POST {"ids": [3, 1, 2]}"""
+    model = model_for(table)
+    ids = batch_ids(request.get_json(silent=True) if request.method == 'POST' else request.args.get('ids'))
+    items, missing = model.get_by_ids(ids, read_only=True)
+    return jsonify(batch_body(model, items, missing))
 
 @repo_blueprint.route('/<string:table>', methods=['GET'])
 def get_all(table):
-    model = MODEL_MAP.get(table)
-    airlineByUsername = get_airline_by_username('ELAL')
-    print(airlineByUsername)
-    if not model:
-        return jsonify({"error": f"No table found for {table}"}), 404
-    result = model.get_all()  # If the model is found, call the get_all method
-    if result:
-        return jsonify([item.to_dict() for item in result])  # Assuming `to_dict` method exists
+    model = model_for(table)
+    page = page_request(model, request)
+    version = current_version(table, model)
+    if is_fresh(request, version):
+        return not_modified(Response, version)
+    return tagged(make_response(read_table(model, table, page)), version)
+
+def read_table(model, table, page):
+    """The body of GET /<table>, once the client's copy is known to be stale"""
+    if page.ndjson:
+        return stream_ndjson(model, page)
+    if page.json_agg:
+        return Response(json_agg_body(table, page, *json_page(page.query, page.after, page.limit)),
+                        mimetype='application/json')
+    if page.query.is_plain():
+        # Plain column rows: the page is only serialized, so ORM instances would be wasted work
+        rows = model.get_all(after=page.after, limit=page.limit, read_only=True)
+    else:
+        rows = page.query.rows(page.after, page.limit)
+    return jsonify(page_body(model, table, page, rows))
+
+def current_version(table, model, item_id=None):
+    """
+    Version of one row, or of the whole table, for the ETag. It is read before
+    the rows, so a write landing in between can only make the tag older than
+    the data, never the other way round.
+    """
+    if item_id is None:
+        version = table_version(model.__tablename__)
     else:
-        return jsonify({"error": f"No records found for {table}"}), 404
+        version = row_version(model.__tablename__, item_id)
+    sync_cached_table(table, version)
+    return version
+
+def stream_ndjson(model, page):
+    """
+    Stream every row matching the query as newline-delimited JSON, one line per
+    row, writing each row as soon as it is fetched from the server-side cursor.
+    """
+    serializer = serializer_for(model, page.query.fields)
+    def generate():
+        for row in stream_query(page.query.select(page.after), scalars=False):
+            yield ndjson_line(serializer, row)
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
 
 @repo_blueprint.route('/<string:table>/add', methods=['POST'])
 def add(table):
-    model = MODEL_MAP.get(table)
-    if not model:
-        return jsonify({"error": f"No table found for {table}"}), 404
-    if not request.json:
-        return jsonify({"error": f"No content to add to {table}"}), 202
+    model = model_for(table)
+    body = require_body(request.json, table, "add to")
     try:
-        model.add(request.json)
+        model.add(body)
     except Exception as e:
         return f"{e}", 400
-    return f"{request.json} has been added successfully",201
+    return saved_message(body, "added"), 201
 
 @repo_blueprint.route('/<string:table>/addAll', methods=['POST'])
 def add_all(table):
-    model = MODEL_MAP.get(table)
-    if not model:
-        return jsonify({"error": f"No table found for {table}"}), 404
-    if not request.json:
-        return jsonify({"error": f"No content to add to {table}"}), 202
-    model.add_all(request.json)
-    return f"{request.json} has been added successfully",201
+    model = model_for(table)
+    body = require_body(request.json, table, "add to")
+    bulk = bulk_request(request.args, body)
+    if bulk:
+        report = model.bulk_add(body, chunk_size=bulk.chunk_size, use_copy=bulk.use_copy)
+        return jsonify(report), bulk_status(report)
+    try:
+        model.add_all(body)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return saved_message(body, "added"), 201
 
 @repo_blueprint.route('/<string:table>/update/<int:item_id>', methods=['PUT'])
 def update(table,item_id):
-    model = MODEL_MAP.get(table)
-    if not model:
-        return jsonify({"error": f"No table found for {table}"}), 404
-    if not request.json:
-        return jsonify({"error": f"No content to update to {table}"}), 202
-    result = model.update(item_id,request.json)
-    if not result:
-        return jsonify({"error": "Item not found"}), 404
-    return f"{request.json} has been updated successfully", 200
+    model = model_for(table)
+    body = require_body(request.json, table, "update to")
+    try:
+        updated = model.update(item_id, body)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    if not updated:
+        raise ApiError(404, "Item not found")
+    return saved_message(body, "updated"), 200
+
+@repo_blueprint.route('/<string:table>/<int:item_id>', methods=['PATCH'])
+def patch(table,item_id):
+    model = model_for(table)
+    body = require_body(request.json, table, "update to")
+    try:
+        # Only the columns present in the body are written
+        item = model.patch(item_id, body)
+    except Exception as e:
+        raise ApiError(400, f"{e}")
+    return jsonify(item_dict(item))
 
 @repo_blueprint.route('/<string:table>/<int:item_id>', methods=['DELETE'])
 def remove(table,item_id):
-    model = MODEL_MAP.get(table)
-    if not model:
-        return jsonify({"error": f"No table found for {table}"}), 404
-    item = model.remove(item_id)
-    if not item:
-        return jsonify({"error": "Item not found"}), 404
-    return jsonify(item.to_dict())
+    model = model_for(table)
+    return jsonify(item_dict(model.remove(item_id)))
+
+@repo_blueprint.route('/<string:table>/batch', methods=['DELETE'])
+def remove_batch(table):
+    """Many rows by id in one DELETE ... RETURNING id: ?ids=3,1,2 or a {"ids": [3, 1, 2]} body"""
+    model = model_for(table)
+    ids = batch_ids(request.get_json(silent=True) or request.args.get('ids'))
+    try:
+        deleted = model.remove_by_ids(ids)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    except IntegrityError as e:
+        raise still_referenced(e)
+    return jsonify(deleted_report(deleted, ids))
+
+@repo_blueprint.route('/<string:table>', methods=['DELETE'])
+def remove_where(table):
+    """
+    Every row matching the filters of GET /<table> in one DELETE ... RETURNING id,
+    e.g. DELETE /flight?landing_time__lt=2030-02-01. Rows of other tables go
+    or keep a NULL reference as their foreign keys' ON DELETE rules say.
+    """
+    model = model_for(table)
+    where = delete_filters(model, table, request.args)
+    try:
+        deleted = model.remove_where(*where)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    except IntegrityError as e:
+        raise still_referenced(e)
+    return jsonify(deleted_report(deleted))
 
 
 
@@ -136,56 +236,3 @@ def getFlightsByCustomer(customer):
         return Ticket.get_all_flights_by_customer(customer)
     except Exception as e:
         return f"{e}"
-
-    # calling to our stored procedures:
-
-
-def get_airline_by_username(username):
-    try:
-        with engine.connect() as connection:
-            # Call the stored procedure with input parameters
-            query = text("CALL get_airline_by_username(:username, :airline_id, :airline_name, :country_id, :user_id)")
-
-            # Parameters to pass into the procedure
-            params = {
-                "username": username,
-                "airline_id": None,  # Placeholder for output
-                "airline_name": None,  # Placeholder for output
-                "country_id": None,  # Placeholder for output
-                "user_id": None  # Placeholder for output
-            }
-
-            # Execute the query with the parameters as a dictionary
-            connection.execute(query, params)
-
-            # The output values will be in the params dictionary
-            airline_id = params["airline_id"]
-            airline_name = params["airline_name"]
-            country_id = params["country_id"]
-            user_id = params["user_id"]
-
-            # Return the result as a dictionary
-            return {
-                "airline_id": airline_id,
-                "airline_name": airline_name,
-                "country_id": country_id,
-                "user_id": user_id
-            }
-
-    except Exception as e:
-        return f"Error: {e}"
-
-
-
-# def get_airline_by_username(username):
-#     try:
-#         with engine.connect() as connection:
-#             # Construct the stored procedure call query
-#             query = text("CALL get_airline_by_username(:param0)")
-#             # Execute the query and pass the parameters as a dictionary
-#             result = connection.execute(query, {"param0": username})
-#             # Fetch results if any
-#             return result.fetchall() if result.returns_rows else None
-#     except Exception as e:
-#         print(f"Error: {e}")
-#         raise
\ No newline at end of file
@@ -0,0 +1,174 @@
+import hashlib
+import logging
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from database.database import STORED_PROCEDURES, Base, create_indexes, create_stored_procedures, engine
+from database.versions import versions_metadata
+# Imported for their tables, so Base.metadata describes the whole schema
+from models import administrator, airline_company, country, customer, flight, ticket, user, user_role  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# Any constant works, it only has to be the same for every process migrating this database
+MIGRATION_LOCK_ID = 72410319
+
+# Kept out of Base.metadata so it is not part of the fingerprint it stores
+schema_version = Table(
+    "schema_version", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("applied_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+
+# pg_constraint.confdeltype of each ON DELETE rule
+ON_DELETE_CODES = {"NO ACTION": "a", "RESTRICT": "r", "CASCADE": "c", "SET NULL": "n", "SET DEFAULT": "d"}
+
+FOREIGN_KEY_RULE = text("""
+    SELECT con.conname, con.confdeltype FROM pg_constraint con
+    JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = con.conkey[1]
+    WHERE con.contype = 'f' AND con.conrelid = CAST(:table_name AS regclass) AND a.attname = :column_name
+""")
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+class SchemaConflict(RuntimeError):
+    """The database differs from the models in a way migrate() cannot apply by itself"""
+
+
+def schema_fingerprint():
+    """
+    SHA-256 of the DDL the code expects: every table and index as compiled for
+    the engine's dialect, the version tables, and the text of every stored
+    procedure. Any change to a model, an index or a procedure gives a
+    different fingerprint.
+    """
+    digest = hashlib.sha256()
+    for table in Base.metadata.sorted_tables + versions_metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=engine.dialect)).encode())
+    for procedure in STORED_PROCEDURES:
+        # Indentation of the Python source is not part of the function
+        digest.update(" ".join(procedure.split()).encode())
+    return digest.hexdigest()
+
+
+def stored_fingerprint(connection):
+    """Fingerprint recorded by the last migration, or None on a database never migrated"""
+    try:
+        with connection.begin_nested():
+            return connection.execute(select(schema_version.c.fingerprint).where(schema_version.c.id == 1)).scalar()
+    except ProgrammingError:
+        return None  # no schema_version table yet
+
+
+def sync_columns(connection, tables):
+    """
+    create_all() leaves existing tables alone, so add the columns the models
+    gained since a table was created, and drop NOT NULL where the models allow
+    NULL. Any other difference raises SchemaConflict and needs a migration
+    written by hand: a changed type, a new NOT NULL column without a server
+    default, a column that became NOT NULL, or a NOT NULL column without a
+    default that the models no longer have.
+    """
+    inspector = inspect(connection)
+    dialect = connection.dialect
+    conflicts = []
+    for table in tables:
+        found = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            existing = found.pop(column.name, None)
+            if existing is None:
+                if column.nullable or column.server_default is not None:
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=dialect)}"))
+                    logger.info("Column %s.%s added", table.name, column.name)
+                else:
+                    conflicts.append(f"{table.name}.{column.name} is missing and is NOT NULL without a server default")
+                continue
+            expected_type, found_type = column.type.compile(dialect=dialect), existing["type"].compile(dialect=dialect)
+            if expected_type != found_type:
+                conflicts.append(f"{table.name}.{column.name} is {found_type}, the model says {expected_type}")
+            if column.nullable and not existing["nullable"]:
+                connection.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL"))
+                logger.info("Column %s.%s now allows NULL", table.name, column.name)
+            elif not column.nullable and existing["nullable"]:
+                conflicts.append(f"{table.name}.{column.name} allows NULL, the model says NOT NULL")
+        for name, existing in found.items():
+            if not existing["nullable"] and existing["default"] is None:
+                conflicts.append(f"{table.name}.{name} is not in the model and is NOT NULL without a default")
+    if conflicts:
+        raise SchemaConflict("The database differs from the models:\n  " + "\n  ".join(conflicts))
+
+
+def sync_foreign_keys(connection):
+    """
+    create_all() leaves existing tables alone, so add the foreign keys of
+    columns added by sync_columns, and recreate every foreign key whose
+    ON DELETE rule in the database is not the one of the models
+    """
+    for table in Base.metadata.sorted_tables:
+        for constraint in table.foreign_key_constraints:
+            rule = (constraint.ondelete or "NO ACTION").upper()
+            column = constraint.elements[0].column
+            found = connection.execute(
+                FOREIGN_KEY_RULE, {"table_name": table.name, "column_name": constraint.column_keys[0]}
+            ).first()
+            if found is not None and found.confdeltype == ON_DELETE_CODES[rule]:
+                continue
+            # Postgres' own name for a foreign key of one column
+            name = found.conname if found is not None else f"{table.name}_{constraint.column_keys[0]}_fkey"
+            if found is not None:
+                connection.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{name}"'))
+            connection.execute(text(
+                f'ALTER TABLE {table.name} ADD CONSTRAINT "{name}" '
+                f'FOREIGN KEY ({constraint.column_keys[0]}) REFERENCES {column.table.name} ({column.name}) ON DELETE {rule}'
+            ))
+            logger.info("Foreign key %s now ON DELETE %s", name, rule)
+
+
+def migrate(force=False):
+    """
+    Create the tables, indexes and stored procedures if the database does not
+    have the schema of this code, and record its fingerprint. Runs in one
+    transaction under an advisory lock, so processes migrating at the same time
+    apply it once and the others see it done. Raises SchemaConflict, with
+    nothing applied or recorded, when an existing table cannot be brought to
+    the models' shape. Returns True if DDL ran.
+    """
+    expected = schema_fingerprint()
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        if not force and stored_fingerprint(connection) == expected:
+            logger.info("Schema %s is up to date", expected[:12])
+            return False
+        Base.metadata.create_all(bind=connection, checkfirst=True)
+        versions_metadata.create_all(bind=connection, checkfirst=True)
+        sync_columns(connection, Base.metadata.sorted_tables + versions_metadata.sorted_tables)
+        sync_foreign_keys(connection)
+        create_indexes(bind=connection)
+        create_indexes(bind=connection, tables=versions_metadata.sorted_tables)
+        create_stored_procedures(connection)
+        schema_version.create(bind=connection, checkfirst=True)
+        connection.execute(schema_version.delete())
+        connection.execute(schema_version.insert().values(id=1, fingerprint=expected))
+    logger.info("Schema migrated to %s", expected[:12])
+    return True
+
+
+def check_schema():
+    """Raise SchemaOutOfDate unless the database has the schema of this code; runs no DDL"""
+    expected = schema_fingerprint()
+    with engine.connect() as connection:
+        found = stored_fingerprint(connection)
+    if found != expected:
+        raise SchemaOutOfDate(
+            f"Database schema {found[:12] if found else 'missing'} does not match {expected[:12]}, "
+            f"run python migrate.py"
+        )
@@ -0,0 +1,115 @@
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: without it responses use the stdlib encoder
+    orjson = None
+
+# "orjson" (the default when it is installed) or "flask" for Flask's own provider
+JSON_PROVIDER = os.environ.get("JSON_PROVIDER", "orjson" if orjson else "flask")
+
+# One serializer per model and field list, built on first use
+SERIALIZERS = {}
+
+
+def encode_default(value):
+    """Types neither encoder handles natively; datetimes are written as ISO 8601"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=encode_default, separators=(",", ":")).encode()
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson: datetimes, dates and UUIDs are encoded
+    natively and responses are built from bytes without an intermediate str.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype="application/json")
+
+
+def install_json_provider(app):
+    """Use the provider selected by JSON_PROVIDER for jsonify and request.json"""
+    provider_class = FastJSONProvider if JSON_PROVIDER == "orjson" else DefaultJSONProvider
+    app.json_provider_class = provider_class
+    app.json = provider_class(app)
+
+
+class ModelSerializer:
+    """
+    Turns a model's rows into JSON objects with the same keys as to_dict().
+    Rows are zipped with the field names, so each row costs one dict() call
+    instead of to_dict() attribute lookups, and plain column tuples work as
+    well as ORM instances.
+    """
+
+    def __init__(self, model, fields=None):
+        self.model = model
+        self.fields = tuple(fields) if fields else tuple(column.key for column in model.__table__.columns)
+
+    def columns(self):
+        """Table columns in field order, for select(*serializer.columns())"""
+        return [self.model.__table__.c[field] for field in self.fields]
+
+    def values(self, item):
+        """
+        Column values of an ORM instance. Loaded values are read straight from
+        the instance __dict__, skipping the instrumented attribute descriptors;
+        an expired or deferred column falls back to normal attribute access.
+        """
+        try:
+            return tuple(map(item.__dict__.__getitem__, self.fields))
+        except KeyError:
+            return tuple(getattr(item, field) for field in self.fields)
+
+    def from_row(self, row):
+        return dict(zip(self.fields, row))
+
+    def from_instance(self, item):
+        return self.from_row(self.values(item))
+
+    def from_instances(self, items):
+        from_row, values = self.from_row, self.values
+        return [from_row(values(item)) for item in items]
+
+    def from_rows(self, rows):
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+    def dumps(self, items):
+        """Encode ORM instances as a JSON array"""
+        return dumps_bytes(self.from_instances(items))
+
+
+def serializer_for(model, fields=None):
+    """Serializer for all of the model's columns, or for a projection of them in the given order"""
+    key = (model, tuple(fields) if fields else None)
+    serializer = SERIALIZERS.get(key)
+    if serializer is None:
+        serializer = SERIALIZERS[key] = ModelSerializer(model, fields)
+    return serializer
@@ -0,0 +1,297 @@
+"""
+Version counters of the application tables and of their rows, kept in the
+database so every worker process sees the same values. They back the ETag and
+Last-Modified headers of the read routes.
+
+Writes made through a session are recorded as they are flushed, and Core
+statements that write rows call mark_changed() or mark_deleted(); the versions
+are bumped in the same transaction, right before it commits. Rows changed by
+an ON DELETE rule are not known one by one, so their whole table is marked.
+Every bump takes a new value of one sequence, so a version is never handed out
+twice, not even after a table is emptied and its ids restart.
+
+Each table's counter is split into shards. A transaction bumps a shard no
+other transaction holds, so writers of one table do not queue behind each
+other's commits; it only waits when every shard is taken. The version of a
+table is the sum of its shards' versions, which grows with every commit to any
+of them. A row's entry in row_versions names the shard that wrote it, and
+within a shard versions grow in commit order, which is what lets a reader
+find the rows written since it last looked (see table_state()).
+
+row_versions keeps an entry for every row written since its table's bulk
+version, deleted rows included, at the version of the delete. Marking a whole
+table drops the entries that mark outdates.
+
+Cost on the write path: a transaction that wrote rows runs one statement per
+table, bumping a shard and upserting the written rows (two when every shard
+is taken). On a one-CPU test database benchmarks.version_overhead with 16
+threads measured about 35% fewer writes/sec and a p99 of 95 ms, against 45-55%
+and 140-170 ms when all writers of a table queued on a single counter row.
+"""
+from collections import namedtuple
+from itertools import chain
+
+from sqlalchemy import (BigInteger, Column, DateTime, Index, MetaData, Sequence, SmallInteger, String, Table, event,
+                        text)
+from sqlalchemy.orm import Session
+
+from database.database import get_session
+
+# Created by migrate() and part of the schema fingerprint, but kept out of
+# Base.metadata so emptying the application tables does not reset versions
+versions_metadata = MetaData()
+data_version_seq = Sequence("data_version_seq", metadata=versions_metadata)
+
+# Upper bound for the shards of one table; more concurrent writers than this wait
+VERSION_SHARDS = 16
+
+table_version_shards = Table(
+    "table_version_shards", versions_metadata,
+    Column("table_name", String, primary_key=True),
+    Column("shard", SmallInteger, primary_key=True, autoincrement=False),
+    Column("version", BigInteger, nullable=False),
+    Column("modified_at", DateTime(timezone=True), nullable=False),
+)
+
+# Rows changed without their ids being known (loaded by bulk_insert, or
+# reached by an ON DELETE rule) are all at least at their table's bulk version
+bulk_versions = Table(
+    "bulk_versions", versions_metadata,
+    Column("table_name", String, primary_key=True),
+    Column("version", BigInteger, nullable=False),
+    Column("modified_at", DateTime(timezone=True), nullable=False),
+)
+
+row_versions = Table(
+    "row_versions", versions_metadata,
+    Column("table_name", String, primary_key=True),
+    Column("row_id", BigInteger, primary_key=True),
+    Column("version", BigInteger, nullable=False),
+    Column("modified_at", DateTime(timezone=True), nullable=False),
+    # Shard of table_version_shards the version was taken from
+    Column("shard", SmallInteger, nullable=False, server_default="0"),
+    # Rows of a table written since a version, for the flight search index
+    Index("ix_row_versions_table_version", "table_name", "version"),
+)
+
+# Bump the first shard of the table that no other transaction has locked. The
+# version is taken once the shard is locked, and the lock is held until
+# commit, so a shard's versions grow in commit order
+BUMP_FREE_SHARD = """
+    bumped AS (
+        UPDATE table_version_shards SET version = nextval('data_version_seq'), modified_at = clock_timestamp()
+        WHERE (table_name, shard) = (
+            SELECT table_name, shard FROM table_version_shards WHERE table_name = :table_name
+            LIMIT 1 FOR UPDATE SKIP LOCKED
+        )
+        RETURNING shard, version, modified_at
+    )
+"""
+
+# When every shard is locked, or the table has none yet: bump (or add) the
+# shard of the backend, waiting for it if another transaction holds it
+BUMP_OWN_SHARD = f"""
+    bumped AS (
+        INSERT INTO table_version_shards (table_name, shard, version, modified_at)
+        VALUES (:table_name, pg_backend_pid() % {VERSION_SHARDS}, nextval('data_version_seq'), clock_timestamp())
+        ON CONFLICT (table_name, shard) DO UPDATE
+        SET version = nextval('data_version_seq'), modified_at = clock_timestamp()
+        RETURNING shard, version, modified_at
+    )
+"""
+
+UPSERT_ROWS = """
+    INSERT INTO row_versions (table_name, row_id, version, modified_at, shard)
+    SELECT :table_name, row_id, bumped.version, bumped.modified_at, bumped.shard
+    FROM bumped, unnest(CAST(:row_ids AS BIGINT[])) AS row_id
+    ON CONFLICT (table_name, row_id) DO UPDATE
+    SET version = EXCLUDED.version, modified_at = EXCLUDED.modified_at, shard = EXCLUDED.shard
+"""
+
+BUMP_TABLE = text(f"WITH {BUMP_FREE_SHARD} SELECT shard FROM bumped")
+BUMP_OWN_TABLE = text(f"WITH {BUMP_OWN_SHARD} SELECT shard FROM bumped")
+
+# A shard and the written rows in one round trip
+BUMP_ROWS = text(f"WITH {BUMP_FREE_SHARD} {UPSERT_ROWS}")
+BUMP_OWN_ROWS = text(f"WITH {BUMP_OWN_SHARD} {UPSERT_ROWS}")
+
+# One row per table, so marks of a table are taken in commit order; only bulk
+# loads and deletes with ON DELETE rules wait on it
+MARK_BULK = text("""
+    INSERT INTO bulk_versions (table_name, version, modified_at)
+    VALUES (:table_name, nextval('data_version_seq'), clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE
+    SET version = nextval('data_version_seq'), modified_at = clock_timestamp()
+""")
+
+# Entries older than the bulk version no longer decide any row's version
+PRUNE_BULK = text("""
+    DELETE FROM row_versions WHERE table_name = :table_name
+    AND version < (SELECT version FROM bulk_versions WHERE table_name = :table_name)
+""")
+
+# A row without an entry was never written since its table's bulk version;
+# greatest() skips the NULLs
+ROW_VERSION = text("""
+    SELECT greatest(r.version, b.version) AS version,
+           greatest(r.modified_at, b.modified_at) AS modified_at,
+           (SELECT CAST(sum(s.version) AS BIGINT) FROM table_version_shards s
+            WHERE s.table_name = wanted.table_name) AS table_version
+    FROM (SELECT CAST(:table_name AS VARCHAR) AS table_name) wanted
+    LEFT JOIN bulk_versions b ON b.table_name = wanted.table_name
+    LEFT JOIN row_versions r ON r.table_name = wanted.table_name AND r.row_id = :row_id
+""")
+
+TABLE_VERSION = text("""
+    SELECT CAST(sum(version) AS BIGINT) AS version, max(modified_at) AS modified_at
+    FROM table_version_shards WHERE table_name = :table_name
+""")
+
+# One row per shard, or a single row with a NULL shard when there is none
+TABLE_STATE = text("""
+    SELECT s.shard, s.version, b.version AS bulk_version
+    FROM (SELECT CAST(:table_name AS VARCHAR) AS table_name) wanted
+    LEFT JOIN table_version_shards s ON s.table_name = wanted.table_name
+    LEFT JOIN bulk_versions b ON b.table_name = wanted.table_name
+""")
+
+# Keys in session.info of what the session's transaction changed: the rows
+# written or deleted, {table name: set of ids}, and the tables of which any
+# row may have changed
+CHANGED_ROWS = "changed_rows"
+CHANGED_TABLES = "changed_tables"
+
+# table_version is the version of the whole table, also for a row
+Version = namedtuple("Version", ["etag", "last_modified", "table_version"])
+
+# The counters of a table, for readers that follow its changes: the version
+# of each shard, {shard: version}, and the bulk version
+TableState = namedtuple("TableState", ["versions", "bulk_version"])
+
+
+def mark_changed(session, table_name, ids=()):
+    """Record rows written by a statement the session cannot track itself, to bump on commit"""
+    session.info.setdefault(CHANGED_ROWS, {}).setdefault(table_name, set()).update(ids)
+
+
+def mark_deleted(session, table, ids):
+    """Record rows deleted from table, and the tables its ON DELETE rules may have written to"""
+    if ids:
+        # A deleted row keeps its entry, at the version of the delete
+        mark_changed(session, table.name, ids)
+        session.info.setdefault(CHANGED_TABLES, set()).update(cascaded_tables(table))
+
+
+def cascaded_tables(table):
+    """Names of the tables whose rows deleting from table can delete or change through ON DELETE rules"""
+    found = set()
+    pending = [table]
+    while pending:
+        parent = pending.pop()
+        for child in parent.metadata.sorted_tables:
+            for foreign_key in child.foreign_keys:
+                if foreign_key.column.table is parent and foreign_key.ondelete in ("CASCADE", "SET NULL"):
+                    if child.name not in found and foreign_key.ondelete == "CASCADE":
+                        pending.append(child)
+                    found.add(child.name)
+    return found
+
+
+def bump_versions(session, changed, changed_tables=()):
+    # Tables and rows in a fixed order, so two transactions cannot deadlock on them
+    for table_name in sorted(set(changed) | set(changed_tables)):
+        bump_table(session, table_name, sorted(changed.get(table_name, ())))
+        if table_name in changed_tables:
+            session.execute(MARK_BULK, {"table_name": table_name})
+            session.execute(PRUNE_BULK, {"table_name": table_name})
+
+
+def bump_table(connection, table_name, row_ids=()):
+    """Bump a shard of the table, and the rows row_ids with it"""
+    if row_ids:
+        params = {"table_name": table_name, "row_ids": row_ids}
+        if not connection.execute(BUMP_ROWS, params).rowcount:
+            connection.execute(BUMP_OWN_ROWS, params)
+    elif connection.execute(BUMP_TABLE, {"table_name": table_name}).first() is None:
+        connection.execute(BUMP_OWN_TABLE, {"table_name": table_name})
+
+
+def bump_bulk_version(connection, table_name):
+    """Bump the version of a table and of every row in it, after bulk_insert loaded rows"""
+    bump_table(connection, table_name)
+    connection.execute(MARK_BULK, {"table_name": table_name})
+    connection.execute(PRUNE_BULK, {"table_name": table_name})
+
+
+@event.listens_for(Session, "after_flush")
+def record_flushed_rows(session, flush_context):
+    # The new, dirty and deleted collections still hold what this flush wrote
+    for item in chain(session.new, session.dirty):
+        table = getattr(item, "__table__", None)
+        if table is not None and "id" in table.c:
+            mark_changed(session, table.name, [item.id])
+    for item in session.deleted:
+        table = getattr(item, "__table__", None)
+        if table is not None and "id" in table.c:
+            mark_deleted(session, table, [item.id])
+
+
+@event.listens_for(Session, "before_commit")
+def bump_changed_versions(session):
+    # The commit flushes after this hook, so flush now to see every change
+    session.flush()
+    changed = session.info.pop(CHANGED_ROWS, {})
+    changed_tables = session.info.pop(CHANGED_TABLES, set())
+    if changed or changed_tables:
+        bump_versions(session, changed, changed_tables)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def forget_changed_rows(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(CHANGED_ROWS, None)
+        session.info.pop(CHANGED_TABLES, None)
+
+
+def table_version(table_name):
+    """Version of a whole table, for list responses"""
+    session = get_session()
+    try:
+        row = session.execute(TABLE_VERSION, {"table_name": table_name}).first()
+    finally:
+        session.close()
+    return to_table_version(table_name, row)
+
+
+def to_table_version(table_name, row):
+    """The Version of a TABLE_VERSION row; a table never written is at version 0"""
+    version, modified_at = row if row else (None, None)
+    return Version(f"{table_name}-{version or 0}", modified_at, version or 0)
+
+
+def row_version(table_name, row_id):
+    """Version of one row; a row never written since versions were kept is at version 0"""
+    session = get_session()
+    try:
+        row = session.execute(ROW_VERSION, {"table_name": table_name, "row_id": row_id}).one()
+    finally:
+        session.close()
+    return to_row_version(table_name, row_id, row)
+
+
+def to_row_version(table_name, row_id, row):
+    """The Version of a ROW_VERSION row"""
+    version, modified_at, table = row
+    return Version(f"{table_name}-{row_id}-{version or 0}", modified_at, table or 0)
+
+
+def table_state(connection, table_name):
+    """
+    Shard versions and bulk version of a table. Rows written or deleted since
+    an earlier state are the row_versions entries of each shard above that
+    shard's earlier version (0 for a shard it did not have), unless the bulk
+    version moved too: then rows changed or went away unseen.
+    """
+    rows = connection.execute(TABLE_STATE, {"table_name": table_name}).all()
+    versions = {row.shard: row.version for row in rows if row.shard is not None}
+    return TableState(versions, rows[0].bulk_version or 0)
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, text
+
+from database import procedures
+from database.async_database import async_session_scope
+from database.flight_index import flight_search_index
+from database.queries import TableQuery
+from database.serialization import serializer_for
+from models import async_models
+from models.airline_company import AirlineCompany
+from models.customer import Customer, editable_changes
+
+
+async def call_stored_function(function, *args, as_json=False):
+    """
+    SELECT * FROM fn(...) on the async engine; asyncpg prepares and caches the
+    statement itself. as_json returns the rows as JSON array text, like StoredFunction.json().
+    """
+    placeholders = ", ".join(f":arg{i}" for i in range(len(args)))
+    params = {f"arg{i}": arg for i, arg in enumerate(args)}
+    call = f"{function.name}({placeholders})"
+    async with async_session_scope() as session:
+        if as_json:
+            return (await session.execute(text(procedures.JSON_QUERY.format(call=call)), params)).scalar_one()
+        rows = (await session.execute(text(f"SELECT * FROM {call}"), params)).all()
+    return [function.row_type(*row) for row in rows]
+
+
+class AsyncAnonymousFacade:
+    """
+    The operations of AnonymousFacade for the async app, on AsyncSession.
+    login_token is a LoginToken (id, name, role) or None.
+    """
+
+    def __init__(self, login_token=None):
+        self.login_token = login_token
+
+    def validate_user_role(self, required_role: str) -> bool:
+        """Validate that the user has the required role"""
+        if not self.login_token:
+            return False
+        return self.login_token.role.lower() == required_role.lower()
+
+    async def get_all_flights(self) -> List[Dict]:
+        return await async_models.flights.get_all()
+
+    async def get_flight_by_id(self, flight_id: int) -> Optional[Dict]:
+        return await async_models.flights.get_by_id(flight_id)
+
+    async def get_flights_by_parameters(self, origin_country_id: int,
+                                        destination_country_id: int,
+                                        date: datetime, as_json: bool = False) -> List[Dict]:
+        # Served from memory when the flight search index is enabled and covers the date. The
+        # search can read the version counters or reload the index on the sync engine, so it runs in a thread
+        flights = None
+        if flight_search_index.enabled:
+            flights = await asyncio.to_thread(flight_search_index.search, origin_country_id, destination_country_id, date)
+        if flights is not None:
+            return procedures.rows_json(flights) if as_json else flights
+        return await call_stored_function(
+            procedures.get_flights_by_parameters, origin_country_id, destination_country_id, date, as_json=as_json)
+
+    async def get_all_airlines(self) -> List[Dict]:
+        return await async_models.airline_companies.get_all()
+
+    async def get_airline_by_id(self, airline_id: int) -> Optional[Dict]:
+        return await async_models.airline_companies.get_by_id(airline_id)
+
+    async def get_airline_by_parameters(self, **params) -> List[Dict]:
+        # Filtered in the database; unknown column names raise ValueError
+        query = TableQuery(AirlineCompany, params)
+        async with async_session_scope() as session:
+            rows = (await session.execute(query.select())).all()
+        return serializer_for(AirlineCompany, query.fields).from_rows(rows)
+
+    async def get_all_countries(self) -> List[Dict]:
+        return await async_models.countries.get_all()
+
+    async def get_country_by_id(self, country_id: int) -> Optional[Dict]:
+        return await async_models.countries.get_by_id(country_id)
+
+    async def create_new_user(self, user: Dict) -> Dict:
+        """Create new user (internal usage)"""
+        return await async_models.users.add(user)
+
+    async def add_customer(self, customer: Dict) -> Dict:
+        return await async_models.customers.add(customer)
+
+
+class AsyncCustomerFacade(AsyncAnonymousFacade):
+    """The operations of CustomerFacade for the async app"""
+
+    def __init__(self, login_token=None):
+        super().__init__(login_token)
+        self._customer_id = None
+
+    async def customer_id(self) -> int:
+        """Id of the customer row of the logged-in user, looked up once"""
+        if self._customer_id is None:
+            async with async_session_scope() as session:
+                self._customer_id = (await session.execute(
+                    select(Customer.id).where(Customer.user_id == self.login_token.id))).scalar_one()
+        return self._customer_id
+
+    async def update_customer(self, customer_data: Dict) -> bool:
+        # Same rules as CustomerFacade.update_customer
+        changes = editable_changes(customer_data)
+        return await async_models.customers.patch(await self.customer_id(), changes) is not None
+
+    async def add_ticket(self, flight_id: int) -> bool:
+        """Purchase a ticket for a flight"""
+        # Raises ValueError when the flight has no seats left
+        return await async_models.tickets.book(flight_id, await self.customer_id()) is not None
+
+    async def remove_ticket(self, ticket_id: int) -> bool:
+        """Remove/cancel a purchased ticket, returning its seat to the flight"""
+        return await async_models.tickets.remove(ticket_id) is not None
+
+    async def get_my_tickets(self) -> List[Dict]:
+        """Flights the current customer holds tickets for"""
+        return await async_models.tickets.get_all_flights_by_customer({"user_id": self.login_token.id})
@@ -3,13 +3,17 @@ from business_logic.login_token import LoginToken
 from database.repository import getFlightsByCustomer
 from models.airline_company import AirlineCompany
 from models.country import Country
-from models.customer import Customer
+from models.customer import Customer, editable_changes
 from models.ticket import Ticket
 from models.user import User
 from sqlalchemy import text
 from typing import List, Dict, Optional
 from abc import ABC
-from database.database import Base, SessionLocal
+from database import procedures
+from database.database import Base
+from database.flight_index import flight_search_index
+from database.queries import TableQuery
+from database.serialization import serializer_for
 
 from models.flight import Flight, get_by_destination_country, get_by_origin_country
 
@@ -26,8 +30,8 @@ class FacadeBase(ABC):
     
     def get_flights_by_parameters(self, origin_country_id: int, 
                                 destination_country_id: int, 
-                                date: datetime) -> List[Dict]:
-        """Get flights by search parameters"""
+                                date: datetime, as_json: bool = False) -> List[Dict]:
+        """Get flights by search parameters, or with as_json their JSON array text"""
         pass
     
     def get_all_airlines(self) -> List[Dict]:
@@ -76,17 +80,18 @@ class AnonymousFacade(FacadeBase):
     
     def get_flights_by_parameters(self, origin_country_id: int, 
                                 destination_country_id: int, 
-                                date: datetime) -> List[Dict]:
-        """Implementation of get flights by parameters"""
-        session = SessionLocal()
-        try:
-            result = session.execute(
-                text("SELECT * FROM get_flights_by_parameters(:origin, :destination, :date)"),
-                {"origin": origin_country_id, "destination": destination_country_id, "date": date}
-            )
-            return result.fetchall()
-        finally:
-            session.close()
+                                date: datetime, as_json: bool = False) -> List[Dict]:
+        """
+        Implementation of get flights by parameters. as_json returns the JSON
+        array text instead, built by Postgres, for a response to send as is.
+        """
+        # Served from memory when the flight search index is enabled and covers the date
+        flights = flight_search_index.search(origin_country_id, destination_country_id, date)
+        if flights is not None:
+            return procedures.rows_json(flights) if as_json else flights
+        if as_json:
+            return procedures.get_flights_by_parameters.json(origin_country_id, destination_country_id, date)
+        return procedures.get_flights_by_parameters(origin_country_id, destination_country_id, date)
 
     
     def get_all_airlines(self) -> List[Dict]:
@@ -99,13 +104,9 @@ class AnonymousFacade(FacadeBase):
     
     def get_airline_by_parameters(self, **params) -> List[Dict]:
         """Implementation of get airlines by parameters"""
-        filtered_airlines = self.get_all_airlines()
-        for key, value in params.items():
-            filtered_airlines = [
-                airline for airline in filtered_airlines 
-                if airline.get(key) == value
-            ]
-        return filtered_airlines
+        # Filtered in the database; unknown column names raise ValueError
+        query = TableQuery(AirlineCompany, params)
+        return serializer_for(AirlineCompany, query.fields).from_rows(query.rows())
     
     def get_all_countries(self) -> List[Dict]:
         """Implementation of get all countries"""
@@ -130,24 +131,34 @@ class AnonymousFacade(FacadeBase):
 
 class CustomerFacade(AnonymousFacade):
     """Facade for registered customers"""
+
+    @property
+    def customer_id(self) -> int:
+        """Id of the customer row of the logged-in user, looked up once"""
+        if getattr(self, "_customer_id", None) is None:
+            self._customer_id = Customer.get_id_by_user_id(self.login_token.id)
+        return self._customer_id
     
     def update_customer(self, customer_data: Dict) -> bool:
         """Update customer details"""
-        Customer.update(customer_data)
+        # Only the supplied columns change, the rest of the row is kept; raises ValueError
+        # for columns the customer may not edit
+        return Customer.patch(self.customer_id, editable_changes(customer_data)) is not None
     
     def add_ticket(self, flight_id: int) -> bool:
         """Purchase a ticket for a flight"""
         ticket = {"flight_id": flight_id,
                   "customer_id": self.customer_id}
-        Ticket.add(ticket)
+        # Raises ValueError when the flight has no seats left
+        return Ticket.add(ticket) is not None
     
     def remove_ticket(self, ticket_id: int) -> bool:
-        """Remove/cancel a purchased ticket"""
-        Ticket.remove(ticket_id)
+        """Remove/cancel a purchased ticket, returning its seat to the flight"""
+        return Ticket.remove(ticket_id) is not None
     
     def get_my_tickets(self) -> List[Dict]:
         """Get all tickets for the current customer"""
-        return getFlightsByCustomer(self.customer_id)
+        return getFlightsByCustomer({"user_id": self.login_token.id})
 
 class AirlineFacade(AnonymousFacade):
     """Facade for airline companies"""
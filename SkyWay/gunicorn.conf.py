@@ -0,0 +1,38 @@
+"""
+Production profile of the sync app: pre-forked gunicorn workers running
+threads. Each setting can be overridden on the command line or with
+GUNICORN_CMD_ARGS.
+
+    python migrate.py && gunicorn -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+from database.database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+
+cpu_count = multiprocessing.cpu_count()
+# Processes run Python in parallel, threads overlap the waits on the database
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 * cpu_count + 1))
+worker_class = "gthread"
+# More threads than pooled connections would only queue on the pool
+threads = int(os.environ.get("WEB_THREADS", min(2 * cpu_count, DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+# Import the app once in the master, so workers fork with it loaded and share its memory
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then, so a slow leak cannot grow without bound
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+def post_fork(server, worker):
+    # The master used the engine while preloading (check_schema, the flight index).
+    # Drop the inherited pool without closing it, the master still owns those
+    # connections; the worker opens its own on first use.
+    from database.database import engine
+    engine.dispose(close=False)
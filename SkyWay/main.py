@@ -1,18 +1,78 @@
-from database.database import create_stored_procedures, engine, Base
-from flask import Flask
+from database.database import begin_unit_of_work, end_unit_of_work
+from database.flight_index import flight_search_index
+from database.instrumentation import begin_request_stats, configure_logging, end_request_stats
+from database.metrics import observe_request
+from database.schema import check_schema, migrate
+from database.serialization import install_json_provider
+from flask import Flask, g, jsonify, make_response, request
+from database.handlers import MODEL_MAP
 from database.repository import repo_blueprint
+import logging
+import time
 
+configure_logging()
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
+install_json_provider(app)
 # Register the blueprint with the main app
 app.register_blueprint(repo_blueprint)
+
+# Every model call made while handling a request shares one session and one transaction
+@app.before_request
+def open_unit_of_work():
+    begin_unit_of_work()
+
+@app.teardown_request
+def close_unit_of_work(error=None):
+    # Only reached with an open unit of work when commit_unit_of_work did not run
+    end_unit_of_work(commit=False)
+
+@app.before_request
+def start_query_stats():
+    g.request_started = time.perf_counter()
+    begin_request_stats()
+
+@app.after_request
+def record_request_stats(response):
+    # Statements run while building the response; a streamed body is not counted
+    stats = end_request_stats()
+    if stats is not None:
+        response.headers["X-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time"] = f"{stats.seconds * 1000:.3f}"
+    started = g.get("request_started")
+    if started is not None:
+        # Label by route template and known table only, so clients cannot grow the label set
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        table = (request.view_args or {}).get("table")
+        observe_request(
+            request.method, route, table if table in MODEL_MAP else "", response.status_code,
+            time.perf_counter() - started, stats.seconds if stats else 0.0, stats.count if stats else 0,
+        )
+    return response
+
+# Registered after record_request_stats so it runs before it: Flask calls
+# after_request hooks in reverse order, and the metrics should see a failed commit
+@app.after_request
+def commit_unit_of_work(response):
+    # Commit before the response is sent, so a commit that fails turns into a
+    # 500 instead of a success for a lost write; error responses roll back
+    try:
+        end_unit_of_work(commit=response.status_code < 400)
+    except Exception as e:
+        logger.exception("Commit of %s %s failed", request.method, request.path)
+        return make_response(jsonify({"error": f"The changes could not be saved: {getattr(e, 'orig', None) or e}"}), 500)
+    return response
+
 def create_db():
-    # Create all tables in the database
-    print("Creating database schema...")
-    Base.metadata.create_all(bind=engine, checkfirst=True)
-    create_stored_procedures()
-    print("Database schema created successfully!")
+    # Create the tables, indexes and procedures, unless the database already has this schema
+    if migrate():
+        print("Database schema created successfully!")
 
 # Run the server
 if __name__ == '__main__':
-    create_db()
+    # Serving processes never run DDL, migrate.py does
+    check_schema()
+    if flight_search_index.enabled:
+        # Warm the flight search index before the first request
+        flight_search_index.load()
     app.run(debug=True)
@@ -0,0 +1,21 @@
+"""
+Bring the database schema up to date: tables, indexes and stored procedures.
+Run once per deploy, before starting the servers; they only check the schema.
+
+    python migrate.py          # skip the DDL if the stored fingerprint matches
+    python migrate.py --force  # run it anyway
+"""
+import argparse
+
+from database.instrumentation import configure_logging
+from database.schema import migrate, schema_fingerprint
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--force", action="store_true", help="run the DDL even if the fingerprint matches")
+    args = parser.parse_args()
+    configure_logging()
+    if migrate(force=args.force):
+        print(f"Database schema migrated to {schema_fingerprint()[:12]}")
+    else:
+        print(f"Database schema {schema_fingerprint()[:12]} is up to date")
@@ -1,7 +1,11 @@
+import logging
 from sqlalchemy import Column, select, String, BigInteger, ForeignKey
-from database.database import Base, SessionLocal
+from database.database import Base, get_session
+from database.queries import SetBasedWrites, fetch_by_ids
 
-class Administrator(Base):
+logger = logging.getLogger(__name__)
+
+class Administrator(SetBasedWrites, Base):
     __tablename__ = "administrators"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
@@ -10,28 +14,40 @@ class Administrator(Base):
     user_id = Column(BigInteger, ForeignKey("users.id"), unique=True, nullable=False)
 
     @staticmethod
-    def get_all():
-        session = SessionLocal()
+    def get_all(after=None, limit=None, read_only=False):
+        session = get_session()
         try:
-            stmt = select(Administrator)
+            # read_only: plain column rows, without ORM instances, identity map or change tracking
+            stmt = select(*Administrator.__table__.c) if read_only else select(Administrator)
+            stmt = stmt.order_by(Administrator.id)
+            # Keyset pagination: seek past the last id of the previous page
+            if after is not None:
+                stmt = stmt.where(Administrator.id > after)
+            if limit is not None:
+                stmt = stmt.limit(limit)
             # Execute the query
             result = session.execute(stmt)
             # Fetch all countries
-            return result.scalars().all()
+            return result.all() if read_only else result.scalars().all()
         finally:
             session.close()
 
     @staticmethod
     def get_by_id(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             return session.get(Administrator, id)
         finally:
             session.close()
 
+    @staticmethod
+    def get_by_ids(ids, read_only=False):
+        # One WHERE id = ANY(:ids) query for the whole list; returns (items in the order of ids, missing ids)
+        return fetch_by_ids(Administrator, ids, read_only)
+
     @staticmethod
     def add(itemToAdd):
-        session = SessionLocal()
+        session = get_session()
 
         first_name = itemToAdd.get('first_name')
         last_name = itemToAdd.get('last_name')
@@ -47,14 +63,14 @@ class Administrator(Base):
         except Exception as e:
             # If an error occurs, rollback the session
             session.rollback()
-            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
         finally:
             # Close the session
             session.close()
 
     @staticmethod
     def add_all(listOfItems):
-        session = SessionLocal()
+        session = get_session()
         # Convert the list of dictionaries into the proper objects
         administrators = [Administrator(**item_data) for item_data in listOfItems]
         try:
@@ -69,7 +85,7 @@ class Administrator(Base):
             session.close()
     @staticmethod
     def update(id, updatedItem):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Get the user by ID
             administrator = Administrator.get_by_id(id).to_dict()  # Fetch the user by ID
@@ -86,7 +102,7 @@ class Administrator(Base):
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             return None  # Or handle the exception as needed
 
         finally:
@@ -94,7 +110,7 @@ class Administrator(Base):
 
     @staticmethod
     def remove(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Use select() to fetch the user by ID
             stmt = select(Administrator).filter(Administrator.id == id)
@@ -1,43 +1,83 @@
-from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, select
+import logging
+from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, Index, select
 from sqlalchemy.orm import relationship
-from database.database import Base, SessionLocal
+from database.cache import ReferenceCache
+from database.database import Base, SessionLocal, after_commit, get_session
+from database.flight_index import flight_search_index
+from database.queries import SetBasedWrites, fetch_by_ids
 
-class AirlineCompany(Base):
+logger = logging.getLogger(__name__)
+
+# Airline companies almost never change, so reads are served from an in-process cache
+airline_company_cache = ReferenceCache("airline_company")
+
+class AirlineCompany(SetBasedWrites, Base):
     __tablename__ = "airline_companies"
+    # Cleared when a set-based write commits, see SetBasedWrites
+    reference_cache = airline_company_cache
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     name = Column(String, unique=True, nullable=False)
     country_id = Column(Integer, ForeignKey("countries.id"), nullable=False)
-    user_id = Column(BigInteger, ForeignKey("users.id"), unique=True, nullable=False)
+    user_id = Column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
 
-    # Relationship to the Flight table
-    flights = relationship("Flight", back_populates="airline_company")
+    # Relationship to the Flight table; passive_deletes leaves removing the
+    # flights to ON DELETE CASCADE instead of loading them first
+    flights = relationship("Flight", back_populates="airline_company", passive_deletes=True)
     # Relationship to the User table
     user = relationship("User", back_populates="airline_company")
 
+    # Backs get_by_country_id and the foreign key check when a country is deleted
+    __table_args__ = (
+        Index("ix_airline_companies_country_id", "country_id"),
+    )
+
+    @staticmethod
+    def get_all(after=None, limit=None, read_only=False):
+        key = ("rows" if read_only else "all", after, limit)
+        return airline_company_cache.get_or_load(key, lambda: AirlineCompany._get_all(after, limit, read_only))
+
     @staticmethod
-    def get_all():
+    def _get_all(after=None, limit=None, read_only=False):
+        # Cached objects outlive the request, so they are loaded in a session of their own
         session = SessionLocal()
         try:
-            stmt = select(AirlineCompany)
+            # read_only: plain column rows, without ORM instances, identity map or change tracking
+            stmt = select(*AirlineCompany.__table__.c) if read_only else select(AirlineCompany)
+            stmt = stmt.order_by(AirlineCompany.id)
+            # Keyset pagination: seek past the last id of the previous page
+            if after is not None:
+                stmt = stmt.where(AirlineCompany.id > after)
+            if limit is not None:
+                stmt = stmt.limit(limit)
             # Execute the query
             result = session.execute(stmt)
             # Fetch all airlines
-            return result.scalars().all()
+            return result.all() if read_only else result.scalars().all()
         finally:
             session.close()
 
     @staticmethod
     def get_by_id(id):
+        return airline_company_cache.get_or_load(("id", id), lambda: AirlineCompany._get_by_id(id))
+
+    @staticmethod
+    def _get_by_id(id):
+        # Cached objects outlive the request, so they are loaded in a session of their own
         session = SessionLocal()
         try:
             return session.get(AirlineCompany, id)
         finally:
             session.close()
 
+    @staticmethod
+    def get_by_ids(ids, read_only=False):
+        # One WHERE id = ANY(:ids) query, not cached; returns (items in the order of ids, missing ids)
+        return fetch_by_ids(AirlineCompany, ids, read_only)
+
     @staticmethod
     def add(itemToAdd):
-        session = SessionLocal()
+        session = get_session()
 
         name = itemToAdd.get('name')
         country_id =itemToAdd.get('country_id')
@@ -50,10 +90,11 @@ class AirlineCompany(Base):
             session.add(airline_company)
             # Commit the transaction
             session.commit()
+            after_commit(airline_company_cache.invalidate)
         except Exception as e:
             # If an error occurs, rollback the session
             session.rollback()
-            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
             raise
         finally:
             # Close the session
@@ -61,7 +102,7 @@ class AirlineCompany(Base):
 
     @staticmethod
     def add_all(listOfItems):
-        session = SessionLocal()
+        session = get_session()
         # Convert the list of dictionaries into the proper objects
         airline_companies = [AirlineCompany(**item_data) for item_data in listOfItems]
         try:
@@ -69,6 +110,7 @@ class AirlineCompany(Base):
             session.add_all(airline_companies)
             # Commit the transaction
             session.commit()
+            after_commit(airline_company_cache.invalidate)
         except Exception as e:
             session.rollback()  # Rollback in case of error
             raise e
@@ -77,7 +119,7 @@ class AirlineCompany(Base):
 
     @staticmethod
     def update(id, updatedItem):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Get the item by id
             airline_company = AirlineCompany.get_by_id(id).to_dict()  # Fetch the item by id
@@ -90,11 +132,12 @@ class AirlineCompany(Base):
             # Step 3: Replace the old item object with the new one
             session.merge(new_item)  # `merge` will update the existing record
             session.commit()
+            after_commit(airline_company_cache.invalidate)
             return new_item  # Return the updated item
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             return None  # Or handle the exception as needed
 
         finally:
@@ -102,7 +145,7 @@ class AirlineCompany(Base):
 
     @staticmethod
     def remove(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Use select() to fetch the item by id
             stmt = select(AirlineCompany).filter(AirlineCompany.id == id)
@@ -113,19 +156,29 @@ class AirlineCompany(Base):
             session.delete(airline_company)
             # Step 3: Commit the transaction
             session.commit()
+            after_commit(airline_company_cache.invalidate)
+            # Its flights were removed with it by ON DELETE CASCADE
+            after_commit(flight_search_index.invalidate)
             return airline_company  # Return the deleted item or a success response
         finally:
             session.close()
 
+    @classmethod
+    def remove_where(cls, *conditions):
+        ids = super().remove_where(*conditions)
+        # Their flights were removed with them, so rebuild the search index on its next use
+        after_commit(flight_search_index.invalidate)
+        return ids
+
     @staticmethod
     def get_by_country_id(country_id):
-        session = SessionLocal()
+        session = get_session()
         try:
             stmt = select(AirlineCompany).where(AirlineCompany.country_id == country_id)
             result = session.execute(stmt)
             return result.scalars().all()
         except Exception as e:
-            print(f"{e}")
+            logger.error(f"{e}")
             raise
         finally:
             session.close()
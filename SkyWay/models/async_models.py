@@ -0,0 +1,294 @@
+import asyncio
+import logging
+
+from sqlalchemy import delete, select, update
+
+from database.async_database import AsyncSessionLocal, async_after_commit, async_session_scope
+from database.bulk import BULK_CHUNK_SIZE
+from database.flight_index import flight_search_index
+from database.queries import check_columns, coerce_values, in_id_order, select_by_ids
+from database.serialization import serializer_for
+from database.versions import cascaded_tables, mark_changed, mark_deleted
+from models.administrator import Administrator
+from models.airline_company import AirlineCompany, airline_company_cache
+from models.country import Country, country_cache
+from models.customer import Customer
+from models.flight import Flight, day_range
+from models.ticket import (BOOK_SEAT, CANCEL_TICKET, Ticket, check_ticket_changes, mark_booked, mark_cancelled,
+                           ticket_update_changes)
+from models.user import User
+from models.user_role import UserRole, user_role_cache
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncModel:
+    """
+    Async versions of a model's data-access methods (get_all, get_by_id, add,
+    add_all, bulk_add, update, patch, remove) on AsyncSession and asyncpg,
+    for the async app. Inside a request they share its unit of work.
+    """
+
+    def __init__(self, model, cache=None):
+        self.model = model
+        self.table = model.__table__
+        # Reference cache of the sync model, read and cleared the same way
+        self.cache = cache
+        # Tables a delete can reach through ON DELETE rules
+        self.cascades = cascaded_tables(self.table)
+
+    async def get_all(self, after=None, limit=None, read_only=False):
+        if self.cache is None:
+            async with async_session_scope() as session:
+                return await self._get_all(session, after, limit, read_only)
+        key = ("rows" if read_only else "all", after, limit)
+        return await self.cache.get_or_load_async(key, lambda: self._load(self._get_all, after, limit, read_only))
+
+    async def _get_all(self, session, after=None, limit=None, read_only=False):
+        # read_only: plain column rows, without ORM instances, identity map or change tracking
+        stmt = select(*self.table.c) if read_only else select(self.model)
+        stmt = stmt.order_by(self.table.c.id)
+        # Keyset pagination: seek past the last id of the previous page
+        if after is not None:
+            stmt = stmt.where(self.table.c.id > after)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        result = await session.execute(stmt)
+        return result.all() if read_only else result.scalars().all()
+
+    async def get_by_id(self, id):
+        if self.cache is None:
+            async with async_session_scope() as session:
+                return await session.get(self.model, id)
+        return await self.cache.get_or_load_async(("id", id), lambda: self._load(self._get_by_id, id))
+
+    async def _get_by_id(self, session, id):
+        return await session.get(self.model, id)
+
+    async def get_by_ids(self, ids, read_only=False):
+        # One WHERE id = ANY(:ids) query, not cached; returns (items in the order of ids, missing ids)
+        async with async_session_scope() as session:
+            result = await session.execute(select_by_ids(self.model, ids, read_only))
+            rows = result.all() if read_only else result.scalars().all()
+        return in_id_order(rows, ids)
+
+    async def _load(self, query, *args):
+        # Cached objects outlive the request, so they are loaded in a session of their own
+        async with AsyncSessionLocal() as session:
+            return await query(session, *args)
+
+    async def add(self, itemToAdd):
+        values = {key: itemToAdd.get(key) for key in self.table.columns.keys() if key != "id"}
+        # asyncpg binds values as they are, so JSON strings are converted to the column types first
+        item = self.model(**coerce_values(self.table, values))
+        async with async_session_scope() as session:
+            session.add(item)
+            await session.flush()
+        self.written([item])
+        return item
+
+    async def add_all(self, listOfItems):
+        items = [self.model(**coerce_values(self.table, item_data)) for item_data in listOfItems]
+        async with async_session_scope() as session:
+            session.add_all(items)
+            await session.flush()
+        self.written(items)
+        return items
+
+    async def bulk_add(self, listOfItems, chunk_size=BULK_CHUNK_SIZE, use_copy=False):
+        # COPY needs psycopg2, so bulk loads run on the sync engine in a worker thread
+        return await asyncio.to_thread(self.model.bulk_add, listOfItems, chunk_size, use_copy)
+
+    async def update(self, id, updatedItem):
+        try:
+            return await self.patch(id, updatedItem)
+        except Exception as e:
+            logger.error(f"Error updating {self.table.name}: {e}")
+            return None
+
+    async def patch(self, id, changes):
+        """
+        Partial update: only the supplied columns are written, in one
+        UPDATE ... RETURNING round trip. Returns the updated item, or None if not found.
+        """
+        check_columns(self.table, changes)
+        if not changes:
+            raise ValueError("No columns to update")
+        changes = coerce_values(self.table, changes)
+        async with async_session_scope() as session:
+            stmt = update(self.table).where(self.table.c.id == id).values(**changes).returning(*self.table.c)
+            row = (await session.execute(stmt)).mappings().first()
+            if row:
+                mark_changed(session, self.table.name, [id])
+        if not row:
+            return None  # item not found
+        item = self.model(**row)
+        self.written([item])
+        return item
+
+    async def remove(self, id):
+        async with async_session_scope() as session:
+            stmt = delete(self.table).where(self.table.c.id == id).returning(*self.table.c)
+            row = (await session.execute(stmt)).mappings().first()
+            if row:
+                mark_deleted(session, self.table, [id])
+        if not row:
+            return None  # item not found
+        item = self.model(**row)
+        self.removed(item)
+        return item
+
+    async def remove_by_ids(self, ids):
+        # One DELETE ... RETURNING id either way, so the set-based deletes of the
+        # sync model run on the sync engine in a worker thread, as bulk_add does
+        return await asyncio.to_thread(self.model.remove_by_ids, ids)
+
+    async def remove_where(self, *conditions):
+        return await asyncio.to_thread(self.model.remove_where, *conditions)
+
+    def written(self, items):
+        """Hook run after items were added or changed"""
+        if self.cache is not None:
+            async_after_commit(self.cache.invalidate)
+
+    def removed(self, item):
+        """Hook run after an item was deleted"""
+        self.written([item])
+        # ON DELETE CASCADE may have taken airline companies and flights with it
+        if "airline_companies" in self.cascades:
+            async_after_commit(airline_company_cache.invalidate)
+        if "flights" in self.cascades:
+            async_after_commit(flight_search_index.invalidate)
+
+
+class AsyncFlight(AsyncModel):
+    """Flight data access, keeping the in-memory flight search index in sync"""
+
+    async def bulk_add(self, listOfItems, chunk_size=BULK_CHUNK_SIZE, use_copy=False):
+        report = await super().bulk_add(listOfItems, chunk_size, use_copy)
+        async_after_commit(flight_search_index.invalidate)
+        return report
+
+    def written(self, items):
+        indexed = flight_search_index.snapshot(items)
+        async_after_commit(lambda: flight_search_index.put_all(indexed))
+
+    def removed(self, item):
+        async_after_commit(lambda: flight_search_index.discard(item.id))
+
+    async def _search(self, condition, read_only):
+        stmt = (select(*self.table.c) if read_only else select(Flight)).where(*condition)
+        async with async_session_scope() as session:
+            result = await session.execute(stmt)
+            return result.all() if read_only else result.scalars().all()
+
+    async def get_by_origin_country(self, country_id, read_only=False):
+        return await self._search([Flight.origin_country_id == country_id], read_only)
+
+    async def get_by_destination_country(self, country_id, read_only=False):
+        return await self._search([Flight.destination_country_id == country_id], read_only)
+
+    async def get_by_departure_date(self, date, read_only=False):
+        # A range on the raw column, so its index is used
+        day_start, day_end = day_range(date)
+        return await self._search([Flight.departure_time >= day_start, Flight.departure_time < day_end], read_only)
+
+    async def get_by_landing_date(self, date, read_only=False):
+        day_start, day_end = day_range(date)
+        return await self._search([Flight.landing_time >= day_start, Flight.landing_time < day_end], read_only)
+
+
+class AsyncTicket(AsyncModel):
+    """Ticket data access: adding and removing a ticket also moves the flight's seat count"""
+
+    async def add(self, itemToAdd):
+        return await self.book(itemToAdd.get('flight_id'), itemToAdd.get('customer_id'))
+
+    async def book(self, flight_id, customer_id):
+        # Reserve the seat and insert the ticket in one statement, as Ticket.book does
+        async with async_session_scope() as session:
+            row = (await session.execute(BOOK_SEAT, {"flight_id": flight_id, "customer_id": customer_id})).first()
+            if row:
+                mark_booked(session, flight_id, row.id)
+        if not row:
+            raise ValueError(f"No seats left on flight {flight_id}")
+        async_after_commit(lambda: flight_search_index.set_remaining_tickets(flight_id, row.remaining_tickets))
+        return Ticket(id=row.id, flight_id=flight_id, customer_id=customer_id)
+
+    async def add_all(self, listOfItems):
+        # Every ticket gets a seat or none is booked, as Ticket.add_all does
+        booked = []
+        async with async_session_scope() as session:
+            # Flights in id order, so two batches cannot deadlock on their rows
+            for item in sorted(listOfItems, key=lambda item: item.get('flight_id')):
+                flight_id = item.get('flight_id')
+                params = {"flight_id": flight_id, "customer_id": item.get('customer_id')}
+                row = (await session.execute(BOOK_SEAT, params)).first()
+                if not row:
+                    raise ValueError(f"No seats left on flight {flight_id}")
+                mark_booked(session, flight_id, row.id)
+                booked.append((row, flight_id, item.get('customer_id')))
+        seats = {flight_id: row.remaining_tickets for row, flight_id, _ in booked}
+        def update_index():
+            for flight_id, remaining_tickets in seats.items():
+                flight_search_index.set_remaining_tickets(flight_id, remaining_tickets)
+        async_after_commit(update_index)
+        return [Ticket(id=row.id, flight_id=flight_id, customer_id=customer_id) for row, flight_id, customer_id in booked]
+
+    async def update(self, id, updatedItem):
+        current = await self.get_by_id(id)
+        if current is None:
+            return None
+        # Raised here, as update() turns the errors of patch() into None
+        return await super().update(id, ticket_update_changes(current, updatedItem))
+
+    async def patch(self, id, changes):
+        check_ticket_changes(changes)
+        return await super().patch(id, changes)
+
+    async def remove(self, id):
+        # Delete the ticket and give its seat back to the flight in one statement
+        async with async_session_scope() as session:
+            row = (await session.execute(CANCEL_TICKET, {"id": id})).first()
+            if row:
+                mark_cancelled(session, [row])
+        if not row:
+            return None  # item not found
+        if row.remaining_tickets is not None:
+            async_after_commit(lambda: flight_search_index.set_remaining_tickets(row.flight_id, row.remaining_tickets))
+        return Ticket(id=row.id, flight_id=row.flight_id, customer_id=row.customer_id)
+
+    async def get_all_flights_by_customer(self, customer):
+        async with async_session_scope() as session:
+            customer_id = (await session.execute(
+                select(Customer.id).where(Customer.user_id == customer.get('user_id')))).scalars().first()
+            if customer_id is None:
+                raise ValueError(f"No customer found with user_id: {customer.get('user_id')}")
+            flights = (await session.execute(
+                select(*Flight.__table__.c)
+                .join(Ticket, Flight.id == Ticket.flight_id)
+                .where(Ticket.customer_id == customer_id)
+            )).all()
+        return serializer_for(Flight).from_rows(flights)
+
+
+administrators = AsyncModel(Administrator)
+airline_companies = AsyncModel(AirlineCompany, airline_company_cache)
+countries = AsyncModel(Country, country_cache)
+customers = AsyncModel(Customer)
+flights = AsyncFlight(Flight)
+tickets = AsyncTicket(Ticket)
+users = AsyncModel(User)
+user_roles = AsyncModel(UserRole, user_role_cache)
+
+# Async counterpart of each model
+ASYNC_MODELS = {
+    Administrator: administrators,
+    AirlineCompany: airline_companies,
+    Country: countries,
+    Customer: customers,
+    Flight: flights,
+    Ticket: tickets,
+    User: users,
+    UserRole: user_roles,
+}
@@ -1,9 +1,19 @@
+import logging
 from sqlalchemy import Column, Integer, String, select
 from sqlalchemy.orm import relationship
-from database.database import Base, SessionLocal
+from database.cache import ReferenceCache
+from database.database import Base, SessionLocal, after_commit, get_session
+from database.queries import SetBasedWrites, fetch_by_ids
 
-class Country(Base):
+logger = logging.getLogger(__name__)
+
+# Countries almost never change, so reads are served from an in-process cache
+country_cache = ReferenceCache("country")
+
+class Country(SetBasedWrites, Base):
     __tablename__ = "countries"
+    # Cleared when a set-based write commits, see SetBasedWrites
+    reference_cache = country_cache
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, unique=True, nullable=False)
@@ -13,28 +23,51 @@ class Country(Base):
     destination_flights = relationship("Flight", foreign_keys="[Flight.destination_country_id]", back_populates="destination_country")
 
     @staticmethod
-    def get_all():
+    def get_all(after=None, limit=None, read_only=False):
+        key = ("rows" if read_only else "all", after, limit)
+        return country_cache.get_or_load(key, lambda: Country._get_all(after, limit, read_only))
+
+    @staticmethod
+    def _get_all(after=None, limit=None, read_only=False):
+        # Cached objects outlive the request, so they are loaded in a session of their own
         session = SessionLocal()
         try:
-            stmt = select(Country)
+            # read_only: plain column rows, without ORM instances, identity map or change tracking
+            stmt = select(*Country.__table__.c) if read_only else select(Country)
+            stmt = stmt.order_by(Country.id)
+            # Keyset pagination: seek past the last id of the previous page
+            if after is not None:
+                stmt = stmt.where(Country.id > after)
+            if limit is not None:
+                stmt = stmt.limit(limit)
             # Execute the query
             result = session.execute(stmt)
             # Fetch all countries
-            return result.scalars().all()
+            return result.all() if read_only else result.scalars().all()
         finally:
             session.close()
 
     @staticmethod
     def get_by_id(id):
+        return country_cache.get_or_load(("id", id), lambda: Country._get_by_id(id))
+
+    @staticmethod
+    def _get_by_id(id):
+        # Cached objects outlive the request, so they are loaded in a session of their own
         session = SessionLocal()
         try:
             return session.get(Country, id)
         finally:
             session.close()
 
+    @staticmethod
+    def get_by_ids(ids, read_only=False):
+        # One WHERE id = ANY(:ids) query, not cached; returns (items in the order of ids, missing ids)
+        return fetch_by_ids(Country, ids, read_only)
+
     @staticmethod
     def add(itemToAdd):
-        session = SessionLocal()
+        session = get_session()
 
         name = itemToAdd.get('name')
 
@@ -45,17 +78,18 @@ class Country(Base):
             session.add(country)
             # Commit the transaction
             session.commit()
+            after_commit(country_cache.invalidate)
         except Exception as e:
             # If an error occurs, rollback the session
             session.rollback()
-            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
         finally:
             # Close the session
             session.close()
 
     @staticmethod
     def add_all(listOfItems):
-        session = SessionLocal()
+        session = get_session()
         # Convert the list of dictionaries into the proper objects
         countries = [Country(**item_data) for item_data in listOfItems]
         try:
@@ -63,6 +97,7 @@ class Country(Base):
             session.add_all(countries)
             # Commit the transaction
             session.commit()
+            after_commit(country_cache.invalidate)
         except Exception as e:
             session.rollback()  # Rollback in case of error
             raise e
@@ -70,7 +105,7 @@ class Country(Base):
             session.close()
     @staticmethod
     def update(id, updatedItem):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Get the item by id
             country = Country.get_by_id(id).to_dict()  # Fetch the item by id
@@ -83,11 +118,12 @@ class Country(Base):
             # Step 3: Replace the old item object with the new one
             session.merge(new_item)  # `merge` will update the existing record
             session.commit()
+            after_commit(country_cache.invalidate)
             return new_item  # Return the updated item
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             return None  # Or handle the exception as needed
 
         finally:
@@ -95,7 +131,7 @@ class Country(Base):
 
     @staticmethod
     def remove(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Use select() to fetch the item by id
             stmt = select(Country).filter(Country.id == id)
@@ -106,6 +142,7 @@ class Country(Base):
             session.delete(country)
             # Step 3: Commit the transaction
             session.commit()
+            after_commit(country_cache.invalidate)
             return country  # Return the deleted item or a success response
         finally:
             session.close()
@@ -1,7 +1,22 @@
+import logging
 from sqlalchemy import Column, BigInteger, String, ForeignKey, select
-from database.database import Base, SessionLocal
+from database.database import Base, get_session
+from database.queries import SetBasedWrites, fetch_by_ids
 
-class Customer(Base):
+logger = logging.getLogger(__name__)
+
+# Columns a customer may change on their own row; id and user_id tie the row to its login
+EDITABLE_COLUMNS = ("first_name", "last_name", "address", "phone_no", "credit_card_no")
+
+
+def editable_changes(changes):
+    """The changes a customer may make to their own row; raises ValueError on any other column"""
+    rejected = set(changes) - set(EDITABLE_COLUMNS)
+    if rejected:
+        raise ValueError(f"A customer cannot change {', '.join(sorted(rejected))}")
+    return changes
+
+class Customer(SetBasedWrites, Base):
     __tablename__ = "customers"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
@@ -14,28 +29,48 @@ class Customer(Base):
 
 
     @staticmethod
-    def get_all():
-        session = SessionLocal()
+    def get_all(after=None, limit=None, read_only=False):
+        session = get_session()
         try:
-            stmt = select(Customer)
+            # read_only: plain column rows, without ORM instances, identity map or change tracking
+            stmt = select(*Customer.__table__.c) if read_only else select(Customer)
+            stmt = stmt.order_by(Customer.id)
+            # Keyset pagination: seek past the last id of the previous page
+            if after is not None:
+                stmt = stmt.where(Customer.id > after)
+            if limit is not None:
+                stmt = stmt.limit(limit)
             # Execute the query
             result = session.execute(stmt)
             # Fetch all customers
-            return result.scalars().all()
+            return result.all() if read_only else result.scalars().all()
         finally:
             session.close()
 
     @staticmethod
     def get_by_id(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             return session.get(Customer, id)
         finally:
             session.close()
 
+    @staticmethod
+    def get_id_by_user_id(user_id):
+        session = get_session()
+        try:
+            return session.execute(select(Customer.id).where(Customer.user_id == user_id)).scalar()
+        finally:
+            session.close()
+
+    @staticmethod
+    def get_by_ids(ids, read_only=False):
+        # One WHERE id = ANY(:ids) query for the whole list; returns (items in the order of ids, missing ids)
+        return fetch_by_ids(Customer, ids, read_only)
+
     @staticmethod
     def add(itemToAdd):
-        session = SessionLocal()
+        session = get_session()
 
         first_name = itemToAdd.get('first_name')
         last_name = itemToAdd.get('last_name')
@@ -49,14 +84,13 @@ class Customer(Base):
             customer = Customer(first_name=first_name,last_name=last_name,address=address,
                                 phone_no=phone_no,credit_card_no=credit_card_no,user_id=user_id)
             # Add the item to the session
-            print(f"the customer to add is: {customer}")
             session.add(customer)
             # Commit the transaction
             session.commit()
         except Exception as e:
             # If an error occurs, rollback the session
             session.rollback()
-            print(f"ERROR ACCURED HERE, CHECK IT OUT: {e}")
+            logger.error(f"ERROR ACCURED HERE, CHECK IT OUT: {e}")
             raise
         finally:
             # Close the session
@@ -64,7 +98,7 @@ class Customer(Base):
 
     @staticmethod
     def add_all(listOfItems):
-        session = SessionLocal()
+        session = get_session()
         # Convert the list of dictionaries into the proper objects
         customers = [Customer(**item_data) for item_data in listOfItems]
         try:
@@ -80,7 +114,7 @@ class Customer(Base):
 
     @staticmethod
     def update(id, updatedItem):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Get the item by id
             customer = Customer.get_by_id(id).to_dict()  # Fetch the item by id
@@ -97,7 +131,7 @@ class Customer(Base):
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             raise # Or handle the exception as needed
 
         finally:
@@ -105,7 +139,7 @@ class Customer(Base):
 
     @staticmethod
     def remove(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Use select() to fetch the item by id
             stmt = select(Customer).filter(Customer.id == id)
@@ -119,7 +153,7 @@ class Customer(Base):
             return customer  # Return the deleted item or a success response
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error deleting customer: {e}")
+            logger.error(f"Error deleting customer: {e}")
             raise
         finally:
             session.close()
@@ -1,13 +1,20 @@
-from sqlalchemy import Column, BigInteger, Integer, DateTime, ForeignKey,select, func
+import logging
+from sqlalchemy import Column, BigInteger, Integer, DateTime, ForeignKey, Index, select
 from sqlalchemy.orm import relationship
-from database.database import Base, SessionLocal
-from datetime import datetime
+from database.bulk import BULK_CHUNK_SIZE
+from database.database import Base, after_commit, get_session
+from database.queries import SetBasedWrites, fetch_by_ids
+from database.flight_index import flight_search_index
+from datetime import datetime, time, timedelta
 
-class Flight(Base):
+logger = logging.getLogger(__name__)
+
+class Flight(SetBasedWrites, Base):
     __tablename__ = "flights"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    airline_company_id = Column(BigInteger, ForeignKey("airline_companies.id"), nullable=False)
+    # Removing an airline removes its flights in the database, see AirlineCompany.flights
+    airline_company_id = Column(BigInteger, ForeignKey("airline_companies.id", ondelete="CASCADE"), nullable=False)
     origin_country_id = Column(Integer, ForeignKey("countries.id"), nullable=False)
     destination_country_id = Column(Integer, ForeignKey("countries.id"), nullable=False)
     departure_time = Column(DateTime, nullable=False)
@@ -21,30 +28,51 @@ class Flight(Base):
     # Relationship to AirlineCompany table
     airline_company = relationship("AirlineCompany", back_populates="flights")
 
+    # Indexes backing the flight searches and the stored procedures, kept in sync by create_indexes()
+    __table_args__ = (
+        Index("ix_flights_route_departure", "origin_country_id", "destination_country_id", "departure_time"),
+        Index("ix_flights_destination_landing", "destination_country_id", "landing_time"),
+        Index("ix_flights_airline_company_id", "airline_company_id"),
+        Index("ix_flights_departure_time", "departure_time"),
+        Index("ix_flights_landing_time", "landing_time"),
+    )
+
 
     @staticmethod
-    def get_all():
-        session = SessionLocal()
+    def get_all(after=None, limit=None, read_only=False):
+        session = get_session()
         try:
-            stmt = select(Flight)
+            # read_only: plain column rows, without ORM instances, identity map or change tracking
+            stmt = select(*Flight.__table__.c) if read_only else select(Flight)
+            stmt = stmt.order_by(Flight.id)
+            # Keyset pagination: seek past the last id of the previous page
+            if after is not None:
+                stmt = stmt.where(Flight.id > after)
+            if limit is not None:
+                stmt = stmt.limit(limit)
             # Execute the query
             result = session.execute(stmt)
             # Fetch all customers
-            return result.scalars().all()
+            return result.all() if read_only else result.scalars().all()
         finally:
             session.close()
 
     @staticmethod
     def get_by_id(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             return session.get(Flight, id)
         finally:
             session.close()
 
+    @staticmethod
+    def get_by_ids(ids, read_only=False):
+        # One WHERE id = ANY(:ids) query for the whole list; returns (items in the order of ids, missing ids)
+        return fetch_by_ids(Flight, ids, read_only)
+
     @staticmethod
     def add(itemToAdd):
-        session = SessionLocal()
+        session = get_session()
 
         airline_company_id = itemToAdd.get("airline_company_id")
         origin_country_id = itemToAdd.get("origin_country_id")
@@ -64,12 +92,16 @@ class Flight(Base):
 
             # Add the item to the session
             session.add(flight)
+            session.flush()
+            # Take the search index row before the commit expires the object
+            indexed = flight_search_index.snapshot([flight])
             # Commit the transaction
             session.commit()
+            after_commit(lambda: flight_search_index.put_all(indexed))
         except Exception as e:
             # If an error occurs, rollback the session
             session.rollback()
-            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
             raise
         finally:
             # Close the session
@@ -77,23 +109,34 @@ class Flight(Base):
 
     @staticmethod
     def add_all(listOfItems):
-        session = SessionLocal()
+        session = get_session()
         # Convert the list of dictionaries into the proper objects
         flights = [Flight(**item_data) for item_data in listOfItems]
         try:
             # Add all items at once
             session.add_all(flights)
+            session.flush()
+            # Take the search index rows before the commit expires the objects
+            indexed = flight_search_index.snapshot(flights)
             # Commit the transaction
             session.commit()
+            after_commit(lambda: flight_search_index.put_all(indexed))
         except Exception as e:
             session.rollback()  # Rollback in case of error
             raise e
         finally:
             session.close()
 
+    @classmethod
+    def bulk_add(cls, listOfItems, chunk_size=BULK_CHUNK_SIZE, use_copy=False):
+        report = super().bulk_add(listOfItems, chunk_size, use_copy)
+        # Bulk rows are not snapshotted, so rebuild the search index on its next use
+        after_commit(flight_search_index.invalidate)
+        return report
+
     @staticmethod
     def update(id, updatedItem):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Get the item by id
             flight = Flight.get_by_id(id).to_dict()  # Fetch the item by id
@@ -104,21 +147,32 @@ class Flight(Base):
             new_item = Flight(**updatedItem)
             new_item.id = flight.get('id')  # Keep the original ID of the user
             # Step 3: Replace the old item object with the new one
-            session.merge(new_item)  # `merge` will update the existing record
+            merged = session.merge(new_item)  # `merge` will update the existing record
+            session.flush()
+            indexed = flight_search_index.snapshot([merged])
             session.commit()
+            after_commit(lambda: flight_search_index.put_all(indexed))
             return new_item  # Return the updated item
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             return None  # Or handle the exception as needed
 
         finally:
             session.close()
 
+    @classmethod
+    def patch(cls, id, changes):
+        flight = super().patch(id, changes)
+        if flight is not None:
+            indexed = flight_search_index.snapshot([flight])
+            after_commit(lambda: flight_search_index.put_all(indexed))
+        return flight
+
     @staticmethod
     def remove(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Use select() to fetch the item by id
             stmt = select(Flight).filter(Flight.id == id)
@@ -129,10 +183,24 @@ class Flight(Base):
             session.delete(flight)
             # Step 3: Commit the transaction
             session.commit()
+            after_commit(lambda: flight_search_index.discard(flight.id))
             return flight  # Return the deleted item or a success response
         finally:
             session.close()
 
+    @classmethod
+    def remove_where(cls, *conditions):
+        ids = super().remove_where(*conditions)
+        # Their tickets were removed with them by ON DELETE CASCADE
+        after_commit(lambda: flight_search_index.discard_all(ids))
+        return ids
+
+    @staticmethod
+    def remove_landed_before(date):
+        """Remove every flight that has landed before the given ISO date, with its tickets"""
+        day_start, _ = day_range(date)
+        return Flight.remove_where(Flight.landing_time < min(day_start, datetime.now()))
+
     def to_dict(self):
         """
         Convert the model instance into a dictionary.
@@ -148,62 +216,71 @@ class Flight(Base):
         }
 
 
-def get_by_origin_country(country_id):
-    session = SessionLocal()
+def read_columns(read_only):
+    """What the flight lookups select: Flight instances, or plain column rows when read_only"""
+    return select(*Flight.__table__.c) if read_only else select(Flight)
+
+def get_by_origin_country(country_id, read_only=False):
+    session = get_session()
     try:
-        stmt = select(Flight).where(Flight.origin_country_id == country_id)
+        stmt = read_columns(read_only).where(Flight.origin_country_id == country_id)
         result = session.execute(stmt)
-        return result.scalars().all()
+        return result.all() if read_only else result.scalars().all()
     except Exception as e:
-        print(f"{e}")
+        logger.error(f"{e}")
         raise
     finally:
         session.close()
 
-def get_by_destination_country(country_id):
-    session = SessionLocal()
+def get_by_destination_country(country_id, read_only=False):
+    session = get_session()
     try:
-        stmt = select(Flight).where(Flight.destination_country_id == country_id)
+        stmt = read_columns(read_only).where(Flight.destination_country_id == country_id)
         result = session.execute(stmt)
-        return result.scalars().all()
+        return result.all() if read_only else result.scalars().all()
     except Exception as e:
-        print(f"{e}")
+        logger.error(f"{e}")
         raise
     finally:
         session.close()
 
-def get_by_departure_date(date):
-    session = SessionLocal()
+def day_range(date):
+    """Return the half-open [start, end) datetime range covering the given ISO date"""
+    day_start = datetime.combine(datetime.fromisoformat(date).date(), time.min)
+    return day_start, day_start + timedelta(days=1)
+
+def get_by_departure_date(date, read_only=False):
+    session = get_session()
     try:
-        # Convert the incoming date string to a date object
-        target_date = datetime.fromisoformat(date).date()
+        # Convert the incoming date string to the bounds of that day
+        day_start, day_end = day_range(date)
 
-        # Query flights and filter by date
-        stmt = select(Flight).where(func.date(Flight.departure_time) == target_date)
+        # Query flights and filter by date, as a range on the raw column so its index is used
+        stmt = read_columns(read_only).where(Flight.departure_time >= day_start, Flight.departure_time < day_end)
         result = session.execute(stmt)
-        flights = result.scalars().all()
+        flights = result.all() if read_only else result.scalars().all()
 
         return flights
     except Exception as e:
-        print(f"{e}")
+        logger.error(f"{e}")
         raise
     finally:
         session.close()
 
-def get_by_landing_date(date):
-    session = SessionLocal()
+def get_by_landing_date(date, read_only=False):
+    session = get_session()
     try:
-        # Convert the incoming date string to a date object
-        target_date = datetime.fromisoformat(date).date()
+        # Convert the incoming date string to the bounds of that day
+        day_start, day_end = day_range(date)
 
-        # Query flights and filter by date
-        stmt = select(Flight).where(func.date(Flight.landing_time) == target_date)
+        # Query flights and filter by date, as a range on the raw column so its index is used
+        stmt = read_columns(read_only).where(Flight.landing_time >= day_start, Flight.landing_time < day_end)
         result = session.execute(stmt)
-        flights = result.scalars().all()
+        flights = result.all() if read_only else result.scalars().all()
 
         return flights
     except Exception as e:
-        print(f"{e}")
+        logger.error(f"{e}")
         raise
     finally:
         session.close()
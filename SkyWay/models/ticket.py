@@ -1,84 +1,228 @@
+import logging
 from requests import session
-from sqlalchemy import Column, BigInteger, ForeignKey, UniqueConstraint,select
-from database.database import Base, SessionLocal
+from sqlalchemy import Column, BigInteger, ForeignKey, Index, UniqueConstraint,select
+from sqlalchemy import delete, func, text, update
+from database.bulk import BULK_CHUNK_SIZE
+from database.database import Base, after_commit, get_session
+from database.queries import SetBasedWrites, fetch_by_ids
+from database.serialization import serializer_for
+from database.versions import mark_changed, mark_deleted
+from database.flight_index import flight_search_index
 from models.customer import Customer
 from models.flight import Flight
 
-class Ticket(Base):
+logger = logging.getLogger(__name__)
+
+# Reserve a seat and insert the ticket in one round trip; returns no row when the flight is full
+BOOK_SEAT = text("""
+    WITH seat AS (
+        UPDATE flights SET remaining_tickets = remaining_tickets - 1
+        WHERE id = :flight_id AND remaining_tickets > 0
+        RETURNING id, remaining_tickets
+    )
+    INSERT INTO tickets (flight_id, customer_id)
+    SELECT seat.id, :customer_id FROM seat
+    RETURNING id, (SELECT remaining_tickets FROM seat) AS remaining_tickets
+""")
+
+# Delete a ticket and return its seat to the flight in one round trip
+CANCEL_TICKET = text("""
+    WITH cancelled AS (
+        DELETE FROM tickets WHERE id = :id
+        RETURNING id, flight_id, customer_id
+    ), seat AS (
+        UPDATE flights SET remaining_tickets = remaining_tickets + 1
+        WHERE id IN (SELECT flight_id FROM cancelled)
+        RETURNING remaining_tickets
+    )
+    SELECT id, flight_id, customer_id, (SELECT remaining_tickets FROM seat) AS remaining_tickets
+    FROM cancelled
+""")
+
+def check_ticket_changes(changes):
+    """
+    A ticket keeps its flight: moving it in place would skip the seat counts
+    of both flights, so it is cancelled and the other flight booked instead.
+    """
+    if "flight_id" in changes:
+        raise ValueError("The flight of a ticket cannot be changed, cancel it and book the other flight")
+
+def ticket_update_changes(ticket, changes):
+    """The changes of a full update of ticket, which may repeat its flight but not name another one"""
+    changes = {key: value for key, value in changes.items() if key != "flight_id" or value != ticket.flight_id}
+    check_ticket_changes(changes)
+    return changes
+
+def cancel_tickets(*conditions):
+    """
+    CANCEL_TICKET for every ticket matching the conditions, in one statement:
+    the tickets are deleted and each flight gets back one seat per ticket.
+    Yields (id, flight_id, remaining_tickets) per deleted ticket.
+    """
+    tickets, flights = Ticket.__table__, Flight.__table__
+    cancelled = delete(tickets).where(*conditions).returning(tickets.c.id, tickets.c.flight_id).cte("cancelled")
+    freed = (
+        select(cancelled.c.flight_id, func.count().label("seats"))
+        .group_by(cancelled.c.flight_id)
+        .cte("freed")
+    )
+    seat = (
+        update(flights).where(flights.c.id == freed.c.flight_id)
+        .values(remaining_tickets=flights.c.remaining_tickets + freed.c.seats)
+        .returning(flights.c.id, flights.c.remaining_tickets)
+        .cte("seat")
+    )
+    return (
+        select(cancelled.c.id, cancelled.c.flight_id, seat.c.remaining_tickets)
+        .select_from(cancelled.outerjoin(seat, seat.c.id == cancelled.c.flight_id))
+    )
+
+# BOOK_SEAT and CANCEL_TICKET write rows the session does not track, so their
+# rows are recorded for the version counters (database/versions.py) by hand
+def mark_booked(session, flight_id, ticket_id):
+    mark_changed(session, "tickets", [ticket_id])
+    mark_changed(session, "flights", [flight_id])
+
+def mark_cancelled(session, rows):
+    """Rows of CANCEL_TICKET or cancel_tickets(): the tickets are deleted, their flights changed"""
+    mark_deleted(session, Ticket.__table__, [row.id for row in rows])
+    flight_ids = {row.flight_id for row in rows if row.remaining_tickets is not None}
+    if flight_ids:
+        mark_changed(session, "flights", flight_ids)
+
+class Ticket(SetBasedWrites, Base):
     __tablename__ = "tickets"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    flight_id = Column(BigInteger, ForeignKey("flights.id"))
-    customer_id = Column(BigInteger, ForeignKey("customers.id"))
+    # A cancelled flight takes its tickets with it; a removed customer's tickets
+    # stay, so the flight's remaining_tickets still adds up
+    flight_id = Column(BigInteger, ForeignKey("flights.id", ondelete="CASCADE"))
+    customer_id = Column(BigInteger, ForeignKey("customers.id", ondelete="SET NULL"))
 
-    # Unique constraint on combination of Flight_Id and Customer_Id
-    __table_args__ = (UniqueConstraint("flight_id", "customer_id", name="_flight_customer_uc"),)
+    # Unique constraint on combination of Flight_Id and Customer_Id,
+    # which also serves lookups by flight_id; customer_id needs its own index
+    __table_args__ = (
+        UniqueConstraint("flight_id", "customer_id", name="_flight_customer_uc"),
+        Index("ix_tickets_customer_id", "customer_id"),
+    )
 
     @staticmethod
-    def get_all():
-        session = SessionLocal()
+    def get_all(after=None, limit=None, read_only=False):
+        session = get_session()
         try:
-            stmt = select(Ticket)
+            # read_only: plain column rows, without ORM instances, identity map or change tracking
+            stmt = select(*Ticket.__table__.c) if read_only else select(Ticket)
+            stmt = stmt.order_by(Ticket.id)
+            # Keyset pagination: seek past the last id of the previous page
+            if after is not None:
+                stmt = stmt.where(Ticket.id > after)
+            if limit is not None:
+                stmt = stmt.limit(limit)
             # Execute the query
             result = session.execute(stmt)
             # Fetch all customers
-            return result.scalars().all()
+            return result.all() if read_only else result.scalars().all()
         finally:
             session.close()
 
     @staticmethod
     def get_by_id(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             return session.get(Ticket, id)
         finally:
             session.close()
 
     @staticmethod
-    def add(itemToAdd):
-        session = SessionLocal()
+    def get_by_ids(ids, read_only=False):
+        # One WHERE id = ANY(:ids) query for the whole list; returns (items in the order of ids, missing ids)
+        return fetch_by_ids(Ticket, ids, read_only)
 
+    @staticmethod
+    def add(itemToAdd):
+        """
+        Book a seat: the flight's remaining_tickets is decremented and the ticket
+        inserted in a single statement, so concurrent purchases cannot oversell.
+        """
         flight_id = itemToAdd.get('flight_id')
         customer_id = itemToAdd.get('customer_id')
+        return Ticket.book(flight_id, customer_id)
+
+    @staticmethod
+    def book(flight_id, customer_id):
+        session = get_session()
         try:
-            # Create a new item object
-            ticket = Ticket(flight_id=flight_id,customer_id=customer_id)
-            # Add the item to the session
-            session.add(ticket)
-            # Commit the transaction
+            # The conditional UPDATE takes the row lock, so only buyers that
+            # still see a free seat get a row back and reach the INSERT
+            row = session.execute(BOOK_SEAT, {"flight_id": flight_id, "customer_id": customer_id}).first()
+            if row:
+                mark_booked(session, flight_id, row.id)
             session.commit()
         except Exception as e:
             # If an error occurs, rollback the session
             session.rollback()
-            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
+            raise
         finally:
             # Close the session
             session.close()
 
+        if not row:
+            raise ValueError(f"No seats left on flight {flight_id}")
+        after_commit(lambda: flight_search_index.set_remaining_tickets(flight_id, row.remaining_tickets))
+        return Ticket(id=row.id, flight_id=flight_id, customer_id=customer_id)
+
     @staticmethod
     def add_all(listOfItems):
-        session = SessionLocal()
-        # Convert the list of dictionaries into the proper objects
-        tickets = [Ticket(**item_data) for item_data in listOfItems]
+        """
+        Book every ticket as add() books one, in one transaction: either each
+        gets a seat or none is booked.
+        """
+        session = get_session()
+        booked = []
         try:
-            # Add all items at once
-            session.add_all(tickets)
-            # Commit the transaction
+            # Flights in id order, so two batches cannot deadlock on their rows
+            for item in sorted(listOfItems, key=lambda item: item.get('flight_id')):
+                flight_id = item.get('flight_id')
+                row = session.execute(BOOK_SEAT, {"flight_id": flight_id, "customer_id": item.get('customer_id')}).first()
+                if not row:
+                    raise ValueError(f"No seats left on flight {flight_id}")
+                mark_booked(session, flight_id, row.id)
+                booked.append((flight_id, row.remaining_tickets))
             session.commit()
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            raise e
+            logger.error(f"Error: {e}")
+            raise
         finally:
             session.close()
 
+        # The last booking on a flight left it with the fewest seats
+        seats = dict(booked)
+        def update_index():
+            for flight_id, remaining_tickets in seats.items():
+                flight_search_index.set_remaining_tickets(flight_id, remaining_tickets)
+        after_commit(update_index)
+
+    @classmethod
+    def bulk_add(cls, listOfItems, chunk_size=BULK_CHUNK_SIZE, use_copy=False):
+        """
+        Bulk import of existing tickets. Unlike add(), this does not reserve
+        seats, so remaining_tickets must already account for these tickets.
+        """
+        return super().bulk_add(listOfItems, chunk_size, use_copy)
+
     @staticmethod
     def update(id, updatedItem):
-        session = SessionLocal()
+        current = Ticket.get_by_id(id)
+        if current is None:
+            return None
+        # Raised before the try below, so the caller can tell it from a missing ticket
+        updatedItem = ticket_update_changes(current, updatedItem)
+        session = get_session()
         try:
             # Step 1: Get the item by id
-            ticket = Ticket.get_by_id(id).to_dict()  # Fetch the item by id
-            if not ticket:
-                return None  # Or raise an exception if the item not found
+            ticket = current.to_dict()
             # Step 2: Create a new item object with the updated data
             # Ensure the id remains the same
             new_item = Ticket(**updatedItem)
@@ -90,59 +234,94 @@ class Ticket(Base):
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             return None  # Or handle the exception as needed
 
         finally:
             session.close()
 
+    @classmethod
+    def patch(cls, id, changes):
+        check_ticket_changes(changes)
+        return super().patch(id, changes)
+
     @staticmethod
     def remove(id):
-        session = SessionLocal()
+        session = get_session()
         try:
-            # Step 1: Use select() to fetch the item by id
-            stmt = select(Ticket).filter(Ticket.id == id)
-            ticket = session.execute(stmt).scalars().first()
-            if not ticket:
+            # Delete the ticket and give its seat back to the flight in one statement
+            row = session.execute(CANCEL_TICKET, {"id": id}).first()
+            if not row:
                 return None  # item not found
-            # Step 2: Delete the item
-            session.delete(ticket)
-            # Step 3: Commit the transaction
+            mark_cancelled(session, [row])
+            session.commit()
+            if row.remaining_tickets is not None:
+                after_commit(lambda: flight_search_index.set_remaining_tickets(row.flight_id, row.remaining_tickets))
+            return Ticket(id=row.id, flight_id=row.flight_id, customer_id=row.customer_id)
+        except Exception as e:
+            session.rollback()  # Rollback in case of error
+            logger.error(f"Error deleting ticket: {e}")
+            raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def remove_where(*conditions):
+        """
+        Set-based delete of every ticket matching the conditions, giving their
+        seats back to the flights as remove() does, in one statement without
+        loading the rows. Returns the deleted ids.
+        """
+        if not conditions:
+            raise ValueError("A delete needs at least one condition")
+        session = get_session()
+        try:
+            rows = session.execute(cancel_tickets(*conditions)).all()
+            mark_cancelled(session, rows)
             session.commit()
-            return ticket  # Return the deleted item or a success response
+        except Exception as e:
+            session.rollback()  # Rollback in case of error
+            logger.error(f"Error deleting tickets: {e}")
+            raise
         finally:
             session.close()
 
+        seats = {row.flight_id: row.remaining_tickets for row in rows if row.remaining_tickets is not None}
+        def update_index():
+            for flight_id, remaining_tickets in seats.items():
+                flight_search_index.set_remaining_tickets(flight_id, remaining_tickets)
+        after_commit(update_index)
+        return [row.id for row in rows]
+
     def get_all_flights_by_customer(customer):
         flights = []
-        session = SessionLocal()
+        session = get_session()
 
         try:
             # Find the customer by user_id
-            target_customer_stmt = select(Customer).where(Customer.user_id == customer.get('user_id'))
-            target_customer = session.execute(target_customer_stmt).scalars().first()
+            target_customer_stmt = select(Customer.id).where(Customer.user_id == customer.get('user_id'))
+            target_customer_id = session.execute(target_customer_stmt).scalars().first()
 
-            if not target_customer:
+            if target_customer_id is None:
                 raise ValueError(f"No customer found with user_id: {customer.get('user_id')}")
 
-            target_customer_id = target_customer.id
-
-            # Fetch all flights for the customer's tickets in one query
+            # Fetch all flights for the customer's tickets in one query, as plain
+            # column rows since they are only turned into dicts
             flight_stmt = (
-                select(Flight)
+                select(*Flight.__table__.c)
                 .join(Ticket, Flight.id == Ticket.flight_id)
                 .where(Ticket.customer_id == target_customer_id)
             )
-            flights = session.execute(flight_stmt).scalars().all()
+            flights = session.execute(flight_stmt).all()
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error finding flights of customer: {customer.get('user_id')}")
+            logger.error(f"Error finding flights of customer: {customer.get('user_id')}")
             raise
         finally:
             session.close()
 
-        return [flight.to_dict() for flight in flights]
+        return serializer_for(Flight).from_rows(flights)
 
     def to_dict(self):
         """
@@ -1,10 +1,16 @@
+import logging
 from requests import session
 from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey
 from sqlalchemy.orm import relationship
-from database.database import Base, SessionLocal
+from database.database import Base, after_commit, get_session
+from database.flight_index import flight_search_index
+from database.queries import SetBasedWrites, fetch_by_ids
 from sqlalchemy import select
+from models.airline_company import airline_company_cache
 
-class User(Base):
+logger = logging.getLogger(__name__)
+
+class User(SetBasedWrites, Base):
     __tablename__ = "users"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
@@ -14,31 +20,43 @@ class User(Base):
     user_role = Column(Integer, ForeignKey("user_roles.id"), nullable=False)
 
     # Relationship to AirlineCompany (optional, only if this user is an airline company)
-    airline_company = relationship("AirlineCompany", back_populates="user", uselist=False)
+    airline_company = relationship("AirlineCompany", back_populates="user", uselist=False, passive_deletes=True)
 
     @staticmethod
-    def get_all():
-        session = SessionLocal()
+    def get_all(after=None, limit=None, read_only=False):
+        session = get_session()
         try:
-            stmt = select(User)
+            # read_only: plain column rows, without ORM instances, identity map or change tracking
+            stmt = select(*User.__table__.c) if read_only else select(User)
+            stmt = stmt.order_by(User.id)
+            # Keyset pagination: seek past the last id of the previous page
+            if after is not None:
+                stmt = stmt.where(User.id > after)
+            if limit is not None:
+                stmt = stmt.limit(limit)
             # Execute the query
             result = session.execute(stmt)
             # Fetch all users
-            return result.scalars().all()
+            return result.all() if read_only else result.scalars().all()
         finally:
             session.close()
 
     @staticmethod
     def get_by_id(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             return session.get(User,id)
         finally:
             session.close()
 
+    @staticmethod
+    def get_by_ids(ids, read_only=False):
+        # One WHERE id = ANY(:ids) query for the whole list; returns (items in the order of ids, missing ids)
+        return fetch_by_ids(User, ids, read_only)
+
     @staticmethod
     def add(itemToAdd):
-        session = SessionLocal()
+        session = get_session()
 
         username = itemToAdd.get('username')
         password = itemToAdd.get('password')
@@ -55,14 +73,14 @@ class User(Base):
         except Exception as e:
             # If an error occurs, rollback the session
             session.rollback()
-            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
         finally:
             # Close the session
             session.close()
 
     @staticmethod
     def add_all(listOfItems):
-        session = SessionLocal()
+        session = get_session()
         # Convert the list of dictionaries into the proper objects
         users = [User(**item_data) for item_data in listOfItems]
         try:
@@ -78,7 +96,7 @@ class User(Base):
 
     @staticmethod
     def update(id, updatedItem):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Get the user by ID
             user = User.get_by_id(id).to_dict() # Fetch the user by ID
@@ -95,7 +113,7 @@ class User(Base):
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             return None  # Or handle the exception as needed
 
         finally:
@@ -103,7 +121,7 @@ class User(Base):
 
     @staticmethod
     def remove(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Use select() to fetch the user by ID
             stmt = select(User).filter(User.id == id)
@@ -114,10 +132,21 @@ class User(Base):
             session.delete(item)
             # Step 3: Commit the transaction
             session.commit()
+            # ON DELETE CASCADE removed the user's airline company, if any, and its flights
+            after_commit(airline_company_cache.invalidate)
+            after_commit(flight_search_index.invalidate)
             return item  # Return the deleted user or a success response
         finally:
             session.close()
 
+    @classmethod
+    def remove_where(cls, *conditions):
+        ids = super().remove_where(*conditions)
+        # Airline companies of the users were removed with them, and so were their flights
+        after_commit(airline_company_cache.invalidate)
+        after_commit(flight_search_index.invalidate)
+        return ids
+
     def to_dict(self):
         """
         Convert the model instance into a dictionary.
@@ -1,36 +1,69 @@
+import logging
 from sqlalchemy import Column, Integer, String, select
-from database.database import Base, SessionLocal
+from database.cache import ReferenceCache
+from database.database import Base, SessionLocal, after_commit, get_session
+from database.queries import SetBasedWrites, fetch_by_ids
 
-class UserRole(Base):
+logger = logging.getLogger(__name__)
+
+# User roles almost never change, so reads are served from an in-process cache
+user_role_cache = ReferenceCache("user_role")
+
+class UserRole(SetBasedWrites, Base):
     __tablename__ = "user_roles"
+    # Cleared when a set-based write commits, see SetBasedWrites
+    reference_cache = user_role_cache
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     role_name = Column(String, unique=True)
 
 
     @staticmethod
-    def get_all():
+    def get_all(after=None, limit=None, read_only=False):
+        key = ("rows" if read_only else "all", after, limit)
+        return user_role_cache.get_or_load(key, lambda: UserRole._get_all(after, limit, read_only))
+
+    @staticmethod
+    def _get_all(after=None, limit=None, read_only=False):
+        # Cached objects outlive the request, so they are loaded in a session of their own
         session = SessionLocal()
         try:
-            stmt = select(UserRole)
+            # read_only: plain column rows, without ORM instances, identity map or change tracking
+            stmt = select(*UserRole.__table__.c) if read_only else select(UserRole)
+            stmt = stmt.order_by(UserRole.id)
+            # Keyset pagination: seek past the last id of the previous page
+            if after is not None:
+                stmt = stmt.where(UserRole.id > after)
+            if limit is not None:
+                stmt = stmt.limit(limit)
             # Execute the query
             result = session.execute(stmt)
             # Fetch all countries
-            return result.scalars().all()
+            return result.all() if read_only else result.scalars().all()
         finally:
             session.close()
 
     @staticmethod
     def get_by_id(id):
+        return user_role_cache.get_or_load(("id", id), lambda: UserRole._get_by_id(id))
+
+    @staticmethod
+    def _get_by_id(id):
+        # Cached objects outlive the request, so they are loaded in a session of their own
         session = SessionLocal()
         try:
             return session.get(UserRole, id)
         finally:
             session.close()
 
+    @staticmethod
+    def get_by_ids(ids, read_only=False):
+        # One WHERE id = ANY(:ids) query, not cached; returns (items in the order of ids, missing ids)
+        return fetch_by_ids(UserRole, ids, read_only)
+
     @staticmethod
     def add(itemToAdd):
-        session = SessionLocal()
+        session = get_session()
 
         role_name = itemToAdd.get('role_name')
 
@@ -41,17 +74,18 @@ class UserRole(Base):
             session.add(user_role)
             # Commit the transaction
             session.commit()
+            after_commit(user_role_cache.invalidate)
         except Exception as e:
             # If an error occurs, rollback the session
             session.rollback()
-            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
         finally:
             # Close the session
             session.close()
 
     @staticmethod
     def add_all(listOfItems):
-        session = SessionLocal()
+        session = get_session()
         # Convert the list of dictionaries into the proper objects
         user_roles = [UserRole(**item_data) for item_data in listOfItems]
         try:
@@ -59,6 +93,7 @@ class UserRole(Base):
             session.add_all(user_roles)
             # Commit the transaction
             session.commit()
+            after_commit(user_role_cache.invalidate)
         except Exception as e:
             session.rollback()  # Rollback in case of error
             raise e
@@ -66,7 +101,7 @@ class UserRole(Base):
             session.close()
     @staticmethod
     def update(id, updatedItem):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Get the item by id
             user_role = UserRole.get_by_id(id).to_dict()  # Fetch the item by id
@@ -79,11 +114,12 @@ class UserRole(Base):
             # Step 3: Replace the old item object with the new one
             session.merge(new_item)  # `merge` will update the existing record
             session.commit()
+            after_commit(user_role_cache.invalidate)
             return new_item  # Return the updated item
 
         except Exception as e:
             session.rollback()  # Rollback in case of error
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             return None  # Or handle the exception as needed
 
         finally:
@@ -91,7 +127,7 @@ class UserRole(Base):
 
     @staticmethod
     def remove(id):
-        session = SessionLocal()
+        session = get_session()
         try:
             # Step 1: Use select() to fetch the item by id
             stmt = select(UserRole).filter(UserRole.id == id)
@@ -102,6 +138,7 @@ class UserRole(Base):
             session.delete(user_role)
             # Step 3: Commit the transaction
             session.commit()
+            after_commit(user_role_cache.invalidate)
             return user_role  # Return the deleted item or a success response
         finally:
             session.close()
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from database.database import engine
+
+
+def database_available():
+    try:
+        with engine.connect():
+            return True
+    except OperationalError:
+        return False
+
+
+def pytest_collection_modifyitems(config, items):
+    postgres_items = [item for item in items if "postgres" in item.keywords]
+    if postgres_items and not database_available():
+        skip = pytest.mark.skip(reason="Postgres of DATABASE_URL is not reachable")
+        for item in postgres_items:
+            item.add_marker(skip)
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+
+from database.bulk import copy_value, validate_rows
+from models.flight import Flight
+
+FLIGHTS = Flight.__table__
+
+
+def flight(**changes):
+    row = {
+        "airline_company_id": 1,
+        "origin_country_id": 1,
+        "destination_country_id": 2,
+        "departure_time": "2030-01-15T08:00:00",
+        "landing_time": "2030-01-15T11:00:00",
+        "remaining_tickets": 100,
+    }
+    row.update(changes)
+    return row
+
+
+def test_validate_rows_keeps_valid_rows_with_their_index():
+    rows = [flight(), flight(remaining_tickets=5)]
+    errors = []
+    assert validate_rows(FLIGHTS, rows, errors) == [(0, rows[0]), (1, rows[1])]
+    assert errors == []
+
+
+def test_validate_rows_reports_bad_rows():
+    rows = [
+        flight(),
+        ["not", "an", "object"],
+        flight(seats=1, gate="A1"),
+        flight(departure_time=None, landing_time=None),
+        flight(id=7),
+    ]
+    errors = []
+    valid = validate_rows(FLIGHTS, rows, errors)
+    assert [index for index, _ in valid] == [0, 4]
+    assert errors == [
+        {"index": 1, "error": "Row must be a JSON object"},
+        {"index": 2, "error": "Unknown columns: gate, seats"},
+        {"index": 3, "error": "Missing required columns: departure_time, landing_time"},
+    ]
+
+
+@pytest.mark.parametrize("value, encoded", [
+    (None, "\\N"),
+    ("plain", "plain"),
+    ("a\tb\nc\rd", "a\\tb\\nc\\rd"),
+    ("C:\\path\\N", "C:\\\\path\\\\N"),
+    (42, "42"),
+    (datetime(2030, 1, 15, 8, 30), "2030-01-15T08:30:00"),
+])
+def test_copy_value(value, encoded):
+    assert copy_value(value) == encoded
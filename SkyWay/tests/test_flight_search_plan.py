@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import text
+
+from benchmarks.explain_flight_search import seed
+from database.database import engine
+from main import create_db
+
+pytestmark = pytest.mark.postgres
+
+# The GET /flight/search query, as get_flights_by_parameters runs it
+SEARCH = """
+    SELECT * FROM flights
+    WHERE origin_country_id = :origin AND destination_country_id = :destination
+    AND departure_time >= CAST(:day AS timestamp)
+    AND departure_time < CAST(:day AS timestamp) + INTERVAL '1 day'
+"""
+
+
+@pytest.fixture
+def seeded():
+    """A connection to a database with synthetic flights, rolled back afterwards"""
+    create_db()
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            seed(connection, flights=50000, countries=20)
+            yield connection
+        finally:
+            transaction.rollback()
+
+
+def test_flight_search_uses_the_route_index(seeded):
+    origin, destination = seeded.execute(text(
+        "SELECT id FROM countries WHERE name LIKE 'bench-country-%' ORDER BY id LIMIT 2"
+    )).scalars().all()
+    plan = "\n".join(seeded.execute(
+        text("EXPLAIN (COSTS OFF) " + SEARCH),
+        {"origin": origin, "destination": destination, "day": "2025-01-01"},
+    ).scalars().all())
+    assert "ix_flights_route_departure" in plan
+    assert "Seq Scan" not in plan
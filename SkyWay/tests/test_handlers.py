@@ -0,0 +1,34 @@
+import pytest
+
+from database.handlers import MAX_BATCH_SIZE, parse_ids
+
+
+@pytest.mark.parametrize("raw, ids", [
+    ("3,1,2", [3, 1, 2]),
+    ("3, 1 ,2,", [3, 1, 2]),
+    ({"ids": [3, 1, 2]}, [3, 1, 2]),
+    ([3, "1", 2], [3, 1, 2]),
+    ("3,1,3,2,1", [3, 1, 2]),
+])
+def test_parse_ids(raw, ids):
+    assert parse_ids(raw) == ids
+
+
+@pytest.mark.parametrize("raw", [None, "", ",", [], {}, {"ids": []}, {"ids": "1,2"}, 7])
+def test_parse_ids_rejects_a_missing_list(raw):
+    with pytest.raises(ValueError, match="Send the ids"):
+        parse_ids(raw)
+
+
+@pytest.mark.parametrize("raw", ["1,x", [1, 2.5], [True], [None], [{"id": 1}], "1,-2"])
+def test_parse_ids_rejects_non_ids(raw):
+    with pytest.raises(ValueError, match="Not an id"):
+        parse_ids(raw)
+
+
+def test_parse_ids_limits_the_batch():
+    assert len(parse_ids(list(range(MAX_BATCH_SIZE)))) == MAX_BATCH_SIZE
+    # Repeats are dropped before the limit is checked
+    assert len(parse_ids(list(range(MAX_BATCH_SIZE)) * 2)) == MAX_BATCH_SIZE
+    with pytest.raises(ValueError, match="At most"):
+        parse_ids(list(range(MAX_BATCH_SIZE + 1)))
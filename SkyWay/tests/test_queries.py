@@ -0,0 +1,100 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from werkzeug.datastructures import MultiDict
+
+from database.queries import TableQuery
+from models.flight import Flight
+
+
+def flight_query(**args):
+    return TableQuery(Flight, MultiDict(args))
+
+
+def sql(clause):
+    return str(clause.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_unsorted_cursor_is_the_last_id():
+    query = flight_query()
+    assert query.cursor((41,)) == 41
+    assert query.parse_after("41") == 41
+    assert query.parse_after(None) is None
+
+
+@pytest.mark.parametrize("raw", ["abc", "-1", "4.5", ""])
+def test_unsorted_parse_after_rejects_non_ids(raw):
+    with pytest.raises(ValueError, match="last id"):
+        flight_query().parse_after(raw)
+
+
+@pytest.mark.parametrize("sort, key", [
+    ("departure_time", (datetime(2030, 1, 15, 8, 30), 41)),
+    ("-departure_time", (datetime(2030, 1, 15, 8, 30), 41)),
+    ("-remaining_tickets,departure_time", (0, datetime(2030, 1, 15, 8, 30), 41)),
+    ("remaining_tickets", (None, 41)),
+])
+def test_sorted_cursor_round_trip(sort, key):
+    query = flight_query(sort=sort)
+    cursor = query.cursor(key)
+    assert isinstance(cursor, str)
+    assert "=" not in cursor
+    assert query.parse_after(cursor) == key
+
+
+def test_sorted_cursor_is_only_valid_for_its_sort_order():
+    cursor = flight_query(sort="departure_time").cursor((datetime(2030, 1, 15), 41))
+    with pytest.raises(ValueError, match="not a cursor"):
+        flight_query(sort="-departure_time").parse_after(cursor)
+    with pytest.raises(ValueError, match="not a cursor"):
+        flight_query(sort="departure_time,remaining_tickets").parse_after(cursor)
+
+
+@pytest.mark.parametrize("raw", ["41", "not-base64!", "bm90IGpzb24"])
+def test_sorted_parse_after_rejects_garbage(raw):
+    with pytest.raises(ValueError, match="not a cursor"):
+        flight_query(sort="departure_time").parse_after(raw)
+
+
+def test_sorted_parse_after_rejects_bad_values():
+    cursor = flight_query(sort="departure_time").cursor(("tomorrow", 41))
+    with pytest.raises(ValueError, match="Invalid value for departure_time"):
+        flight_query(sort="departure_time").parse_after(cursor)
+
+
+def test_seek_unsorted():
+    assert sql(flight_query().seek(41)) == "flights.id > 41"
+
+
+def test_seek_ascending():
+    assert sql(flight_query(sort="remaining_tickets").seek((5, 41))) == (
+        "flights.remaining_tickets > 5 OR flights.remaining_tickets IS NULL"
+        " OR flights.remaining_tickets = 5 AND flights.id > 41"
+    )
+
+
+def test_seek_descending():
+    assert sql(flight_query(sort="-remaining_tickets").seek((5, 41))) == (
+        "flights.remaining_tickets < 5 OR flights.remaining_tickets = 5 AND flights.id > 41"
+    )
+
+
+def test_seek_after_null():
+    # NULL sorts last ascending, so only NULL rows with a greater id follow it
+    assert sql(flight_query(sort="remaining_tickets").seek((None, 41))) == (
+        "false OR flights.remaining_tickets IS NULL AND flights.id > 41"
+    )
+    # and first descending, so every non-NULL row follows it
+    assert sql(flight_query(sort="-remaining_tickets").seek((None, 41))) == (
+        "flights.remaining_tickets IS NOT NULL OR flights.remaining_tickets IS NULL AND flights.id > 41"
+    )
+
+
+def test_seek_two_columns():
+    query = flight_query(sort="-remaining_tickets,airline_company_id")
+    assert sql(query.seek((5, 3, 41))) == (
+        "flights.remaining_tickets < 5"
+        " OR flights.remaining_tickets = 5 AND (flights.airline_company_id > 3 OR flights.airline_company_id IS NULL)"
+        " OR flights.remaining_tickets = 5 AND flights.airline_company_id = 3 AND flights.id > 41"
+    )
@@ -0,0 +1,19 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py
+
+With preload_app the master imports it once, before forking the workers.
+docker-compose also serves it with flask run (FLASK_APP=wsgi), so every
+serving process checks the schema before its first request.
+"""
+from database.flight_index import flight_search_index
+from database.schema import check_schema
+from main import app
+
+# Serving processes never run DDL, migrate.py does
+check_schema()
+if flight_search_index.enabled:
+    # Loaded once in the master, the workers share it copy-on-write and each
+    # brings its copy up to date from the flights version counter
+    flight_search_index.load()